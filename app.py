@@ -496,6 +496,12 @@ def create_api_keys_section():
             index=0,
             key="motion_provider"
         )
+        st.checkbox(
+            "♻️ Dùng lại video chuyển động đã tạo cho cùng ảnh",
+            value=False,
+            key="reuse_motion_cache",
+            help="Bỏ chọn để luôn tạo video mới (tạo lại)"
+        )
         
         if motion_provider == "google_flow":
             google_flow_key = st.text_input("Google Flow API Key", type="password", 
@@ -728,7 +734,8 @@ def test_motion_apis():
         
         # Test Free motion
         try:
-            generator = MotionGenerator(provider="free")
+            generator = MotionGenerator(provider="free",
+                                        use_cache=st.session_state.get("reuse_motion_cache", False))
             test_path = "temp/test_motion.mp4"
             os.makedirs("temp", exist_ok=True)
             result = generator.generate_motion("outputs/images/scene_01.png", test_path)
@@ -743,7 +750,8 @@ def test_motion_apis():
         # Test Google Flow
         if api_manager.get_api_key("google_flow"):
             try:
-                generator = MotionGenerator(provider="google_flow")
+                generator = MotionGenerator(provider="google_flow",
+                                            use_cache=st.session_state.get("reuse_motion_cache", False))
                 st.success("✅ Google Flow: API key available")
             except Exception as e:
                 st.error(f"❌ Google Flow: {str(e)[:100]}")
@@ -1157,6 +1165,12 @@ def create_script_tab(script_provider, num_scenes, video_style, include_dialogue
             st.error(f"Vui lòng nhập {script_provider.title()} API Key trong sidebar")
             return
         
+        reuse_script_cache = st.checkbox(
+            "♻️ Dùng lại kịch bản đã tạo cho prompt giống",
+            value=False,
+            help="Bỏ chọn để luôn tạo kịch bản mới (tạo lại)"
+        )
+        
         if st.button("🎬 Tạo Kịch bản", type="primary", width='stretch'):
             if not prompt.strip():
                 st.error("Vui lòng nhập ý tưởng video")
@@ -1164,7 +1178,7 @@ def create_script_tab(script_provider, num_scenes, video_style, include_dialogue
             
             try:
                 # Tạo script generator
-                generator = ScriptGenerator(provider=script_provider)
+                generator = ScriptGenerator(provider=script_provider, use_cache=reuse_script_cache)
                 
                 # Mapping độ dài
                 length_mapping = {
@@ -1596,6 +1610,12 @@ def create_images_tab(image_provider, image_size):
         st.info("💡 **Pollinations AI:** Miễn phí, không cần API key, chất lượng tốt")
         st.warning("⚠️ **Lưu ý:** Từ tháng 10/2025, Pollinations.ai tự động thêm watermark vào ảnh. App sẽ tự động crop để loại bỏ logo.")
     
+    reuse_image_cache = st.checkbox(
+        "♻️ Dùng lại ảnh đã tạo cho cùng prompt",
+        value=False,
+        help="Bỏ chọn để luôn tạo ảnh mới (tạo lại)"
+    )
+    
     col1, col2 = st.columns(2)
     
     with col1:
@@ -1609,7 +1629,7 @@ def create_images_tab(image_provider, image_size):
                             st.write(f"🗑️ Deleted: {file}")
                 
                 # Tạo image generator
-                generator = ImageGenerator(provider=image_provider)
+                generator = ImageGenerator(provider=image_provider, use_cache=reuse_image_cache)
                 
                 # Tạo thư mục output
                 os.makedirs("outputs/images", exist_ok=True)
@@ -60,6 +60,9 @@ class APIManager:
                 "model": "gpt-4o-mini",
                 "temperature": 0.8,
                 "max_tokens": 2000,
+                "batch_size": 10,
+                "rpm": 500,
+                "tpm": 200000,
                 "image_model": "dall-e-3",
                 "image_size": "1024x1024",
                 "image_quality": "standard",
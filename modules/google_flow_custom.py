@@ -6,6 +6,7 @@ Tích hợp Google Flow dựa trên guide.txt để tạo video từ ảnh
 import requests
 import json
 import base64
+import mmap
 import time
 import logging
 from typing import Dict, List, Optional, Tuple
@@ -43,10 +44,10 @@ class GoogleFlowCustom:
             mediaGenerationId nếu thành công, None nếu thất bại
         """
         try:
-            # Đọc và encode ảnh thành base64
+            # Đọc và encode ảnh thành base64 (mmap: encode thẳng từ page cache, không copy cả file)
             with open(image_path, "rb") as f:
-                image_data = f.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    base64_image = base64.b64encode(mm).decode('ascii')
             
             # Xác định MIME type
             file_ext = Path(image_path).suffix.lower()
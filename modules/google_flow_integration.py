@@ -5,15 +5,138 @@ Tích hợp với Google Flow API để tạo video từ ảnh
 """
 
 import requests
-import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import io
 import json
+import hashlib
+import functools
 import time
+import asyncio
 import logging
-from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Dict, List, Optional, Tuple
 import os
 
+try:
+    import pybase64 as base64  # SIMD base64, cùng API với base64 chuẩn
+except ImportError:
+    import base64
+
+try:
+    import brotli  # noqa: F401 - urllib3 chỉ giải nén "br" khi có brotli
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    _ACCEPT_ENCODING = "gzip, deflate"
+
+try:
+    import httpx
+    import h2  # noqa: F401 - httpx cần h2 để bật HTTP/2
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    httpx = None
+    _HTTP2_AVAILABLE = False
+
+# Lỗi network của cả requests và httpx (khi có HTTP/2 client)
+_REQUEST_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
 logger = logging.getLogger(__name__)
 
+# Process pool cho phần CPU-bound (base64 + đọc metadata ảnh), tạo khi cần
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Lazily create the shared process pool"""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+    return _EXECUTOR
+
+
+def _dig(data, *keys, default=None):
+    """
+    Lấy giá trị lồng nhau trong response JSON mà không tạo dict tạm cho mỗi cấp
+    
+    Args:
+        data: Dict/list gốc
+        *keys: Chuỗi key (str cho dict, int cho list)
+        default: Giá trị trả về khi thiếu key
+        
+    Returns:
+        Giá trị tìm được hoặc default
+    """
+    try:
+        for key in keys:
+            data = data[key]
+    except (KeyError, IndexError, TypeError):
+        return default
+    return default if data is None else data
+
+
+def _prepare_image(image_path: str) -> Tuple[bytes, str, int, int, str, str, str]:
+    """
+    Đọc ảnh, encode Base64 và lấy metadata (đặt ở module scope để pickle được)
+    
+    Args:
+        image_path: Path to image file
+        
+    Returns:
+        Tuple: (digest, base64_image, width, height, format_name, mime_type, aspect_ratio)
+    """
+    # Đọc file một lần, dùng chung buffer cho digest, Base64 và PIL
+    with open(image_path, 'rb') as f:
+        image_data = f.read()
+    digest, width, height, format_name, mime_type, aspect_ratio = _image_meta(image_data)
+    base64_image = base64.b64encode(image_data).decode('ascii')
+    return digest, base64_image, width, height, format_name, mime_type, aspect_ratio
+
+
+def _image_meta(image_data: bytes) -> Tuple[bytes, int, int, str, str, str]:
+    """
+    Digest nội dung và metadata của ảnh
+    
+    Returns:
+        Tuple: (digest, width, height, format_name, mime_type, aspect_ratio)
+    """
+    digest = hashlib.blake2b(image_data, digest_size=16).digest()
+    
+    # Lấy thông tin ảnh (PIL chỉ đọc header từ buffer)
+    from PIL import Image
+    with Image.open(io.BytesIO(image_data)) as img:
+        width, height = img.size
+        format_name = (img.format or '').lower()
+    
+    # Xác định mime type
+    mime_type = f"image/{format_name}" if format_name else "image/jpeg"
+    
+    # Xác định aspect ratio
+    aspect_ratio = "IMAGE_ASPECT_RATIO_LANDSCAPE" if width > height else "IMAGE_ASPECT_RATIO_PORTRAIT"
+    
+    return digest, width, height, format_name, mime_type, aspect_ratio
+
+
+@functools.lru_cache(maxsize=64)
+def _image_meta_cached(image_path: str, mtime_ns: int, size: int) -> Tuple[bytes, int, int, str, str, str]:
+    """_image_meta có cache theo (path, mtime, size) - chỉ giữ digest/metadata, không giữ Base64"""
+    with open(image_path, 'rb') as f:
+        return _image_meta(f.read())
+
+
+@functools.lru_cache(maxsize=4)
+def _image_base64_cached(image_path: str, mtime_ns: int, size: int) -> str:
+    """Base64 của ảnh theo (path, mtime, size); chỉ giữ vài ảnh gần nhất để retry không encode lại"""
+    with open(image_path, 'rb') as f:
+        return base64.b64encode(f.read()).decode('ascii')
+
+
+def _image_cache_key(image_path: str) -> Tuple[str, int, int]:
+    """Cache key cho _image_meta_cached/_image_base64_cached: đổi khi file bị ghi đè"""
+    stat = os.stat(image_path)
+    return os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size
+
+
 class GoogleFlowIntegration:
     """Google Flow API Integration"""
     
@@ -29,9 +152,57 @@ class GoogleFlowIntegration:
         self.headers = {
             "Authorization": f"Bearer {bearer_token}",
             "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            # Nén response JSON (poll status, generateVideo) - requests tự giải nén
+            "Accept-Encoding": _ACCEPT_ENCODING
         }
         
+        # Session dùng chung: giữ kết nối và tự retry khi server báo rate limit (429/5xx),
+        # tôn trọng header Retry-After thay vì sleep cố định giữa các request
+        retry = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            respect_retry_after_header=True,
+            allowed_methods=frozenset(["GET", "POST"]),
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=16))
+        
+        # generateVideo tính phí mỗi lần gọi: chỉ retry khi chắc chắn server chưa xử lý
+        # (lỗi kết nối, 429/503), không replay POST khi gặp 5xx khác hay timeout đọc
+        generate_retry = Retry(
+            total=3,
+            read=0,
+            other=0,
+            backoff_factor=0.5,
+            status_forcelist=[429, 503],
+            respect_retry_after_header=True,
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False
+        )
+        self.generate_session = requests.Session()
+        self.generate_session.mount("https://", HTTPAdapter(max_retries=generate_retry, pool_maxsize=4))
+        
+        # (digest nội dung ảnh, session_id) -> kết quả upload (tránh upload lại cùng một ảnh).
+        # mediaGenerationId gắn với session nên không dùng lại sang session khác
+        self._upload_id_cache: Dict[Tuple[bytes, Optional[str]], Dict] = {}
+        
+        # HTTP/2 client cho poll status: các request multiplex trên một kết nối TLS.
+        # Upload/generate vẫn đi qua các requests session ở trên để giữ retry theo Retry-After.
+        self.client = None
+        if _HTTP2_AVAILABLE:
+            self.client = httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(120.0, connect=10.0),
+                headers=self.headers,
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=16)
+            )
+        # AsyncClient cho check_many tạo lazy, gắn với event loop đã tạo ra nó
+        self._aclient = None
+        self._aclient_loop = None
+        
     def validate_token(self) -> bool:
         """
         Validate Bearer token
@@ -40,24 +211,30 @@ class GoogleFlowIntegration:
             bool: True if token is valid
         """
         try:
-            # Test với endpoint credits để kiểm tra token
-            response = requests.get(
-                f"{self.base_url}/v1/credits",
+            # Test với endpoint credits để kiểm tra token - chỉ cần status code, không cần body
+            credits_url = f"{self.base_url}/v1/credits"
+            response = self.session.head(
+                credits_url,
                 headers=self.headers,
-                timeout=10
+                timeout=10,
+                allow_redirects=True
             )
             
+            if response.status_code == 405:
+                # Server không hỗ trợ HEAD: GET nhưng chỉ đọc header
+                response = self.session.get(
+                    credits_url,
+                    headers=self.headers,
+                    timeout=10,
+                    stream=True
+                )
+                response.close()
+            
             logger.info(f"Token validation response: {response.status_code}")
             
             if response.status_code == 200:
-                try:
-                    result = response.json()
-                    logger.info(f"Credits response: {result}")
-                    logger.info("Google Flow token is valid")
-                    return True
-                except:
-                    logger.info("Google Flow token is valid (200 response)")
-                    return True
+                logger.info("Google Flow token is valid")
+                return True
             elif response.status_code == 401:
                 logger.warning("Google Flow token is invalid or expired")
                 return False
@@ -68,11 +245,13 @@ class GoogleFlowIntegration:
                 logger.warning(f"Unexpected response: {response.status_code}")
                 # Thử endpoint khác
                 try:
-                    response2 = requests.get(
+                    response2 = self.session.get(
                         f"{self.base_url}/v1/uploadUserImage",
                         headers=self.headers,
-                        timeout=10
+                        timeout=10,
+                        stream=True
                     )
+                    response2.close()
                     if response2.status_code in [200, 400, 405]:  # 405 = Method Not Allowed cũng OK
                         logger.info("Google Flow token is valid (alternative endpoint)")
                         return True
@@ -96,22 +275,78 @@ class GoogleFlowIntegration:
             Dict: Response from Google Flow API
         """
         try:
-            # Đọc và encode ảnh thành Base64
-            with open(image_path, 'rb') as f:
-                image_data = f.read()
-                base64_image = base64.b64encode(image_data).decode('utf-8')
+            cache_key = _image_cache_key(image_path)
+            digest, width, height, format_name, mime_type, aspect_ratio = _image_meta_cached(*cache_key)
+            # Ảnh đã upload trong session này: không cần encode Base64
+            cached = self._cached_upload(image_path, digest, session_id)
+            if cached:
+                return cached
+            prepared = (digest, _image_base64_cached(*cache_key), width, height,
+                        format_name, mime_type, aspect_ratio)
+        except Exception as e:
+            logger.error(f"Unexpected error uploading image to Google Flow: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": "unexpected_error"
+            }
+        
+        return self._send_image_upload(image_path, prepared, session_id)
+    
+    async def upload_image_to_flow_async(self, image_path: str, session_id: str = None) -> Dict:
+        """
+        Upload image to Google Flow without blocking the event loop
+        
+        Base64 + metadata run in the process pool, the HTTP request in a worker thread.
+        
+        Args:
+            image_path: Path to image file
+            session_id: Session ID (optional)
             
-            # Lấy thông tin ảnh
-            from PIL import Image
-            with Image.open(image_path) as img:
-                width, height = img.size
-                format_name = img.format.lower()
+        Returns:
+            Dict: Response from Google Flow API
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            prepared = await loop.run_in_executor(_get_executor(), _prepare_image, image_path)
+        except Exception as e:
+            logger.error(f"Unexpected error uploading image to Google Flow: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "error_type": "unexpected_error"
+            }
+        
+        return await asyncio.to_thread(self._send_image_upload, image_path, prepared, session_id)
+    
+    def _cached_upload(self, image_path: str, digest: bytes, session_id: Optional[str]) -> Optional[Dict]:
+        """Kết quả upload trước đó của cùng ảnh trong cùng session, None nếu chưa có"""
+        cached = self._upload_id_cache.get((digest, session_id))
+        if not cached:
+            return None
+        logger.info(f"♻️ Reusing uploaded image for {image_path}: {cached['media_generation_id']}")
+        return dict(cached, cached=True)
+    
+    def _send_image_upload(self, image_path: str, prepared: Tuple, session_id: str = None) -> Dict:
+        """
+        Gửi ảnh đã encode lên Google Flow
+        
+        Args:
+            image_path: Path to image file (for logging)
+            prepared: Kết quả của _prepare_image
+            session_id: Session ID (optional)
             
-            # Xác định mime type
-            mime_type = f"image/{format_name}" if format_name else "image/jpeg"
+        Returns:
+            Dict: Response from Google Flow API
+        """
+        try:
+            digest, base64_image, width, height, format_name, mime_type, aspect_ratio = prepared
             
-            # Xác định aspect ratio
-            aspect_ratio = "IMAGE_ASPECT_RATIO_LANDSCAPE" if width > height else "IMAGE_ASPECT_RATIO_PORTRAIT"
+            # Ảnh cùng nội dung đã upload trong session này: dùng lại mediaGenerationId, không gọi API
+            upload_key = (digest, session_id)
+            cached = self._cached_upload(image_path, digest, session_id)
+            if cached:
+                return cached
             
             # Tạo session ID nếu chưa có
             if not session_id:
@@ -135,7 +370,7 @@ class GoogleFlowIntegration:
             logger.info(f"Image size: {width}x{height}, Format: {format_name}")
             
             # Gửi request
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/v1:uploadUserImage",
                 headers=self.headers,
                 json=payload,
@@ -145,16 +380,22 @@ class GoogleFlowIntegration:
             response.raise_for_status()
             result = response.json()
             
+            media_generation_id = _dig(result, 'mediaGenerationId', 'mediaGenerationId')
+            
             logger.info(f"✅ Image uploaded successfully to Google Flow")
-            logger.info(f"Media Generation ID: {result.get('mediaGenerationId', {}).get('mediaGenerationId', 'N/A')}")
+            logger.info(f"Media Generation ID: {media_generation_id or 'N/A'}")
             
-            return {
+            upload_result = {
                 "success": True,
-                "media_generation_id": result.get('mediaGenerationId', {}).get('mediaGenerationId'),
+                "media_generation_id": media_generation_id,
                 "width": result.get('width'),
                 "height": result.get('height'),
                 "response": result
             }
+            if media_generation_id:
+                self._upload_id_cache[upload_key] = upload_result
+            
+            return dict(upload_result)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Error uploading image to Google Flow: {e}")
@@ -193,10 +434,6 @@ class GoogleFlowIntegration:
                 result["index"] = i + 1
                 results.append(result)
                 
-                # Nghỉ giữa các upload để tránh rate limit
-                if i < len(image_paths) - 1:
-                    time.sleep(2)
-                    
             except Exception as e:
                 logger.error(f"Error uploading image {i+1}: {e}")
                 results.append({
@@ -208,6 +445,31 @@ class GoogleFlowIntegration:
         
         return results
     
+    async def batch_upload_images_async(self, image_paths: List[str], session_id: str = None,
+                                        max_concurrency: int = 16) -> List[Dict]:
+        """
+        Upload multiple images to Google Flow concurrently
+        
+        Args:
+            image_paths: List of image file paths
+            session_id: Session ID (optional)
+            max_concurrency: Số upload chạy song song tối đa
+            
+        Returns:
+            List[Dict]: Results for each image upload (same order as image_paths)
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def upload_one(i: int, image_path: str) -> Dict:
+            async with semaphore:
+                logger.info(f"Uploading image {i+1}/{len(image_paths)}: {image_path}")
+                result = await self.upload_image_to_flow_async(image_path, session_id)
+            result["image_path"] = image_path
+            result["index"] = i + 1
+            return result
+        
+        return list(await asyncio.gather(*(upload_one(i, p) for i, p in enumerate(image_paths))))
+    
     def create_video_from_script_and_images(self, script_data: Dict, 
                                           image_paths: List[str],
                                           session_id: str = None) -> Dict:
@@ -267,27 +529,40 @@ class GoogleFlowIntegration:
             if not scenes:
                 return "Create a cinematic video with smooth transitions"
             
-            # Tạo prompt từ các scene
-            prompt_parts = []
-            
             # Thêm thông tin tổng quan
             title = script_data.get('title', 'Video')
-            prompt_parts.append(f"Title: {title}")
             
-            # Thêm từng scene
-            for i, scene in enumerate(scenes[:5]):  # Chỉ lấy 5 scene đầu để tránh prompt quá dài
-                scene_prompt = scene.get('image_prompt', scene.get('description', ''))
-                if scene_prompt:
-                    prompt_parts.append(f"Scene {i+1}: {scene_prompt}")
+            def scene_lines():
+                # Chỉ lấy 5 scene đầu để tránh prompt quá dài
+                for i, scene in enumerate(islice(scenes, 5)):
+                    scene_prompt = scene.get('image_prompt', scene.get('description', ''))
+                    if scene_prompt:
+                        yield f"Scene {i+1}: {scene_prompt}"
             
             # Thêm hướng dẫn chuyển động
-            prompt_parts.append("Create smooth cinematic transitions between scenes with appropriate camera movements and lighting effects")
+            parts = chain(
+                [f"Title: {title}"],
+                scene_lines(),
+                ["Create smooth cinematic transitions between scenes with appropriate camera movements and lighting effects"]
+            )
             
-            final_prompt = "\n".join(prompt_parts)
+            # Ghép prompt và dừng ngay khi vượt giới hạn độ dài thay vì ghép hết rồi cắt
+            max_length = 1000
+            prompt_parts = []
+            total = 0
+            for part in parts:
+                separator = 1 if prompt_parts else 0
+                if total + separator + len(part) > max_length:
+                    remaining = max_length - total - separator
+                    if remaining < 0:
+                        prompt_parts[-1] += "..."
+                    else:
+                        prompt_parts.append(part[:remaining] + "...")
+                    break
+                prompt_parts.append(part)
+                total += separator + len(part)
             
-            # Giới hạn độ dài prompt
-            if len(final_prompt) > 1000:
-                final_prompt = final_prompt[:1000] + "..."
+            final_prompt = "\n".join(prompt_parts)
             
             logger.info(f"Created video prompt from script: {len(final_prompt)} characters")
             return final_prompt
@@ -311,8 +586,12 @@ class GoogleFlowIntegration:
             Dict: Video creation result
         """
         try:
+            # Lấy timestamp một lần cho session, operation name, scene ID và seed
+            now_ms = time.time_ns() // 1_000_000
+            now = now_ms // 1000
+            
             if not session_id:
-                session_id = f";{int(time.time() * 1000)}"
+                session_id = f";{now_ms}"
             
             # Sử dụng media_generation_id đầu tiên làm start image
             start_image_id = media_generation_ids[0] if media_generation_ids else None
@@ -329,11 +608,11 @@ class GoogleFlowIntegration:
                 "operations": [
                     {
                         "operation": {
-                            "name": f"{int(time.time())}",  # Unique operation name
+                            "name": f"{now}",  # Unique operation name
                             "metadata": {
                                 "@type": "type.googleapis.com/google.internal.labs.aisandbox.v1.Media",
                                 "video": {
-                                    "seed": int(time.time()) % 100000,  # Random seed
+                                    "seed": now % 100000,  # Random seed
                                     "prompt": video_prompt or "Create a smooth cinematic video with transitions between these images",
                                     "mediaVisibility": "PRIVATE",
                                     "model": "veo_3_1_i2v_s_fast",
@@ -371,7 +650,7 @@ class GoogleFlowIntegration:
                                 }
                             }
                         },
-                        "sceneId": f"scene-{int(time.time())}",  # Unique scene ID
+                        "sceneId": f"scene-{now}",  # Unique scene ID
                     }
                 ]
             }
@@ -379,7 +658,7 @@ class GoogleFlowIntegration:
             logger.info(f"Creating video from image: {start_image_id}")
             logger.info(f"Prompt: {video_prompt[:100]}...")
             
-            response = requests.post(
+            response = self.generate_session.post(
                 f"{self.base_url}/v1:generateVideo",
                 headers=self.headers,
                 json=payload,
@@ -440,58 +719,129 @@ class GoogleFlowIntegration:
         """
         try:
             # Sử dụng endpoint check status với media generation ID
-            response = requests.get(
-                f"{self.base_url}/v1/operations/{media_generation_id}",
-                headers=self.headers,
-                timeout=30
-            )
+            status_url = f"{self.base_url}/v1/operations/{media_generation_id}"
+            if self.client is not None:
+                response = self.client.get(status_url, timeout=30)
+            else:
+                response = self.session.get(status_url, headers=self.headers, timeout=30)
             
             response.raise_for_status()
             result = response.json()
             
+            logger.debug(f"Status check Content-Encoding: {response.headers.get('Content-Encoding', 'identity')}")
             logger.info(f"Status check response: {result}")
             
-            # Parse response theo format Google Flow
-            operations = result.get('operations', [])
-            if operations:
-                operation = operations[0]
-                status = operation.get('status')
-                
-                # Extract video URL nếu có
-                video_url = None
-                fife_url = None
-                
-                if status == "MEDIA_GENERATION_STATUS_SUCCESSFUL":
-                    # Tìm video URL trong metadata
-                    operation_data = operation.get('operation', {})
-                    metadata = operation_data.get('metadata', {})
-                    video_data = metadata.get('video', {})
-                    
-                    fife_url = video_data.get('fifeUrl')
-                    video_url = fife_url  # Sử dụng fifeUrl làm video URL
-                
-                return {
-                    "success": True,
-                    "status": status,
-                    "video_url": video_url,
-                    "fife_url": fife_url,
-                    "remaining_credits": result.get('remainingCredits'),
-                    "response": result
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "No operations in status response",
-                    "response": result
-                }
+            return self._parse_status_result(result)
             
-        except requests.exceptions.RequestException as e:
+        except _REQUEST_ERRORS as e:
             logger.error(f"Error checking video status: {e}")
             return {
                 "success": False,
                 "error": str(e)
             }
     
+    async def check_many(self, media_generation_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Check status of several videos concurrently
+        
+        Gọi một lần mỗi nhịp poll thay vì gọi check_video_status lần lượt cho từng video.
+        
+        Args:
+            media_generation_ids: List of media generation IDs
+            
+        Returns:
+            Dict[str, Dict]: Status information keyed by media generation ID
+        """
+        if not _HTTP2_AVAILABLE:
+            async def check_one(media_generation_id: str):
+                return media_generation_id, await asyncio.to_thread(self.check_video_status, media_generation_id)
+            
+            return await self._collect_status(check_one, media_generation_ids)
+        
+        client = self._get_async_client()
+        
+        async def check_one(media_generation_id: str):
+            try:
+                response = await client.get(f"{self.base_url}/v1/operations/{media_generation_id}")
+                response.raise_for_status()
+                return media_generation_id, self._parse_status_result(response.json())
+            except _REQUEST_ERRORS + (ValueError,) as e:
+                # ValueError: body không phải JSON (trang lỗi/proxy) - chỉ hỏng job này
+                logger.error(f"Error checking video status: {e}")
+                return media_generation_id, {"success": False, "error": str(e)}
+        
+        return await self._collect_status(check_one, media_generation_ids)
+    
+    def _get_async_client(self):
+        """httpx.AsyncClient HTTP/2 dùng chung giữa các lần check_many trong cùng event loop"""
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            self._aclient = httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                headers=self.headers,
+                limits=httpx.Limits(max_keepalive_connections=8, max_connections=16)
+            )
+            self._aclient_loop = loop
+        return self._aclient
+    
+    async def aclose(self):
+        """Close pooled HTTP connections, kể cả AsyncClient của check_many"""
+        if self._aclient is not None:
+            await self._aclient.aclose()
+            self._aclient = None
+            self._aclient_loop = None
+        self.close()
+    
+    @staticmethod
+    async def _collect_status(check_one, media_generation_ids: List[str]) -> Dict[str, Dict]:
+        """Run status checks concurrently and collect them as they finish"""
+        results = {}
+        tasks = [asyncio.create_task(check_one(mid)) for mid in dict.fromkeys(media_generation_ids)]
+        for future in asyncio.as_completed(tasks):
+            media_generation_id, status = await future
+            results[media_generation_id] = status
+        return results
+    
+    def _parse_status_result(self, result: Dict) -> Dict:
+        """
+        Parse status response theo format Google Flow
+        
+        Args:
+            result: JSON response từ endpoint operations
+            
+        Returns:
+            Dict: Status information
+        """
+        operations = result.get('operations', [])
+        if operations:
+            operation = operations[0]
+            status = operation.get('status')
+            
+            # Extract video URL nếu có
+            video_url = None
+            fife_url = None
+            
+            if status == "MEDIA_GENERATION_STATUS_SUCCESSFUL":
+                # Tìm video URL trong metadata
+                fife_url = _dig(operation, 'operation', 'metadata', 'video', 'fifeUrl')
+                video_url = fife_url  # Sử dụng fifeUrl làm video URL
+            
+            return {
+                "success": True,
+                "status": status,
+                "video_url": video_url,
+                "fife_url": fife_url,
+                "remaining_credits": result.get('remainingCredits'),
+                "response": result
+            }
+        else:
+            return {
+                "success": False,
+                "error": "No operations in status response",
+                "response": result
+            }
+    
     def download_video(self, video_url: str, output_path: str) -> bool:
         """
         Download generated video
@@ -506,7 +856,7 @@ class GoogleFlowIntegration:
         try:
             logger.info(f"Downloading video from: {video_url}")
             
-            response = requests.get(video_url, stream=True, timeout=120)
+            response = self.session.get(video_url, stream=True, timeout=120)
             response.raise_for_status()
             
             with open(output_path, 'wb') as f:
@@ -522,6 +872,13 @@ class GoogleFlowIntegration:
         except Exception as e:
             logger.error(f"Unexpected error downloading video: {e}")
             return False
+    
+    def close(self):
+        """Close pooled HTTP connections"""
+        if self.client is not None:
+            self.client.close()
+        self.session.close()
+        self.generate_session.close()
 
 
 def extract_bearer_token_from_cookie(cookie_string: str) -> str:
@@ -3,14 +3,23 @@ Image Generator Module
 Tạo ảnh từ prompt sử dụng các API khác nhau (OpenAI, Stability AI, etc.)
 """
 
-import openai
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 import io
 import os
 import time
+import asyncio
+import hashlib
+import random
+import re
+import shutil
+import functools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from PIL import Image
-from typing import Optional, List, Dict, Union
+from typing import Optional, List, Dict, Tuple, Union, Iterator
 import logging
 from .api_manager import api_manager
 
@@ -18,16 +27,354 @@ from .api_manager import api_manager
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bộ lọc resample: Image.Resampling chỉ có từ Pillow 9.1, Pillow-SIMD (bản drop-in tăng tốc
+# resize/point/decode bằng AVX2) có thể cũ hơn nên fallback về hằng số cũ trên Image
+_Resampling = getattr(Image, "Resampling", Image)
+_RESAMPLE_LANCZOS = _Resampling.LANCZOS
+_RESAMPLE_NEAREST = _Resampling.NEAREST
+
+_SIZE_RE = re.compile(r'(\d+)x(\d+)')
+
+
+def _parse_size(size: str, default: Tuple[int, int] = (1024, 1024)) -> Tuple[int, int]:
+    """Parse chuỗi kích thước dạng "WIDTHxHEIGHT", sai định dạng thì trả về default"""
+    match = _SIZE_RE.fullmatch(size or "")
+    return (int(match.group(1)), int(match.group(2))) if match else default
+
+
+# Map size format -> (width, height) đã parse sẵn cho từng provider
+_STABILITY_SIZE_MAP = {
+    "1024x1024": (1024, 1024),
+    "1792x1024": (1344, 768),
+    "1024x1792": (768, 1344),
+}
+_POLLINATIONS_SIZE_MAP = {
+    "1024x1024": ("1024", "1024"),
+    "1792x1024": ("1792", "1024"),
+    "1024x1792": ("1024", "1792"),
+}
+
+# Từ khóa chất lượng cao thêm vào prompt Pollinations
+_QUALITY_KEYWORDS = (
+    "high quality", "detailed", "sharp focus", "cinematic lighting",
+    "professional photography", "4k", "ultra realistic", "photorealistic"
+)
+
+# (từ khóa nhận diện nội dung, style keywords) - xét theo thứ tự, nhóm khớp đầu tiên được dùng
+_STYLE_KEYWORDS = (
+    (frozenset({"deity", "god", "cosmic", "nebula", "asteroid"}),
+     ("epic", "dramatic", "cosmic horror", "ethereal lighting", "divine power")),
+    (frozenset({"battle", "war", "epic", "clash"}),
+     ("epic", "dramatic", "dynamic composition", "explosive energy")),
+    (frozenset({"city", "metropolis", "futuristic"}),
+     ("futuristic", "sci-fi", "neon lighting", "urban decay")),
+    (frozenset({"village", "countryside", "rural"}),
+     ("rustic", "natural lighting", "golden hour")),
+    (frozenset({"dog", "animal", "pet"}),
+     ("animal photography", "portrait", "soft lighting")),
+)
+
+
+def _unique_tmp_path(target_path: str, suffix: str = ".tmp") -> str:
+    """
+    Tên file tạm cạnh target_path, khác nhau cho mỗi lần gọi
+    
+    Hai thread/job ghi cùng target_path (batch song song, cache cùng key) không dùng
+    chung một file tạm; file tạo bằng open() nên giữ quyền theo umask như file thường.
+    """
+    return f"{target_path}.{uuid.uuid4().hex}{suffix}"
+
+
+def _write_bytes_atomic(output_path: str, data: bytes):
+    """
+    Ghi bytes ra file tạm rồi os.replace sang output_path (không để lại file ghi dở)
+    
+    Args:
+        output_path: Đường dẫn file đích
+        data: Nội dung cần ghi
+    """
+    tmp_path = _unique_tmp_path(output_path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _vertical_gradient(width: int, height: int, row_colors) -> Image.Image:
+    """
+    Tạo ảnh gradient dọc từ mảng màu theo dòng
+    
+    Args:
+        width: Chiều rộng ảnh
+        height: Chiều cao ảnh
+        row_colors: Mảng (height, 3) màu RGB của từng dòng
+        
+    Returns:
+        Image.Image: Ảnh RGB
+    """
+    import numpy as np
+    # Chỉ dựng cột rộng 1 pixel, để Pillow nhân ra đủ chiều rộng bằng resize NEAREST (fill trong C,
+    # không cần mảng NumPy (height, width, 3) trung gian)
+    column = np.ascontiguousarray(np.asarray(row_colors, dtype=np.uint8).reshape(height, 1, 3))
+    return Image.fromarray(column, 'RGB').resize((width, height), _RESAMPLE_NEAREST)
+
+
+# Magic bytes của định dạng ảnh hợp lệ (PNG, JPEG, WEBP) để kiểm tra trước khi ghi ra đĩa
+_IMAGE_MAGIC = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'RIFF')
+_MIN_IMAGE_BYTES = 1000
+
+
+class InvalidImageError(Exception):
+    """Response không phải ảnh hợp lệ (quá nhỏ hoặc sai magic bytes)"""
+
+
+@functools.lru_cache(maxsize=1)
+def _default_font():
+    """Font mặc định của Pillow, load một lần cho mọi placeholder (None nếu không load được)"""
+    try:
+        from PIL import ImageFont
+        return ImageFont.load_default()
+    except Exception:
+        return None
+
+
+@functools.lru_cache(maxsize=16)
+def _load_font(path: str, size: int):
+    """Load font TrueType theo (path, size) một lần, không có thì dùng font mặc định"""
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype(path, size)
+    except (OSError, ImportError):
+        return ImageFont.load_default()
+
+
+def _draw_centered_text(draw, text: str, width: int, y: int, fill: str, font,
+                        fallback_char_width: int = 10):
+    """
+    Vẽ text (một hoặc nhiều dòng) căn giữa theo chiều ngang, mép trên tại y
+    
+    Font TrueType dùng anchor "ma" để Pillow tự căn giữa khi vẽ (không phải đo text trước);
+    font bitmap không hỗ trợ anchor nên vẫn đo độ rộng (ước lượng nếu không có font).
+    """
+    from PIL import ImageFont
+    if isinstance(font, ImageFont.FreeTypeFont):
+        draw.text((width // 2, y), text, fill=fill, font=font, anchor="ma", align="center")
+        return
+    
+    if font is None:
+        text_width = len(text) * fallback_char_width
+    elif "\n" in text:
+        left, _, right, _ = draw.textbbox((0, 0), text, font=font)
+        text_width = right - left
+    else:
+        text_width = draw.textlength(text, font=font)
+    draw.text(((width - text_width) // 2, y), text, fill=fill, font=font, align="center")
+
+
+@functools.lru_cache(maxsize=8)
+def _quick_placeholder_template(width: int, height: int) -> Image.Image:
+    """
+    Nền cho _create_quick_placeholder: gradient, text cố định và border (cache theo kích thước)
+    
+    Ảnh trả về được dùng chung, caller phải .copy() trước khi vẽ thêm.
+    """
+    from PIL import ImageDraw
+    import numpy as np
+    color_value = (255 * (np.arange(height) / height) * 0.3).astype(np.int64)  # Gradient nhẹ
+    img = _vertical_gradient(width, height, np.stack(
+        [color_value // 3 + 44, color_value // 2 + 62, color_value + 80], axis=-1
+    ))  # Từ #2c3e50 đến #4a6741
+    draw = ImageDraw.Draw(img)
+    font = _default_font()
+    
+    _draw_centered_text(draw, "AI Image Generation", width, height // 2 - 40, 'white', font, 10)
+    _draw_centered_text(draw, "Service temporarily unavailable", width, height // 2 - 10, '#bdc3c7', font, 8)
+    
+    # Thêm border
+    draw.rectangle([10, 10, width-10, height-10], outline='#34495e', width=2)
+    return img
+
+
+@functools.lru_cache(maxsize=8)
+def _failed_placeholder_template(width: int, height: int) -> Image.Image:
+    """
+    Nền cho _create_placeholder_image: gradient và text chính (cache theo kích thước)
+    
+    Ảnh trả về được dùng chung, caller phải .copy() trước khi vẽ thêm.
+    """
+    from PIL import ImageDraw
+    import numpy as np
+    color_value = (255 * (np.arange(height) / height)).astype(np.int64)
+    img = _vertical_gradient(width, height, np.stack(
+        [color_value // 3, color_value // 2, color_value], axis=-1
+    ))
+    draw = ImageDraw.Draw(img)
+    _draw_centered_text(draw, "Image Generation Failed", width, height // 2 - 30, 'white', _default_font(), 10)
+    return img
+
+
+@functools.lru_cache(maxsize=8)
+def _enhanced_placeholder_template(width: int, height: int) -> Image.Image:
+    """
+    Nền cho _create_enhanced_placeholder: gradient và text chính (cache theo kích thước)
+    
+    Ảnh trả về được dùng chung, caller phải .copy() trước khi vẽ thêm.
+    """
+    from PIL import ImageDraw
+    import numpy as np
+    color_value = (26 + (np.arange(height) / height) * 50).astype(np.int64)  # Gradient từ #1a1a2e đến #16213e
+    img = _vertical_gradient(width, height, np.stack(
+        [color_value, color_value, color_value + 20], axis=-1
+    ))
+    draw = ImageDraw.Draw(img)
+    font_large = _load_font("arial.ttf", 48)
+    
+    # Text chính
+    _draw_centered_text(draw, "AI Generated Image", width, height // 2 - 60, '#ffffff', font_large)
+    return img
+
+
+@functools.lru_cache(maxsize=1)
+def _fallback_png_bytes() -> bytes:
+    """PNG 1024x1024 một màu #34495e cho fallback cuối cùng, encode một lần cho cả process"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (1024, 1024), color='#34495e').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _write_fallback_image(output_path: str):
+    """Ghi ảnh fallback một màu ra output_path (không dựng lại ảnh mỗi lần)"""
+    _write_bytes_atomic(output_path, _fallback_png_bytes())
+
+
+class _RateLimiter:
+    """Giới hạn số request bắt đầu mỗi giây, dùng chung giữa các worker thread"""
+    
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+    
+    def acquire(self):
+        """Chờ tới lượt được bắt đầu request tiếp theo"""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ProviderCircuitOpenError(Exception):
+    """Provider đang bị tạm ngắt (circuit breaker mở) sau nhiều lỗi liên tiếp"""
+
+
+class _PollinationsRaceWon(Exception):
+    """Sentinel: một URL Pollinations đã trả về ảnh, hủy các URL còn lại"""
+    
+    def __init__(self, part_path: str, file_size: int):
+        super().__init__("pollinations race won")
+        self.part_path = part_path
+        self.file_size = file_size
+
+
+class _DownloadCancelled(Exception):
+    """Download bị hủy vì một URL khác đã thắng"""
+
+
+class _PollinationsServerError(Exception):
+    """URL Pollinations thất bại vì lỗi 5xx/timeout (tính vào circuit breaker)"""
+
+
+class _PollinationsRace:
+    """Trạng thái một lần chạy đua URL Pollinations: download đầu tiên claim() được thì thắng"""
+    
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+    
+    def claim(self) -> bool:
+        """Nhận phần thắng; False nếu URL khác đã thắng hoặc race đã kết thúc"""
+        with self._lock:
+            if self.cancel_event.is_set():
+                return False
+            self.cancel_event.set()
+            return True
+    
+    def finish(self):
+        """Kết thúc race: download nào xong sau đó sẽ không claim() được và tự xóa file"""
+        with self._lock:
+            self.cancel_event.set()
+
+
 class ImageGenerator:
-    def __init__(self, provider: str = "pollinations", api_key: Optional[str] = None):
+    # Session dùng chung cho mọi instance/provider: giữ kết nối TLS giữa các ảnh trong batch
+    _shared_http: Optional[requests.Session] = None
+    
+    # Cache ảnh trên đĩa theo nội dung request (provider, prompt, size, quality, style)
+    CACHE_DIR = os.path.join("outputs", "cache", "images")
+    CACHE_MAX_BYTES = 512 * 1024 * 1024
+    
+    # Circuit breaker: BREAKER_THRESHOLD lỗi 5xx/timeout trong BREAKER_WINDOW giây
+    # thì bỏ qua provider trong BREAKER_COOLDOWN giây
+    BREAKER_THRESHOLD = 3
+    BREAKER_WINDOW = 60
+    BREAKER_COOLDOWN = 120
+    _breaker: Dict[str, Dict[str, float]] = {}
+    _breaker_lock = threading.Lock()
+    
+    # Pollinations: URL dự phòng chỉ bắt đầu khi URL trước lỗi hoặc chạy quá
+    # POLLINATIONS_HEDGE_DELAY giây; mọi request (kể cả retry) đi qua một limiter chung
+    POLLINATIONS_HEDGE_DELAY = 12.0
+    POLLINATIONS_REQUESTS_PER_SECOND = 2.0
+    _pollinations_limiter = _RateLimiter(POLLINATIONS_REQUESTS_PER_SECOND)
+    
+    # Tham số cố định của payload theo provider, mỗi request chỉ thêm prompt/width/height
+    PAYLOAD_TEMPLATES = {
+        "playground": {
+            "negative_prompt": "blurry, low quality, distorted",
+            "model": "playground-v2.5-1024px-aesthetic",
+            "num_images": 1,
+            "guidance_scale": 3.5,
+            "steps": 20,
+            "seed": None
+        },
+        "leonardo": {
+            "negative_prompt": "blurry, low quality, distorted",
+            "modelId": "6bef9f1b-29cb-40c7-b9df-32b51c1f67d3",  # Leonardo Diffusion XL
+            "num_images": 1,
+            "guidance_scale": 7,
+            "steps": 20
+        },
+        "local_sd": {
+            "negative_prompt": "blurry, low quality, distorted, bad anatomy",
+            "steps": 20,
+            "cfg_scale": 7,
+            "sampler_name": "DPM++ 2M Karras",
+            "batch_size": 1,
+            "n_iter": 1
+        },
+    }
+    
+    def __init__(self, provider: str = "pollinations", api_key: Optional[str] = None,
+                 use_cache: bool = False):
         """
         Khởi tạo ImageGenerator
         
         Args:
             provider: Nhà cung cấp API ("openai", "stability", "pollinations", "replicate", "huggingface")
             api_key: API key (tùy chọn, sẽ lấy từ api_manager)
+            use_cache: Dùng lại ảnh đã tạo cho cùng prompt/kích thước thay vì gọi API lại.
+                Mặc định tắt để mỗi lần tạo lại cho ra ảnh mới
         """
         self.provider = provider.lower()
+        self.use_cache = use_cache
         self.api_key = api_key or api_manager.get_api_key(self.provider)
         
         # Kiểm tra API key cho các provider trả phí
@@ -39,6 +386,26 @@ class ImageGenerator:
         if self.provider == "openai":
             # OpenAI API key sẽ được sử dụng trong client initialization
             pass
+        
+        self._http = self._get_http_session()
+        
+        # Request async đang chạy theo key (prompt, size, quality, style) để gộp request trùng
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    @classmethod
+    def _get_http_session(cls) -> requests.Session:
+        """Lấy (hoặc tạo) HTTP session dùng chung với connection pool"""
+        if cls._shared_http is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            cls._shared_http = session
+        return cls._shared_http
+    
+    def close(self):
+        """Đóng các kết nối đang giữ trong pool (session vẫn dùng lại được)"""
+        self._http.close()
     
     def generate_image(self, prompt: str, output_path: str, 
                       size: str = "1024x1024", quality: str = "standard",
@@ -61,7 +428,53 @@ class ImageGenerator:
         if output_dir:  # Chỉ tạo thư mục nếu có đường dẫn thư mục
             os.makedirs(output_dir, exist_ok=True)
         
-        # Danh sách providers để thử (với fallback)
+        providers_to_try = self._select_providers()
+        
+        # Thử từng provider cho đến khi thành công
+        last_error = None
+        for provider in providers_to_try:
+            cache_key = self._cache_key(provider, prompt, size, quality, style)
+            if self._cache_restore(cache_key, output_path):
+                return output_path
+            
+            try:
+                logger.info(f"Trying image provider: {provider}")
+                
+                result_path = None
+                if provider == "openai":
+                    result_path = self._generate_openai_image(prompt, output_path, size, quality, style)
+                elif provider == "stability":
+                    result_path = self._generate_stability_image(prompt, output_path, size)
+                elif provider == "pollinations":
+                    result_path = self._generate_pollinations_image(prompt, output_path, size)
+                elif provider == "replicate":
+                    result_path = self._generate_replicate_image(prompt, output_path, size)
+                elif provider == "huggingface":
+                    result_path = self._generate_huggingface_image(prompt, output_path, size)
+                elif provider == "craiyon":
+                    result_path = self._generate_craiyon_image(prompt, output_path, size)
+                elif provider == "picsum":
+                    result_path = self._generate_picsum_image(prompt, output_path, size)
+                
+                if result_path:
+                    self._cache_store(cache_key, result_path)
+                    return result_path
+                    
+            except ProviderCircuitOpenError as e:
+                logger.info("Skipping provider %s: %s", provider, e)
+                last_error = e
+                continue
+            except Exception as e:
+                logger.warning("Provider %s failed: %s", provider, e)
+                last_error = e
+                continue
+        
+        # Nếu tất cả providers đều thất bại, hiển thị thông báo lỗi
+        logger.error(f"All image providers failed. Last error: {last_error}")
+        raise Exception(f"❌ Không thể tạo ảnh! Tất cả providers đều lỗi. Lỗi cuối: {last_error}")
+    
+    def _select_providers(self) -> List[str]:
+        """Chọn danh sách providers sẽ thử cho generate_image"""
         providers_to_try = []
         
         # Danh sách providers theo thứ tự ưu tiên từ config
@@ -89,41 +502,165 @@ class ImageGenerator:
             # Nếu provider không có, dùng Pollinations
             providers_to_try = ["pollinations"]
         
-        # Thử từng provider cho đến khi thành công
-        last_error = None
-        for provider in providers_to_try:
+        return providers_to_try
+    
+    async def agenerate_image(self, prompt: str, output_path: str,
+                              size: str = "1024x1024", quality: str = "standard",
+                              style: str = "vivid") -> str:
+        """
+        Phiên bản async của generate_image
+        
+        Pollinations chạy đua các URL song song (ảnh đầu tiên hợp lệ thắng),
+        các provider khác chạy generate_image trong worker thread.
+        
+        Args:
+            prompt: Mô tả ảnh muốn tạo
+            output_path: Đường dẫn lưu ảnh
+            size: Kích thước ảnh (1024x1024, 1792x1024, 1024x1792)
+            quality: Chất lượng (standard, hd)
+            style: Phong cách (vivid, natural)
+            
+        Returns:
+            str: Đường dẫn file ảnh đã tạo
+        """
+        # Gộp request trùng: nếu cùng prompt/size/quality/style đang được tạo thì chờ kết quả đó rồi copy file
+        inflight_key = self._cache_key(self.provider, prompt, size, quality, style)
+        pending = self._inflight.get(inflight_key)
+        if pending is not None:
+            logger.info("Image request already in flight, waiting for shared result")
+            source_path = await asyncio.shield(pending)
+            if os.path.abspath(source_path) != os.path.abspath(output_path):
+                await asyncio.to_thread(self._copy_result, source_path, output_path)
+            return output_path
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            result_path = await self._agenerate_image_once(prompt, output_path, size, quality, style)
+            future.set_result(result_path)
+            return result_path
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Đánh dấu đã đọc để không log "exception was never retrieved" khi không ai chờ
+            raise
+        finally:
+            del self._inflight[inflight_key]
+    
+    @staticmethod
+    def _copy_result(source_path: str, output_path: str):
+        """Copy ảnh đã tạo sang output_path (ghi file tạm rồi os.replace)"""
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        tmp_path = _unique_tmp_path(output_path)
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            ImageGenerator._remove_quietly(tmp_path)
+            raise
+    
+    async def _agenerate_image_once(self, prompt: str, output_path: str, size: str,
+                                    quality: str, style: str) -> str:
+        """Tạo một ảnh (async) không qua bước gộp request trùng"""
+        if self._select_providers() != ["pollinations"]:
+            return await asyncio.to_thread(self.generate_image, prompt, output_path, size, quality, style)
+        
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        cache_key = self._cache_key("pollinations", prompt, size, quality, style)
+        if await asyncio.to_thread(self._cache_restore, cache_key, output_path):
+            return output_path
+        
+        try:
+            logger.info("Trying image provider: pollinations")
+            result_path = await self._agenerate_pollinations_image(prompt, output_path, size)
+            await asyncio.to_thread(self._cache_store, cache_key, result_path)
+            return result_path
+        except Exception as e:
+            logger.error(f"All image providers failed. Last error: {e}")
+            raise Exception(f"❌ Không thể tạo ảnh! Tất cả providers đều lỗi. Lỗi cuối: {e}")
+    
+    def _cache_key(self, provider: str, prompt: str, size: str, quality: str, style: str) -> str:
+        """
+        Tạo cache key cho một request ảnh
+        
+        Với Pollinations, key dùng prompt đã enhance để khi logic enhance thay đổi thì cache cũ tự mất hiệu lực.
+        """
+        if provider == "pollinations":
+            prompt = self._enhance_prompt_for_pollinations(prompt)
+        raw_key = "\x1f".join([provider, prompt, size or "", quality or "", style or ""])
+        return hashlib.blake2b(raw_key.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _cache_lookup(self, cache_key: str) -> Optional[str]:
+        """Trả về đường dẫn ảnh trong cache nếu có"""
+        if not self.use_cache:
+            return None
+        cache_path = os.path.join(self.CACHE_DIR, f"{cache_key}.png")
+        return cache_path if os.path.isfile(cache_path) else None
+    
+    def _cache_restore(self, cache_key: str, output_path: str) -> bool:
+        """Copy ảnh từ cache ra output_path, trả về True nếu cache hit"""
+        cache_path = self._cache_lookup(cache_key)
+        if not cache_path:
+            return False
+        try:
+            shutil.copyfile(cache_path, output_path)
+            os.utime(cache_path)  # Đánh dấu vừa dùng cho LRU
+            logger.info(f"♻️ Image cache hit: {output_path}")
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ Không thể dùng ảnh trong cache: {e}")
+            return False
+    
+    def _cache_store(self, cache_key: str, image_path: str):
+        """Lưu ảnh vừa tạo vào cache và dọn bớt khi vượt dung lượng"""
+        if not self.use_cache:
+            return
+        cache_path = os.path.join(self.CACHE_DIR, f"{cache_key}.png")
+        tmp_path = _unique_tmp_path(cache_path)
+        try:
+            os.makedirs(self.CACHE_DIR, exist_ok=True)
+            shutil.copyfile(image_path, tmp_path)
+            os.replace(tmp_path, cache_path)
+            self._cache_evict()
+        except OSError as e:
+            self._remove_quietly(tmp_path)
+            logger.warning(f"⚠️ Không thể lưu ảnh vào cache: {e}")
+    
+    def _cache_evict(self):
+        """Xóa ảnh ít dùng nhất (theo thời gian truy cập) khi cache vượt CACHE_MAX_BYTES"""
+        entries = []
+        total = 0
+        with os.scandir(self.CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".png"):
+                    stat = entry.stat()
+                    entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+                    total += stat.st_size
+        
+        if total <= self.CACHE_MAX_BYTES:
+            return
+        
+        for _, file_size, path in sorted(entries):
             try:
-                logger.info(f"Trying image provider: {provider}")
-                
-                if provider == "openai":
-                    return self._generate_openai_image(prompt, output_path, size, quality, style)
-                elif provider == "stability":
-                    return self._generate_stability_image(prompt, output_path, size)
-                elif provider == "pollinations":
-                    return self._generate_pollinations_image(prompt, output_path, size)
-                elif provider == "replicate":
-                    return self._generate_replicate_image(prompt, output_path, size)
-                elif provider == "huggingface":
-                    return self._generate_huggingface_image(prompt, output_path, size)
-                elif provider == "craiyon":
-                    return self._generate_craiyon_image(prompt, output_path, size)
-                elif provider == "picsum":
-                    return self._generate_picsum_image(prompt, output_path, size)
-                    
-            except Exception as e:
-                logger.warning(f"Provider {provider} failed: {e}")
-                last_error = e
+                os.remove(path)
+                total -= file_size
+            except OSError:
                 continue
-        
-        # Nếu tất cả providers đều thất bại, hiển thị thông báo lỗi
-        logger.error(f"All image providers failed. Last error: {last_error}")
-        raise Exception(f"❌ Không thể tạo ảnh! Tất cả providers đều lỗi. Lỗi cuối: {last_error}")
+            if total <= self.CACHE_MAX_BYTES:
+                break
     
     def _generate_openai_image(self, prompt: str, output_path: str, 
                               size: str, quality: str, style: str) -> str:
         """Tạo ảnh bằng OpenAI DALL-E"""
         try:
-            logger.info(f"Generating image with OpenAI DALL-E: {prompt[:50]}...")
+            logger.info("Generating image with OpenAI DALL-E: %.50s...", prompt)
             
             # Lấy cấu hình từ api_manager
             config = api_manager.get_provider_config("openai")
@@ -150,13 +687,10 @@ class ImageGenerator:
             
             image_url = response.data[0].url
             
-            # Tải ảnh từ URL
-            img_response = requests.get(image_url)
-            img_response.raise_for_status()
-            
-            # Lưu ảnh
-            with open(output_path, 'wb') as f:
-                f.write(img_response.content)
+            # Tải ảnh từ URL và lưu thẳng ra file
+            with self._http.get(image_url, stream=True) as img_response:
+                img_response.raise_for_status()
+                self._stream_response_to_file(img_response, output_path)
             
             logger.info(f"Image saved to: {output_path}")
             return output_path
@@ -168,41 +702,33 @@ class ImageGenerator:
     def _generate_stability_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Stability AI"""
         try:
-            logger.info(f"Generating image with Stability AI: {prompt[:50]}...")
+            logger.info("Generating image with Stability AI: %.50s...", prompt)
             
             # Map size format
-            size_map = {
-                "1024x1024": "1024x1024",
-                "1792x1024": "1344x768", 
-                "1024x1792": "768x1344"
-            }
-            stability_size = size_map.get(size, "1024x1024")
+            width, height = _STABILITY_SIZE_MAP.get(size, (1024, 1024))
             
             url = "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
             
+            # Accept: image/png -> API trả thẳng PNG nhị phân thay vì JSON base64,
+            # stream ra file mà không phải giữ chuỗi base64 + bytes đã decode trong RAM
             headers = {
                 "Content-Type": "application/json",
+                "Accept": "image/png",
                 "Authorization": f"Bearer {self.api_key}"
             }
             
             data = {
                 "text_prompts": [{"text": prompt}],
                 "cfg_scale": 7,
-                "height": int(stability_size.split('x')[1]),
-                "width": int(stability_size.split('x')[0]),
+                "height": height,
+                "width": width,
                 "samples": 1,
                 "steps": 30
             }
             
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            # Lưu ảnh từ base64
-            image_data = base64.b64decode(result['artifacts'][0]['base64'])
-            with open(output_path, 'wb') as f:
-                f.write(image_data)
+            with self._http.post(url, headers=headers, json=data, stream=True) as response:
+                response.raise_for_status()
+                self._stream_response_to_file(response, output_path, validate_image=True)
             
             logger.info(f"Image saved to: {output_path}")
             return output_path
@@ -214,108 +740,61 @@ class ImageGenerator:
     def _generate_pollinations_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Pollinations AI (miễn phí) với các model và tùy chọn nâng cao"""
         try:
-            logger.info(f"Generating image with Pollinations AI: {prompt[:50]}...")
-            
-            # Cải thiện prompt với các từ khóa chất lượng cao
-            enhanced_prompt = self._enhance_prompt_for_pollinations(prompt)
-            
-            # Rút ngắn prompt để tránh timeout (giới hạn 500 ký tự)
-            if len(enhanced_prompt) > 500:
-                enhanced_prompt = enhanced_prompt[:500] + "..."
-                logger.info(f"Shortened prompt to avoid timeout: {enhanced_prompt}")
-            
-            # Map size format
-            size_map = {
-                "1024x1024": "1024x1024",
-                "1792x1024": "1792x1024", 
-                "1024x1792": "1024x1792"
-            }
-            pollinations_size = size_map.get(size, "1024x1024")
-            
-            # Encode prompt for URL
-            import urllib.parse
-            encoded_prompt = urllib.parse.quote(enhanced_prompt)
-            
-            # Sử dụng Pollinations AI với retry mạnh mẽ và kích thước đúng
-            # ⚠️ LƯU Ý: Từ đầu tháng 10/2025, Pollinations.ai tự động thêm watermark vào tất cả ảnh từ API công khai
-            # Chỉ có API nội bộ hoặc tài khoản Pro mới được ảnh không watermark
-            urls_to_try = [
-                # URL với kích thước đúng
-                f"https://image.pollinations.ai/prompt/{encoded_prompt}?width={pollinations_size.split('x')[0]}&height={pollinations_size.split('x')[1]}",
-                # Backup URL với model khác
-                f"https://image.pollinations.ai/prompt/{encoded_prompt}?model=flux&width={pollinations_size.split('x')[0]}&height={pollinations_size.split('x')[1]}",
-                # URL với seed random
-                f"https://image.pollinations.ai/prompt/{encoded_prompt}?seed={hash(prompt) % 1000000}&width={pollinations_size.split('x')[0]}&height={pollinations_size.split('x')[1]}",
-                # URL với model SDXL
-                f"https://image.pollinations.ai/prompt/{encoded_prompt}?model=sdxl&width={pollinations_size.split('x')[0]}&height={pollinations_size.split('x')[1]}",
-                # URL với model SD 1.5
-                f"https://image.pollinations.ai/prompt/{encoded_prompt}?model=sd15&width={pollinations_size.split('x')[0]}&height={pollinations_size.split('x')[1]}"
-            ]
-            
-            for attempt, url in enumerate(urls_to_try):
-                logger.info(f"Pollinations attempt {attempt + 1}/{len(urls_to_try)}: {url[:100]}...")
-                
-                # Retry 3 lần cho mỗi URL
-                for retry in range(3):
+            logger.info("Generating image with Pollinations AI: %.50s...", prompt)
+            
+            self._breaker_check("pollinations")
+            url_count = len(self._POLLINATIONS_VARIANTS)
+            
+            # Hedged race: bắt đầu từ URL chính, URL tiếp theo chỉ chạy khi có URL lỗi
+            # hoặc sau POLLINATIONS_HEDGE_DELAY giây; URL trả ảnh hợp lệ đầu tiên thắng
+            part_paths = []
+            race = _PollinationsRace()
+            executor = ThreadPoolExecutor(max_workers=url_count, thread_name_prefix="pollinations")
+            futures = {}
+            pending = set()
+            winner = None
+            server_error = False
+            
+            def settle(timeout: Optional[float]):
+                nonlocal pending, winner, server_error
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
                     try:
-                        logger.info(f"  Retry {retry + 1}/3...")
-                        
-                        response = requests.get(url, timeout=60)  # Timeout 60s
-                        
-                        # Kiểm tra status code
-                        if response.status_code in [500, 502, 503, 504]:
-                            logger.warning(f"  ⚠️ Pollinations server error {response.status_code}")
-                            if retry < 2:  # Chưa hết retry
-                                time.sleep(10)  # Chờ 10 giây
-                                continue
-                            else:
-                                break  # Hết retry, thử URL khác
-                        
-                        response.raise_for_status()
-                        
-                        # Kiểm tra content type
-                        content_type = response.headers.get('content-type', '')
-                        if 'image' not in content_type:
-                            logger.warning(f"  ⚠️ Invalid content type: {content_type}")
-                            break  # Thử URL khác
-                        
-                        # Lưu ảnh
-                        with open(output_path, 'wb') as f:
-                            f.write(response.content)
-                        
-                        # Kiểm tra file size
-                        file_size = os.path.getsize(output_path)
-                        if file_size < 1000:  # File quá nhỏ
-                            logger.warning(f"  ⚠️ Image file too small: {file_size} bytes")
-                            break  # Thử URL khác
-                        
-                        logger.info(f"✅ Pollinations image generated successfully: {output_path} (size: {file_size} bytes)")
-                        
-                        # Thử xóa logo nếu có
-                        try:
-                            self._remove_pollinations_logo(output_path)
-                        except Exception as e:
-                            logger.warning(f"⚠️ Không thể xóa logo: {e}")
-                        
-                        return output_path
-                        
-                    except requests.exceptions.Timeout:
-                        logger.warning(f"  ⚠️ Pollinations timeout on retry {retry + 1}/3")
-                        if retry < 2:
-                            time.sleep(5)
-                            continue
-                        else:
-                            break
-                    except requests.exceptions.RequestException as e:
-                        logger.warning(f"  ⚠️ Pollinations request error on retry {retry + 1}/3: {e}")
-                        if retry < 2:
-                            time.sleep(5)
-                            continue
-                        else:
-                            break
+                        winner = (futures[future], future.result())
+                        return
+                    except _DownloadCancelled:
+                        pass
                     except Exception as e:
-                        logger.warning(f"  ⚠️ Pollinations error on retry {retry + 1}/3: {e}")
+                        server_error = server_error or isinstance(e, _PollinationsServerError)
+                        logger.warning("  ⚠️ Pollinations URL failed: %s", e)
+            
+            try:
+                for attempt, url in enumerate(self._build_pollinations_urls(prompt, size)):
+                    part_path = f"{output_path}.{attempt}.part"
+                    part_paths.append(part_path)
+                    logger.info("Pollinations attempt %d/%d: %.100s...", attempt + 1, url_count, url)
+                    future = executor.submit(self._fetch_pollinations_candidate, url, part_path, race)
+                    futures[future] = part_path
+                    pending.add(future)
+                    settle(self.POLLINATIONS_HEDGE_DELAY)
+                    if winner is not None:
                         break
+                while pending and winner is None:
+                    settle(None)
+            finally:
+                # Download còn chạy sẽ tự dừng; xong muộn thì không claim() được và tự xóa file
+                race.finish()
+                executor.shutdown(wait=False, cancel_futures=True)
+                for part_path in part_paths:
+                    if winner is None or part_path != winner[0]:
+                        self._remove_quietly(part_path)
+            
+            # Breaker tính theo ảnh, không theo từng URL/retry
+            if winner is not None:
+                self._breaker_record_success("pollinations")
+                return self._save_pollinations_image(winner[0], output_path, winner[1])
+            if server_error:
+                self._breaker_record_failure("pollinations")
             
             # Nếu tất cả URL đều thất bại
             logger.error("❌ Tất cả Pollinations URLs và retry đều thất bại")
@@ -326,11 +805,353 @@ class ImageGenerator:
             # Không fallback, chỉ raise exception
             raise e
     
+    async def generate_images_batch(self, jobs: List[Tuple[str, str]], size: str = "1024x1024",
+                                    quality: str = "standard", style: str = "vivid",
+                                    max_concurrency: int = 5) -> List[Union[str, BaseException]]:
+        """
+        Tạo nhiều ảnh song song (giới hạn số request đồng thời)
+        
+        Args:
+            jobs: Danh sách (prompt, output_path)
+            size: Kích thước ảnh
+            quality: Chất lượng (standard, hd)
+            style: Phong cách (vivid, natural)
+            max_concurrency: Số ảnh tạo đồng thời tối đa
+            
+        Returns:
+            List: Đường dẫn ảnh hoặc exception cho từng job, theo đúng thứ tự jobs
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate_one(prompt: str, output_path: str) -> str:
+            async with semaphore:
+                return await self.agenerate_image(prompt, output_path, size, quality, style)
+        
+        return await asyncio.gather(
+            *(generate_one(prompt, output_path) for prompt, output_path in jobs),
+            return_exceptions=True
+        )
+    
+    async def _agenerate_pollinations_image(self, prompt: str, output_path: str, size: str) -> str:
+        """Tạo ảnh Pollinations bằng hedged race giữa các URL, URL trả ảnh hợp lệ đầu tiên thắng"""
+        logger.info("Generating image with Pollinations AI (async race): %.50s...", prompt)
+        
+        self._breaker_check("pollinations")
+        part_paths = []
+        race = _PollinationsRace()
+        server_errors = []
+        
+        async def fetch(url: str, part_path: str):
+            try:
+                file_size = await asyncio.to_thread(self._fetch_pollinations_candidate, url, part_path, race)
+            except _DownloadCancelled:
+                return
+            except Exception as e:
+                if isinstance(e, _PollinationsServerError):
+                    server_errors.append(e)
+                logger.warning("  ⚠️ Pollinations URL failed: %s", e)
+                return
+            # Ném sentinel để TaskGroup hủy các URL còn lại
+            raise _PollinationsRaceWon(part_path, file_size)
+        
+        winner = None
+        try:
+            async with asyncio.TaskGroup() as tg:
+                running = set()
+                for attempt, url in enumerate(self._build_pollinations_urls(prompt, size)):
+                    part_path = f"{output_path}.{attempt}.part"
+                    part_paths.append(part_path)
+                    running.add(tg.create_task(fetch(url, part_path)))
+                    # URL tiếp theo chỉ bắt đầu khi có URL lỗi hoặc sau POLLINATIONS_HEDGE_DELAY giây
+                    _, running = await asyncio.wait(running, timeout=self.POLLINATIONS_HEDGE_DELAY,
+                                                    return_when=asyncio.FIRST_COMPLETED)
+        except* _PollinationsRaceWon as race_won:
+            winner = race_won.exceptions[0]
+        
+        # Download còn chạy trong thread sẽ tự dừng; xong muộn thì không claim() được và tự xóa file
+        race.finish()
+        for part_path in part_paths:
+            if winner is None or part_path != winner.part_path:
+                self._remove_quietly(part_path)
+        
+        # Breaker tính theo ảnh, không theo từng URL/retry
+        if winner is not None:
+            self._breaker_record_success("pollinations")
+        elif server_errors:
+            self._breaker_record_failure("pollinations")
+        
+        if winner is None:
+            logger.error("❌ Tất cả Pollinations URLs và retry đều thất bại")
+            raise Exception("❌ Pollinations AI: Tất cả URLs và retry đều thất bại. Server có thể đang quá tải.")
+        
+        return await asyncio.to_thread(self._save_pollinations_image, winner.part_path, output_path, winner.file_size)
+    
+    # Các biến thể query cho Pollinations (model/seed khác nhau), chạy đua song song
+    _POLLINATIONS_VARIANTS = (
+        "",             # URL với kích thước đúng
+        "model=flux&",  # Backup URL với model khác
+        None,           # URL với seed theo prompt
+        "model=sdxl&",  # URL với model SDXL
+        "model=sd15&",  # URL với model SD 1.5
+    )
+    
+    def _build_pollinations_urls(self, prompt: str, size: str) -> Iterator[str]:
+        """Tạo lần lượt các URL Pollinations (model/seed khác nhau) cho một prompt"""
+        # Cải thiện prompt với các từ khóa chất lượng cao
+        enhanced_prompt = self._enhance_prompt_for_pollinations(prompt)
+        
+        # Rút ngắn prompt để tránh timeout (giới hạn 500 ký tự)
+        if len(enhanced_prompt) > 500:
+            enhanced_prompt = enhanced_prompt[:500] + "..."
+            logger.info(f"Shortened prompt to avoid timeout: {enhanced_prompt}")
+        
+        # Map size format
+        width, height = _POLLINATIONS_SIZE_MAP.get(size, ("1024", "1024"))
+        
+        # Encode prompt for URL (một lần; safe='' để cả '/' cũng được encode, tránh vỡ path)
+        import urllib.parse
+        base_url = f"https://image.pollinations.ai/prompt/{urllib.parse.quote(enhanced_prompt, safe='')}?"
+        size_query = f"width={width}&height={height}"
+        
+        # Sử dụng Pollinations AI với retry mạnh mẽ và kích thước đúng
+        # ⚠️ LƯU Ý: Từ đầu tháng 10/2025, Pollinations.ai tự động thêm watermark vào tất cả ảnh từ API công khai
+        # Chỉ có API nội bộ hoặc tài khoản Pro mới được ảnh không watermark
+        for variant in self._POLLINATIONS_VARIANTS:
+            if variant is None:
+                variant = f"seed={self._pollinations_seed(prompt)}&"
+            yield base_url + variant + size_query
+    
+    @staticmethod
+    def _pollinations_seed(prompt: str) -> int:
+        """Seed ổn định theo prompt (hash() bị random hóa mỗi process nên không dùng được)"""
+        digest = hashlib.blake2b(prompt.encode("utf-8"), digest_size=4).digest()
+        return int.from_bytes(digest, "big") % 1000000
+    
+    def _fetch_pollinations_candidate(self, url: str, part_path: str, race: _PollinationsRace) -> int:
+        """
+        Tải một URL trong race; chỉ giữ file nếu claim() được phần thắng
+        
+        Raises:
+            _DownloadCancelled: Khi URL khác đã thắng (file tạm đã bị xóa)
+        """
+        file_size = self._fetch_pollinations_url(url, part_path, race.cancel_event)
+        if not race.claim():
+            self._remove_quietly(part_path)
+            raise _DownloadCancelled("Another Pollinations URL already won")
+        return file_size
+    
+    def _fetch_pollinations_url(self, url: str, dest_path: str,
+                                cancel_event: Optional[threading.Event] = None) -> int:
+        """
+        Tải ảnh từ một URL Pollinations vào dest_path (retry 3 lần)
+        
+        Returns:
+            int: Số byte đã ghi
+        
+        Raises:
+            _PollinationsServerError: Khi URL thất bại và có lỗi 5xx/timeout
+            Exception: Khi URL không trả về ảnh hợp lệ
+        """
+        last_error = None
+        server_error = False
+        
+        # Retry 3 lần cho mỗi URL
+        for retry in range(3):
+            self._pollinations_limiter.acquire()
+            if cancel_event is not None and cancel_event.is_set():
+                raise _DownloadCancelled("Download cancelled")
+            try:
+                logger.info("  Retry %d/3...", retry + 1)
+                
+                with self._http.get(url, timeout=60, stream=True) as response:  # Timeout 60s
+                    # Kiểm tra status code
+                    if response.status_code in [500, 502, 503, 504]:
+                        logger.warning("  ⚠️ Pollinations server error %s", response.status_code)
+                        server_error = True
+                        last_error = Exception(f"Pollinations server error {response.status_code}")
+                        if retry < 2:  # Chưa hết retry
+                            self._retry_wait(retry, response, cancel_event)
+                            continue
+                        else:
+                            break  # Hết retry, thử URL khác
+                    
+                    # Bị rate limit (thường khi chạy batch song song): chờ lâu dần rồi thử lại
+                    if response.status_code == 429:
+                        logger.warning("  ⚠️ Pollinations rate limited (429)")
+                        last_error = Exception("Pollinations rate limited (429)")
+                        if retry < 2:
+                            self._retry_wait(retry, response, cancel_event)
+                            continue
+                        else:
+                            break
+                    
+                    response.raise_for_status()
+                    
+                    # Kiểm tra content type
+                    content_type = response.headers.get('content-type', '')
+                    if 'image' not in content_type:
+                        raise InvalidImageError(f"Invalid content type: {content_type}")
+                    
+                    # Kiểm tra kích thước + magic bytes trong bộ nhớ trước khi ghi file
+                    return self._stream_response_to_file(response, dest_path, cancel_event,
+                                                         validate_image=True)
+            
+            except requests.exceptions.Timeout as e:
+                logger.warning("  ⚠️ Pollinations timeout on retry %d/3", retry + 1)
+                server_error = True
+                last_error = e
+                if retry < 2:
+                    self._retry_wait(retry, None, cancel_event)
+            except (requests.exceptions.RequestException, InvalidImageError) as e:
+                # Server quá tải hay trả về trang lỗi/ảnh hỏng thay vì ảnh: thử lại như lỗi mạng
+                logger.warning("  ⚠️ Pollinations request error on retry %d/3: %s", retry + 1, e)
+                last_error = e
+                if retry < 2:
+                    self._retry_wait(retry, None, cancel_event)
+        
+        error_type = _PollinationsServerError if server_error else Exception
+        raise error_type(f"Pollinations URL failed after retries: {last_error}")
+    
+    @staticmethod
+    def _retry_wait(retry: int, response: Optional[requests.Response] = None,
+                    cancel_event: Optional[threading.Event] = None, cap: float = 8.0):
+        """
+        Chờ trước lần retry tiếp theo: exponential backoff có jitter, ưu tiên Retry-After
+        
+        Args:
+            retry: Số thứ tự lần thử hiện tại (bắt đầu từ 0)
+            response: Response lỗi (đọc header Retry-After nếu có)
+            cancel_event: Nếu được set (URL khác đã thắng) thì dừng chờ ngay
+            cap: Thời gian chờ tối đa (giây) khi không có Retry-After
+        """
+        delay = min(2 ** retry + random.random() * 0.5, cap)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.strip().isdigit():
+            delay = min(int(retry_after), 30)
+        
+        if cancel_event is not None:
+            cancel_event.wait(delay)
+        else:
+            time.sleep(delay)
+    
+    def _save_pollinations_image(self, part_path: str, output_path: str, file_size: int) -> str:
+        """Đưa ảnh Pollinations đã tải vào output_path và thử xóa logo"""
+        os.replace(part_path, output_path)
+        
+        logger.info(f"✅ Pollinations image generated successfully: {output_path} (size: {file_size} bytes)")
+        
+        # Thử xóa logo nếu có
+        try:
+            self._remove_pollinations_logo(output_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Không thể xóa logo: {e}")
+        
+        return output_path
+    
+    @classmethod
+    def _breaker_check(cls, provider: str):
+        """Raise ProviderCircuitOpenError nếu provider đang bị tạm ngắt"""
+        with cls._breaker_lock:
+            state = cls._breaker.get(provider)
+            remaining = state["open_until"] - time.time() if state else 0
+        if remaining > 0:
+            raise ProviderCircuitOpenError(
+                f"{provider} tạm ngắt sau nhiều lỗi liên tiếp, thử lại sau {int(remaining)}s"
+            )
+    
+    @classmethod
+    def _breaker_record_failure(cls, provider: str):
+        """Ghi nhận một lỗi 5xx/timeout, mở breaker khi vượt ngưỡng"""
+        now = time.time()
+        with cls._breaker_lock:
+            state = cls._breaker.setdefault(provider, {"failures": 0, "first_failure": now, "open_until": 0.0})
+            if now - state["first_failure"] > cls.BREAKER_WINDOW:
+                state["failures"] = 0
+                state["first_failure"] = now
+            state["failures"] += 1
+            if state["failures"] >= cls.BREAKER_THRESHOLD:
+                state["open_until"] = now + cls.BREAKER_COOLDOWN
+                logger.warning(f"⚠️ {provider} circuit breaker opened for {cls.BREAKER_COOLDOWN}s")
+    
+    @classmethod
+    def _breaker_record_success(cls, provider: str):
+        """Reset breaker khi provider trả về thành công"""
+        with cls._breaker_lock:
+            cls._breaker.pop(provider, None)
+    
+    @staticmethod
+    def _stream_response_to_file(response: requests.Response, output_path: str,
+                                 cancel_event: Optional[threading.Event] = None,
+                                 validate_image: bool = False) -> int:
+        """
+        Ghi body của response (stream=True) ra file theo từng chunk 64 KiB
+        
+        Args:
+            response: Response đã mở với stream=True
+            output_path: Đường dẫn file đích
+            cancel_event: Event để hủy download giữa chừng
+            validate_image: Gom tối đa 16 KiB đầu vào bộ nhớ, kiểm tra kích thước
+                và magic bytes rồi mới mở file (response lỗi không chạm tới đĩa)
+        
+        Returns:
+            int: Số byte đã ghi
+            
+        Raises:
+            InvalidImageError: Khi validate_image=True và response không phải ảnh
+        """
+        chunks = response.iter_content(chunk_size=65536)
+        head = bytearray()
+        
+        if validate_image:
+            for chunk in chunks:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise _DownloadCancelled("Download cancelled")
+                head += chunk
+                if len(head) >= 16384:
+                    break
+            
+            if len(head) < _MIN_IMAGE_BYTES:
+                raise InvalidImageError(f"Image file too small: {len(head)} bytes")
+            if not head.startswith(_IMAGE_MAGIC):
+                raise InvalidImageError(f"Invalid image header: {bytes(head[:8])!r}")
+        
+        # Ghi vào file tạm, chỉ os.replace sang output_path khi đã tải đủ
+        tmp_path = _unique_tmp_path(output_path)
+        written = len(head)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(head)
+                for chunk in chunks:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise _DownloadCancelled("Download cancelled")
+                    f.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            ImageGenerator._remove_quietly(tmp_path)
+            raise
+        
+        return written
+    
+    @staticmethod
+    def _remove_quietly(path: str):
+        """Xóa file nếu tồn tại, bỏ qua lỗi"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
     def _remove_pollinations_logo(self, image_path):
         """
         Thử xóa logo pollinations.ai từ ảnh bằng cách crop phần dưới bên phải
         """
         try:
+            is_jpeg = os.path.splitext(image_path)[1].lower() in ('.jpg', '.jpeg')
+            
+            # libvips crop theo từng scanline (nhanh hơn, ít RAM hơn PIL) nếu có cài pyvips
+            if self._crop_logo_with_vips(image_path, is_jpeg):
+                return
+            
             from PIL import Image
             
             # Mở ảnh
@@ -344,8 +1165,18 @@ class ImageGenerator:
                 # Crop ảnh
                 cropped_img = img.crop((0, 0, new_width, new_height))
                 
-                # Lưu lại
-                cropped_img.save(image_path, quality=95)
+                # Lưu vào file tạm rồi os.replace: không ghi đè file nguồn đang mở
+                # PNG bỏ qua quality, dùng zlib level 1 để encode nhanh hơn nhiều so với mặc định (6)
+                tmp_path = _unique_tmp_path(image_path)
+                try:
+                    if is_jpeg:
+                        cropped_img.save(tmp_path, format='JPEG', quality=95)
+                    else:
+                        cropped_img.save(tmp_path, format='PNG', optimize=False, compress_level=1)
+                    os.replace(tmp_path, image_path)
+                except BaseException:
+                    self._remove_quietly(tmp_path)
+                    raise
                 
                 logger.info(f"✅ Đã crop ảnh để loại bỏ logo: {width}x{height} -> {new_width}x{new_height}")
                 
@@ -353,89 +1184,75 @@ class ImageGenerator:
             logger.warning(f"⚠️ Không thể xóa logo: {e}")
             # Không raise exception, chỉ log warning
     
-    def _enhance_prompt_for_pollinations(self, prompt: str) -> str:
+    @staticmethod
+    def _crop_logo_with_vips(image_path: str, is_jpeg: bool) -> bool:
+        """
+        Crop logo bằng pyvips (tùy chọn)
+        
+        Returns:
+            bool: True nếu đã crop xong, False nếu không có pyvips hoặc crop lỗi
+        """
+        try:
+            import pyvips
+        except ImportError:
+            return False
+        
+        # Giữ đuôi file để pyvips chọn đúng định dạng khi ghi
+        tmp_path = _unique_tmp_path(image_path, suffix=os.path.splitext(image_path)[1])
+        try:
+            vips_img = pyvips.Image.new_from_file(image_path, access="sequential")
+            width, height = vips_img.width, vips_img.height
+            new_height = int(height * 0.9)  # Bỏ 10% cuối
+            new_width = int(width * 0.95)   # Bỏ 5% bên phải
+            
+            save_options = {"Q": 95} if is_jpeg else {"compression": 1}
+            vips_img.crop(0, 0, new_width, new_height).write_to_file(tmp_path, **save_options)
+            os.replace(tmp_path, image_path)
+            
+            logger.info(f"✅ Đã crop ảnh để loại bỏ logo: {width}x{height} -> {new_width}x{new_height}")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ pyvips crop failed, fallback to PIL: {e}")
+            ImageGenerator._remove_quietly(tmp_path)
+            return False
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def _enhance_prompt_for_pollinations(prompt: str) -> str:
         """Cải thiện prompt để tạo ảnh đẹp hơn với Pollinations AI"""
         # Thêm các từ khóa chất lượng cao
-        quality_keywords = [
-            "high quality", "detailed", "sharp focus", "cinematic lighting",
-            "professional photography", "4k", "ultra realistic", "photorealistic"
-        ]
+        quality_keywords = list(_QUALITY_KEYWORDS)
         
         # Thêm style keywords dựa trên nội dung
-        if any(word in prompt.lower() for word in ["deity", "god", "cosmic", "nebula", "asteroid"]):
-            quality_keywords.extend(["epic", "dramatic", "cosmic horror", "ethereal lighting", "divine power"])
-        elif any(word in prompt.lower() for word in ["battle", "war", "epic", "clash"]):
-            quality_keywords.extend(["epic", "dramatic", "dynamic composition", "explosive energy"])
-        elif any(word in prompt.lower() for word in ["city", "metropolis", "futuristic"]):
-            quality_keywords.extend(["futuristic", "sci-fi", "neon lighting", "urban decay"])
-        elif any(word in prompt.lower() for word in ["village", "countryside", "rural"]):
-            quality_keywords.extend(["rustic", "natural lighting", "golden hour"])
-        elif any(word in prompt.lower() for word in ["dog", "animal", "pet"]):
-            quality_keywords.extend(["animal photography", "portrait", "soft lighting"])
-        
-        # Kết hợp prompt gốc với quality keywords
-        enhanced_prompt = prompt
-        for keyword in quality_keywords[:4]:  # Thêm 4 keywords để tăng chất lượng
-            if keyword not in enhanced_prompt.lower():
-                enhanced_prompt += f", {keyword}"
-        
-        return enhanced_prompt
+        lowered_prompt = prompt.lower()
+        for trigger_words, style_keywords in _STYLE_KEYWORDS:
+            if any(word in lowered_prompt for word in trigger_words):
+                quality_keywords.extend(style_keywords)
+                break
+        
+        # Kết hợp prompt gốc với quality keywords (4 keywords để tăng chất lượng, bỏ keyword đã có)
+        # Các keyword không chứa nhau nên chỉ cần so với prompt gốc đã lowercase
+        additions = [keyword for keyword in quality_keywords[:4] if keyword not in lowered_prompt]
+        if not additions:
+            return prompt
+        return prompt + ", " + ", ".join(additions)
     
     def _create_quick_placeholder(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh placeholder nhanh chóng với thông tin chi tiết"""
         try:
-            from PIL import Image, ImageDraw, ImageFont
+            from PIL import Image, ImageDraw
             
             # Parse size
-            width, height = 1024, 1024
-            if 'x' in size:
-                try:
-                    width, height = map(int, size.split('x'))
-                except:
-                    width, height = 1024, 1024
+            width, height = _parse_size(size)
             
-            # Tạo ảnh gradient đẹp hơn
-            img = Image.new('RGB', (width, height), color='#2c3e50')
+            # Template gradient + text cố định được render một lần cho mỗi kích thước, chỉ vẽ thêm prompt
+            img = _quick_placeholder_template(width, height).copy()
             draw = ImageDraw.Draw(img)
-            
-            # Vẽ gradient background
-            for y in range(height):
-                color_value = int(255 * (y / height) * 0.3)  # Gradient nhẹ
-                color = (color_value // 3 + 44, color_value // 2 + 62, color_value + 80)  # Từ #2c3e50 đến #4a6741
-                draw.line([(0, y), (width, y)], fill=color)
-            
-            # Thêm text với font mặc định
-            try:
-                font = ImageFont.load_default()
-            except:
-                font = None
-            
-            # Text chính
-            main_text = "AI Image Generation"
-            text_width = draw.textlength(main_text, font=font) if font else len(main_text) * 10
-            text_x = (width - text_width) // 2
-            text_y = height // 2 - 40
-            
-            draw.text((text_x, text_y), main_text, fill='white', font=font)
-            
-            # Text phụ
-            sub_text = "Service temporarily unavailable"
-            sub_text_width = draw.textlength(sub_text, font=font) if font else len(sub_text) * 8
-            sub_text_x = (width - sub_text_width) // 2
-            sub_text_y = height // 2 - 10
-            
-            draw.text((sub_text_x, sub_text_y), sub_text, fill='#bdc3c7', font=font)
+            font = _default_font()
             
             # Text prompt (rút ngắn)
             prompt_text = f"Prompt: {prompt[:30]}..." if len(prompt) > 30 else f"Prompt: {prompt}"
-            prompt_width = draw.textlength(prompt_text, font=font) if font else len(prompt_text) * 6
-            prompt_x = (width - prompt_width) // 2
-            prompt_y = height // 2 + 20
-            
-            draw.text((prompt_x, prompt_y), prompt_text, fill='#95a5a6', font=font)
-            
-            # Thêm border
-            draw.rectangle([10, 10, width-10, height-10], outline='#34495e', width=2)
+            _draw_centered_text(draw, prompt_text, width, height // 2 + 20, '#95a5a6', font, 6)
             
             # Lưu ảnh
             img.save(output_path, 'PNG')
@@ -444,59 +1261,28 @@ class ImageGenerator:
             
         except Exception as e:
             # Fallback cuối cùng
-            img = Image.new('RGB', (1024, 1024), color='#34495e')
-            img.save(output_path, 'PNG')
+            _write_fallback_image(output_path)
             return output_path
     
     def _create_placeholder_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh placeholder khi tất cả providers đều thất bại"""
         try:
-            logger.info(f"Creating placeholder image for: {prompt[:50]}...")
+            logger.info("Creating placeholder image for: %.50s...", prompt)
             
             # Parse size
-            width, height = 1024, 1024
-            if 'x' in size:
-                try:
-                    width, height = map(int, size.split('x'))
-                except:
-                    width, height = 1024, 1024
+            width, height = _parse_size(size)
             
             # Tạo ảnh gradient đơn giản
-            from PIL import Image, ImageDraw, ImageFont
+            from PIL import Image, ImageDraw
             
-            # Tạo ảnh với gradient
-            img = Image.new('RGB', (width, height), color='#2c3e50')
+            # Template gradient + text chính được render một lần cho mỗi kích thước, chỉ vẽ thêm prompt
+            img = _failed_placeholder_template(width, height).copy()
             draw = ImageDraw.Draw(img)
-            
-            # Vẽ gradient
-            for y in range(height):
-                color_value = int(255 * (y / height))
-                color = (color_value // 3, color_value // 2, color_value)
-                draw.line([(0, y), (width, y)], fill=color)
-            
-            # Thêm text
-            try:
-                # Thử sử dụng font mặc định
-                font_size = min(width, height) // 20
-                font = ImageFont.load_default()
-            except:
-                font = None
-            
-            # Text chính
-            main_text = "Image Generation Failed"
-            text_width = draw.textlength(main_text, font=font) if font else len(main_text) * 10
-            text_x = (width - text_width) // 2
-            text_y = height // 2 - 30
-            
-            draw.text((text_x, text_y), main_text, fill='white', font=font)
+            font = _default_font()
             
             # Text phụ
             sub_text = f"Prompt: {prompt[:50]}..."
-            sub_text_width = draw.textlength(sub_text, font=font) if font else len(sub_text) * 8
-            sub_text_x = (width - sub_text_width) // 2
-            sub_text_y = height // 2 + 10
-            
-            draw.text((sub_text_x, sub_text_y), sub_text, fill='#bdc3c7', font=font)
+            _draw_centered_text(draw, sub_text, width, height // 2 + 10, '#bdc3c7', font, 8)
             
             # Lưu ảnh
             img.save(output_path, 'PNG')
@@ -507,8 +1293,7 @@ class ImageGenerator:
             logger.error(f"Error creating placeholder image: {e}")
             # Tạo ảnh đơn giản nhất
             try:
-                img = Image.new('RGB', (1024, 1024), color='#34495e')
-                img.save(output_path, 'PNG')
+                _write_fallback_image(output_path)
                 return output_path
             except:
                 raise Exception(f"Failed to create any image. Original error: {e}")
@@ -516,7 +1301,7 @@ class ImageGenerator:
     def _generate_replicate_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Replicate (có thể miễn phí với giới hạn)"""
         try:
-            logger.info(f"Generating image with Replicate: {prompt[:50]}...")
+            logger.info("Generating image with Replicate: %.50s...", prompt)
             
             # Replicate API call (cần cài đặt replicate package)
             try:
@@ -535,11 +1320,9 @@ class ImageGenerator:
                 )
                 
                 # Tải ảnh từ URL
-                img_response = requests.get(output[0], timeout=30)
-                img_response.raise_for_status()
-                
-                with open(output_path, 'wb') as f:
-                    f.write(img_response.content)
+                with self._http.get(output[0], timeout=30, stream=True) as img_response:
+                    img_response.raise_for_status()
+                    self._stream_response_to_file(img_response, output_path)
                 
                 logger.info(f"Image saved to: {output_path}")
                 return output_path
@@ -555,7 +1338,7 @@ class ImageGenerator:
     def _generate_huggingface_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng HuggingFace (miễn phí, không cần API key)"""
         try:
-            logger.info(f"Generating image with HuggingFace: {prompt[:50]}...")
+            logger.info("Generating image with HuggingFace: %.50s...", prompt)
             
             # Sử dụng HuggingFace Inference API miễn phí (không cần API key)
             model_id = "stabilityai/stable-diffusion-2-1"
@@ -574,26 +1357,27 @@ class ImageGenerator:
             }
             
             # Thử không có API key trước
-            response = requests.post(api_url, json=payload, timeout=30)
+            response = self._http.post(api_url, json=payload, timeout=30, stream=True)
             
             # Nếu cần API key, thử với key nếu có
             if response.status_code == 401 and self.api_key:
+                response.close()
                 headers = {"Authorization": f"Bearer {self.api_key}"}
-                response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+                response = self._http.post(api_url, headers=headers, json=payload, timeout=30, stream=True)
             
-            response.raise_for_status()
-            
-            # Kiểm tra content type
-            content_type = response.headers.get('content-type', '')
-            if 'image' not in content_type:
-                raise Exception(f"Invalid content type: {content_type}")
-            
-            # Lưu ảnh
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+            with response:
+                response.raise_for_status()
+                
+                # Kiểm tra content type
+                content_type = response.headers.get('content-type', '')
+                if 'image' not in content_type:
+                    raise Exception(f"Invalid content type: {content_type}")
+                
+                # Lưu ảnh
+                file_size = self._stream_response_to_file(response, output_path)
             
             # Kiểm tra file size
-            if os.path.getsize(output_path) < 1000:
+            if file_size < 1000:
                 raise Exception("Generated image file too small")
             
             logger.info(f"Image saved to: {output_path}")
@@ -606,7 +1390,7 @@ class ImageGenerator:
     def _generate_craiyon_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Craiyon (DALL-E Mini) - miễn phí"""
         try:
-            logger.info(f"Generating image with Craiyon: {prompt[:50]}...")
+            logger.info("Generating image with Craiyon: %.50s...", prompt)
             
             # Rút ngắn prompt
             if len(prompt) > 100:
@@ -622,7 +1406,7 @@ class ImageGenerator:
                 "token": None
             }
             
-            response = requests.post(api_url, json=payload, timeout=60)
+            response = self._http.post(api_url, json=payload, timeout=60)
             response.raise_for_status()
             
             result = response.json()
@@ -632,8 +1416,7 @@ class ImageGenerator:
                 import base64
                 image_data = base64.b64decode(result['images'][0])
                 
-                with open(output_path, 'wb') as f:
-                    f.write(image_data)
+                _write_bytes_atomic(output_path, image_data)
                 
                 logger.info(f"Image saved to: {output_path}")
                 return output_path
@@ -647,7 +1430,7 @@ class ImageGenerator:
     def _generate_gemini_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Google Gemini API"""
         try:
-            logger.info(f"Generating image with Gemini: {prompt[:50]}...")
+            logger.info("Generating image with Gemini: %.50s...", prompt)
             
             import google.generativeai as genai
             
@@ -674,8 +1457,7 @@ class ImageGenerator:
                         # Lưu ảnh từ inline data
                         import base64
                         image_data = base64.b64decode(part.inline_data.data)
-                        with open(output_path, 'wb') as f:
-                            f.write(image_data)
+                        _write_bytes_atomic(output_path, image_data)
                         logger.info(f"Image saved to: {output_path}")
                         return output_path
             
@@ -690,54 +1472,20 @@ class ImageGenerator:
     def _create_enhanced_placeholder(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo placeholder đẹp hơn với gradient và text"""
         try:
-            from PIL import Image, ImageDraw, ImageFont
+            from PIL import Image, ImageDraw
             import textwrap
             
             # Parse size
-            width, height = 1024, 1024
-            if 'x' in size:
-                try:
-                    width, height = map(int, size.split('x'))
-                except:
-                    width, height = 1024, 1024
+            width, height = _parse_size(size)
             
-            # Tạo ảnh với gradient
-            img = Image.new('RGB', (width, height), color='#1a1a2e')
+            # Template gradient + text chính được render một lần cho mỗi kích thước, chỉ vẽ thêm prompt
+            img = _enhanced_placeholder_template(width, height).copy()
             draw = ImageDraw.Draw(img)
+            font_small = _load_font("arial.ttf", 24)
             
-            # Vẽ gradient
-            for y in range(height):
-                color_value = int(26 + (y / height) * 50)  # Gradient từ #1a1a2e đến #16213e
-                color = (color_value, color_value, color_value + 20)
-                draw.line([(0, y), (width, y)], fill=color)
-            
-            # Thêm text
-            try:
-                # Thử dùng font mặc định
-                font_large = ImageFont.truetype("arial.ttf", 48)
-                font_small = ImageFont.truetype("arial.ttf", 24)
-            except:
-                # Fallback font
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
-            
-            # Text chính
-            main_text = "AI Generated Image"
-            text_bbox = draw.textbbox((0, 0), main_text, font=font_large)
-            text_width = text_bbox[2] - text_bbox[0]
-            text_x = (width - text_width) // 2
-            text_y = height // 2 - 60
-            
-            draw.text((text_x, text_y), main_text, fill='#ffffff', font=font_large)
-            
-            # Prompt text (wrapped)
+            # Prompt text (wrapped), ngay dưới text chính của template
             wrapped_prompt = textwrap.fill(prompt, width=50)
-            prompt_bbox = draw.textbbox((0, 0), wrapped_prompt, font=font_small)
-            prompt_width = prompt_bbox[2] - prompt_bbox[0]
-            prompt_x = (width - prompt_width) // 2
-            prompt_y = text_y + 80
-            
-            draw.text((prompt_x, prompt_y), wrapped_prompt, fill='#cccccc', font=font_small)
+            _draw_centered_text(draw, wrapped_prompt, width, height // 2 + 20, '#cccccc', font_small)
             
             # Lưu ảnh
             img.save(output_path, 'PNG')
@@ -747,17 +1495,26 @@ class ImageGenerator:
         except Exception as e:
             logger.error(f"Error creating enhanced placeholder: {e}")
             # Fallback cuối cùng
-            from PIL import Image
-            img = Image.new('RGB', (1024, 1024), color='#34495e')
-            img.save(output_path, 'PNG')
+            _write_fallback_image(output_path)
             return output_path
 
+    # Hugging Face Space API endpoints (miễn phí), dùng khi Inference API lỗi
+    HF_SPACE_URLS = (
+        "https://huggingface.co/spaces/stabilityai/stable-diffusion",
+        "https://huggingface.co/spaces/runwayml/stable-diffusion-v1-5",
+        "https://huggingface.co/spaces/CompVis/stable-diffusion-v1-4",
+    )
+    
     def _generate_huggingface_space_image(self, prompt: str, output_path: str, size: str) -> str:
-        """Tạo ảnh bằng Hugging Face Space API miễn phí"""
+        """
+        Tạo ảnh bằng Hugging Face (miễn phí)
+        
+        Thử Inference API SDXL trước (một request), lỗi thì lần lượt thử các Space.
+        """
         try:
-            logger.info(f"Generating image with Hugging Face Space: {prompt[:50]}...")
+            logger.info("Generating image with Hugging Face Space: %.50s...", prompt)
             
-            # Sử dụng Stable Diffusion Space
+            # Sử dụng Stable Diffusion XL qua Inference API
             url = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
             
             headers = {
@@ -773,18 +1530,57 @@ class ImageGenerator:
                 }
             }
             
-            # Gửi request
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
-            
-            if response.status_code == 200:
-                # Lưu ảnh
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
+            try:
+                # Gửi request
+                with self._http.post(url, headers=headers, json=payload, timeout=60, stream=True) as response:
+                    if response.status_code != 200:
+                        raise Exception(f"Hugging Face API error: {response.status_code}")
+                    
+                    # Lưu ảnh (stream thẳng ra file)
+                    self._stream_response_to_file(response, output_path)
                 
                 logger.info(f"Image saved to: {output_path}")
                 return output_path
-            else:
-                raise Exception(f"Hugging Face API error: {response.status_code}")
+            except Exception as api_error:
+                logger.warning("Hugging Face Inference API failed, trying Spaces: %s", api_error)
+            
+            # Rút ngắn prompt
+            if len(prompt) > 200:
+                prompt = prompt[:200]
+            
+            space_payload = {
+                "data": [
+                    prompt,
+                    20,  # steps
+                    7.5,  # guidance_scale
+                    1024,  # width
+                    1024,  # height
+                    "DPMSolverMultistepScheduler"  # scheduler
+                ]
+            }
+            
+            for space_url in self.HF_SPACE_URLS:
+                try:
+                    # Thử với API endpoint của space
+                    response = self._http.post(f"{space_url}/api/predict", json=space_payload, timeout=60)
+                    response.raise_for_status()
+                    
+                    result = response.json()
+                    
+                    if 'data' in result and len(result['data']) > 0:
+                        # Lấy ảnh từ base64
+                        image_data = base64.b64decode(result['data'][0])
+                        
+                        _write_bytes_atomic(output_path, image_data)
+                        
+                        logger.info(f"Image saved to: {output_path}")
+                        return output_path
+                    
+                except Exception as space_error:
+                    logger.warning("Hugging Face Space %s failed: %s", space_url, space_error)
+                    continue
+            
+            raise Exception("All Hugging Face Spaces failed")
             
         except Exception as e:
             logger.error(f"Error generating Hugging Face Space image: {e}")
@@ -793,29 +1589,21 @@ class ImageGenerator:
     def _generate_picsum_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh placeholder đẹp bằng Picsum Photos API"""
         try:
-            logger.info(f"Generating placeholder image with Picsum: {prompt[:50]}...")
+            logger.info("Generating placeholder image with Picsum: %.50s...", prompt)
             
             # Parse size
-            width, height = 1024, 1024
-            if 'x' in size:
-                try:
-                    width, height = map(int, size.split('x'))
-                except:
-                    width, height = 1024, 1024
+            width, height = _parse_size(size)
             
             # Tạo seed từ prompt để có ảnh nhất quán
-            import hashlib
-            seed = int(hashlib.md5(prompt.encode()).hexdigest()[:8], 16) % 1000
+            seed = int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=4).digest(), 'big') % 1000
             
             # Picsum API với seed để có ảnh nhất quán
             url = f"https://picsum.photos/seed/{seed}/{width}/{height}"
             
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-            
-            # Lưu ảnh
-            with open(output_path, 'wb') as f:
-                f.write(response.content)
+            # Lưu ảnh (stream thẳng ra file)
+            with self._http.get(url, timeout=15, stream=True) as response:
+                response.raise_for_status()
+                self._stream_response_to_file(response, output_path)
             
             logger.info(f"Placeholder image saved to: {output_path}")
             return output_path
@@ -824,83 +1612,155 @@ class ImageGenerator:
             logger.error(f"Error generating Picsum image: {e}")
             raise
     
+    LEONARDO_API_URL = "https://cloud.leonardo.ai/api/rest/v1/generations"
+    
     def _generate_leonardo_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Leonardo AI (miễn phí với giới hạn)"""
         try:
-            logger.info(f"Generating image with Leonardo AI: {prompt[:50]}...")
-            
-            # Leonardo AI API (miễn phí với giới hạn)
-            api_url = "https://cloud.leonardo.ai/api/rest/v1/generations"
-            
-            # Rút ngắn prompt
-            if len(prompt) > 200:
-                prompt = prompt[:200]
+            logger.info("Generating image with Leonardo AI: %.50s...", prompt)
+            generation_id, headers = self._leonardo_submit(prompt)
             
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}" if self.api_key else ""
-            }
+            # Chờ ảnh được tạo (tối đa khoảng 3 phút)
+            for delay in self._poll_delays():
+                time.sleep(delay)
+                result_path = self._leonardo_check(generation_id, headers, output_path)
+                if result_path:
+                    return result_path
             
-            payload = {
-                "prompt": prompt,
-                "negative_prompt": "blurry, low quality, distorted",
-                "modelId": "6bef9f1b-29cb-40c7-b9df-32b51c1f67d3",  # Leonardo Diffusion XL
-                "width": 1024,
-                "height": 1024,
-                "num_images": 1,
-                "guidance_scale": 7,
-                "steps": 20
-            }
+            raise Exception("Leonardo AI generation timeout")
             
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
-            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Error generating Leonardo AI image: {e}")
+            raise
+    
+    async def _agenerate_leonardo_image(self, prompt: str, output_path: str, size: str) -> str:
+        """
+        Phiên bản async của _generate_leonardo_image
+        
+        Thời gian chờ giữa các lần kiểm tra dùng asyncio.sleep nên nhiều job Leonardo
+        chờ chồng lên nhau trên cùng event loop thay vì mỗi job giữ một thread.
+        """
+        try:
+            logger.info("Generating image with Leonardo AI (async): %.50s...", prompt)
+            generation_id, headers = await asyncio.to_thread(self._leonardo_submit, prompt)
             
-            result = response.json()
+            for delay in self._poll_delays():
+                await asyncio.sleep(delay)
+                result_path = await asyncio.to_thread(self._leonardo_check, generation_id, headers, output_path)
+                if result_path:
+                    return result_path
             
-            if 'sdGenerationJob' in result and 'generationId' in result['sdGenerationJob']:
-                generation_id = result['sdGenerationJob']['generationId']
-                
-                # Chờ ảnh được tạo
-                import time
-                for _ in range(30):  # Chờ tối đa 30 lần (khoảng 2-3 phút)
-                    time.sleep(5)
-                    
-                    check_url = f"https://cloud.leonardo.ai/api/rest/v1/generations/{generation_id}"
-                    check_response = requests.get(check_url, headers=headers, timeout=30)
-                    check_response.raise_for_status()
-                    
-                    check_result = check_response.json()
-                    
-                    if check_result.get('generations_by_pk', {}).get('status') == 'COMPLETE':
-                        images = check_result.get('generations_by_pk', {}).get('generated_images', [])
-                        if images:
-                            image_url = images[0].get('url')
-                            if image_url:
-                                # Tải ảnh
-                                img_response = requests.get(image_url, timeout=30)
-                                img_response.raise_for_status()
-                                
-                                with open(output_path, 'wb') as f:
-                                    f.write(img_response.content)
-                                
-                                logger.info(f"Image saved to: {output_path}")
-                                return output_path
-                        break
-                    elif check_result.get('generations_by_pk', {}).get('status') == 'FAILED':
-                        raise Exception("Leonardo AI generation failed")
-                
-                raise Exception("Leonardo AI generation timeout")
-            else:
-                raise Exception("No generation ID returned from Leonardo AI")
+            raise Exception("Leonardo AI generation timeout")
             
         except Exception as e:
             logger.error(f"Error generating Leonardo AI image: {e}")
             raise
     
+    async def agenerate_leonardo_batch(self, prompts: List[str], output_dir: str = "outputs/images",
+                                       prefix: str = "scene", size: str = "1024x1024",
+                                       max_concurrency: int = 8) -> List[Union[str, BaseException]]:
+        """
+        Tạo nhiều ảnh Leonardo AI song song (các job chờ trên cùng event loop)
+        
+        Args:
+            prompts: Danh sách các prompt
+            output_dir: Thư mục lưu ảnh
+            prefix: Tiền tố tên file
+            size: Kích thước ảnh
+            max_concurrency: Số job Leonardo chạy đồng thời tối đa
+            
+        Returns:
+            List: Đường dẫn ảnh hoặc exception cho từng prompt, theo đúng thứ tự prompts
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate_one(i: int, prompt: str) -> str:
+            async with semaphore:
+                output_path = os.path.join(output_dir, f"{prefix}_{i+1:02d}.png")
+                return await self._agenerate_leonardo_image(prompt, output_path, size)
+        
+        return await asyncio.gather(
+            *(generate_one(i, prompt) for i, prompt in enumerate(prompts)),
+            return_exceptions=True
+        )
+    
+    @staticmethod
+    def _poll_delays(timeout: float = 180.0, initial: float = 1.0, cap: float = 8.0) -> Iterator[float]:
+        """
+        Thời gian chờ giữa các lần kiểm tra job: bắt đầu 1s, tăng dần x1.6 (có jitter) tới tối đa 8s
+        
+        Job xong nhanh được phát hiện sớm, job chậm không bị poll dày; dừng khi quá timeout giây.
+        """
+        deadline = time.monotonic() + timeout
+        delay = initial
+        while time.monotonic() < deadline:
+            yield delay + random.random() * 0.3
+            delay = min(delay * 1.6, cap)
+    
+    def _leonardo_submit(self, prompt: str) -> Tuple[str, Dict[str, str]]:
+        """
+        Gửi job tạo ảnh lên Leonardo AI
+        
+        Returns:
+            Tuple[str, Dict[str, str]]: (generation_id, headers dùng cho các request kiểm tra)
+        """
+        # Rút ngắn prompt
+        if len(prompt) > 200:
+            prompt = prompt[:200]
+        
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}" if self.api_key else ""
+        }
+        
+        payload = {**self.PAYLOAD_TEMPLATES["leonardo"], "prompt": prompt, "width": 1024, "height": 1024}
+        
+        response = self._http.post(self.LEONARDO_API_URL, headers=headers, json=payload, timeout=60)
+        response.raise_for_status()
+        
+        result = response.json()
+        
+        if 'sdGenerationJob' in result and 'generationId' in result['sdGenerationJob']:
+            return result['sdGenerationJob']['generationId'], headers
+        raise Exception("No generation ID returned from Leonardo AI")
+    
+    def _leonardo_check(self, generation_id: str, headers: Dict[str, str], output_path: str) -> Optional[str]:
+        """
+        Kiểm tra trạng thái job Leonardo một lần, tải ảnh về khi đã xong
+        
+        Returns:
+            Optional[str]: output_path nếu đã tải ảnh, None nếu job chưa xong
+        """
+        check_url = f"{self.LEONARDO_API_URL}/{generation_id}"
+        check_response = self._http.get(check_url, headers=headers, timeout=30)
+        check_response.raise_for_status()
+        
+        generation = check_response.json().get('generations_by_pk', {})
+        status = generation.get('status')
+        
+        if status == 'COMPLETE':
+            images = generation.get('generated_images', [])
+            image_url = images[0].get('url') if images else None
+            if not image_url:
+                raise Exception("Leonardo AI generation completed without an image")
+            
+            # Tải ảnh
+            with self._http.get(image_url, timeout=30, stream=True) as img_response:
+                img_response.raise_for_status()
+                self._stream_response_to_file(img_response, output_path)
+            
+            logger.info(f"Image saved to: {output_path}")
+            return output_path
+        elif status == 'FAILED':
+            raise Exception("Leonardo AI generation failed")
+        
+        return None
+    
     def _generate_playground_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Playground AI (miễn phí)"""
         try:
-            logger.info(f"Generating image with Playground AI: {prompt[:50]}...")
+            logger.info("Generating image with Playground AI: %.50s...", prompt)
             
             # Playground AI API (miễn phí)
             api_url = "https://api.playgroundai.com/v1/images/generations"
@@ -914,19 +1774,9 @@ class ImageGenerator:
                 "Authorization": f"Bearer {self.api_key}" if self.api_key else ""
             }
             
-            payload = {
-                "prompt": prompt,
-                "negative_prompt": "blurry, low quality, distorted",
-                "model": "playground-v2.5-1024px-aesthetic",
-                "width": 1024,
-                "height": 1024,
-                "num_images": 1,
-                "guidance_scale": 3.5,
-                "steps": 20,
-                "seed": None
-            }
+            payload = {**self.PAYLOAD_TEMPLATES["playground"], "prompt": prompt, "width": 1024, "height": 1024}
             
-            response = requests.post(api_url, headers=headers, json=payload, timeout=60)
+            response = self._http.post(api_url, headers=headers, json=payload, timeout=60)
             response.raise_for_status()
             
             result = response.json()
@@ -934,12 +1784,10 @@ class ImageGenerator:
             if 'data' in result and len(result['data']) > 0:
                 image_url = result['data'][0].get('url')
                 if image_url:
-                    # Tải ảnh
-                    img_response = requests.get(image_url, timeout=30)
-                    img_response.raise_for_status()
-                    
-                    with open(output_path, 'wb') as f:
-                        f.write(img_response.content)
+                    # Tải ảnh (stream thẳng ra file)
+                    with self._http.get(image_url, timeout=30, stream=True) as img_response:
+                        img_response.raise_for_status()
+                        self._stream_response_to_file(img_response, output_path)
                     
                     logger.info(f"Image saved to: {output_path}")
                     return output_path
@@ -955,32 +1803,17 @@ class ImageGenerator:
     def _generate_local_sd_image(self, prompt: str, output_path: str, size: str) -> str:
         """Tạo ảnh bằng Local Stable Diffusion WebUI API"""
         try:
-            logger.info(f"Generating image with Local Stable Diffusion: {prompt[:50]}...")
+            logger.info("Generating image with Local Stable Diffusion: %.50s...", prompt)
             
             # Local Stable Diffusion WebUI API
             api_url = "http://127.0.0.1:7860/sdapi/v1/txt2img"
             
             # Parse size
-            width, height = 1024, 1024
-            if 'x' in size:
-                try:
-                    width, height = map(int, size.split('x'))
-                except:
-                    width, height = 1024, 1024
+            width, height = _parse_size(size)
             
-            payload = {
-                "prompt": prompt,
-                "negative_prompt": "blurry, low quality, distorted, bad anatomy",
-                "width": width,
-                "height": height,
-                "steps": 20,
-                "cfg_scale": 7,
-                "sampler_name": "DPM++ 2M Karras",
-                "batch_size": 1,
-                "n_iter": 1
-            }
+            payload = {**self.PAYLOAD_TEMPLATES["local_sd"], "prompt": prompt, "width": width, "height": height}
             
-            response = requests.post(api_url, json=payload, timeout=120)
+            response = self._http.post(api_url, json=payload, timeout=120)
             response.raise_for_status()
             
             result = response.json()
@@ -989,8 +1822,7 @@ class ImageGenerator:
                 import base64
                 image_data = base64.b64decode(result['images'][0])
                 
-                with open(output_path, 'wb') as f:
-                    f.write(image_data)
+                _write_bytes_atomic(output_path, image_data)
                 
                 logger.info(f"Image saved to: {output_path}")
                 return output_path
@@ -1001,66 +1833,9 @@ class ImageGenerator:
             logger.error(f"Error generating Local Stable Diffusion image: {e}")
             raise
     
-    def _generate_huggingface_space_image(self, prompt: str, output_path: str, size: str) -> str:
-        """Tạo ảnh bằng Hugging Face Space API (miễn phí)"""
-        try:
-            logger.info(f"Generating image with Hugging Face Space: {prompt[:50]}...")
-            
-            # Hugging Face Space API endpoints (miễn phí)
-            space_urls = [
-                "https://huggingface.co/spaces/stabilityai/stable-diffusion",
-                "https://huggingface.co/spaces/runwayml/stable-diffusion-v1-5",
-                "https://huggingface.co/spaces/CompVis/stable-diffusion-v1-4"
-            ]
-            
-            # Rút ngắn prompt
-            if len(prompt) > 200:
-                prompt = prompt[:200]
-            
-            for space_url in space_urls:
-                try:
-                    # Thử với API endpoint của space
-                    api_url = f"{space_url}/api/predict"
-                    
-                    payload = {
-                        "data": [
-                            prompt,
-                            20,  # steps
-                            7.5,  # guidance_scale
-                            1024,  # width
-                            1024,  # height
-                            "DPMSolverMultistepScheduler"  # scheduler
-                        ]
-                    }
-                    
-                    response = requests.post(api_url, json=payload, timeout=60)
-                    response.raise_for_status()
-                    
-                    result = response.json()
-                    
-                    if 'data' in result and len(result['data']) > 0:
-                        # Lấy ảnh từ base64
-                        import base64
-                        image_data = base64.b64decode(result['data'][0])
-                        
-                        with open(output_path, 'wb') as f:
-                            f.write(image_data)
-                        
-                        logger.info(f"Image saved to: {output_path}")
-                        return output_path
-                    
-                except Exception as space_error:
-                    logger.warning(f"Hugging Face Space {space_url} failed: {space_error}")
-                    continue
-            
-            raise Exception("All Hugging Face Spaces failed")
-            
-        except Exception as e:
-            logger.error(f"Error generating Hugging Face Space image: {e}")
-            raise
-    
     def generate_batch_images(self, prompts: List[str], output_dir: str = "outputs/images",
-                            prefix: str = "scene", **kwargs) -> List[str]:
+                            prefix: str = "scene", max_workers: int = 4,
+                            requests_per_second: float = 1.0, **kwargs) -> List[str]:
         """
         Tạo nhiều ảnh cùng lúc
         
@@ -1068,48 +1843,51 @@ class ImageGenerator:
             prompts: Danh sách các prompt
             output_dir: Thư mục lưu ảnh
             prefix: Tiền tố tên file
+            max_workers: Số ảnh tạo song song tối đa
+            requests_per_second: Giới hạn số request bắt đầu mỗi giây (tránh rate limit)
             **kwargs: Các tham số khác cho generate_image
             
         Returns:
-            List[str]: Danh sách đường dẫn các ảnh đã tạo
+            List[str]: Danh sách đường dẫn các ảnh đã tạo (đúng thứ tự prompts)
         """
         os.makedirs(output_dir, exist_ok=True)
-        image_paths = []
+        limiter = _RateLimiter(requests_per_second)
         
-        for i, prompt in enumerate(prompts):
+        def generate_one(i: int, prompt: str) -> Optional[str]:
             output_path = os.path.join(output_dir, f"{prefix}_{i+1:02d}.png")
+            limiter.acquire()
+            return self._generate_batch_item(i, len(prompts), prompt, output_path, **kwargs)
+        
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="image-batch") as executor:
+            results = list(executor.map(generate_one, range(len(prompts)), prompts))
+        
+        return [path for path in results if path is not None]
+    
+    def _generate_batch_item(self, i: int, total: int, prompt: str, output_path: str, **kwargs) -> Optional[str]:
+        """Tạo một ảnh trong batch, lỗi thì thay bằng placeholder (None nếu không tạo được gì)"""
+        try:
+            path = self.generate_image(prompt, output_path, **kwargs)
+            logger.info(f"Generated image {i+1}/{total}")
+            return path
             
+        except Exception as e:
+            logger.error(f"Failed to generate image {i+1}: {e}")
+            # Tạo ảnh placeholder
             try:
-                path = self.generate_image(prompt, output_path, **kwargs)
-                image_paths.append(path)
-                logger.info(f"Generated image {i+1}/{len(prompts)}")
-                
-                # Nghỉ giữa các request để tránh rate limit và quá tải
-                if i < len(prompts) - 1:
-                    time.sleep(3)  # Tăng delay lên 3s
-                    
-            except Exception as e:
-                logger.error(f"Failed to generate image {i+1}: {e}")
-                # Tạo ảnh placeholder
+                self._create_placeholder_image(prompt, output_path, "1024x1024")
+                logger.info(f"Created placeholder image {i+1}")
+                return output_path
+            except Exception as placeholder_error:
+                logger.error(f"Failed to create placeholder image {i+1}: {placeholder_error}")
+                # Tạo ảnh đơn giản nhất
                 try:
-                    self._create_placeholder_image(prompt, output_path, "1024x1024")
-                    image_paths.append(output_path)
-                    logger.info(f"Created placeholder image {i+1}")
-                except Exception as placeholder_error:
-                    logger.error(f"Failed to create placeholder image {i+1}: {placeholder_error}")
-                    # Tạo ảnh đơn giản nhất
-                    try:
-                        from PIL import Image
-                        img = Image.new('RGB', (1024, 1024), color='#34495e')
-                        img.save(output_path, 'PNG')
-                        image_paths.append(output_path)
-                        logger.info(f"Created simple fallback image {i+1}")
-                    except Exception as final_error:
-                        logger.error(f"Failed to create any image {i+1}: {final_error}")
-                        # Bỏ qua ảnh này
-                        continue
-        
-        return image_paths
+                    _write_fallback_image(output_path)
+                    logger.info(f"Created simple fallback image {i+1}")
+                    return output_path
+                except Exception as final_error:
+                    logger.error(f"Failed to create any image {i+1}: {final_error}")
+                    # Bỏ qua ảnh này
+                    return None
     
     
     def resize_image(self, image_path: str, target_size: tuple = (1024, 1024)) -> str:
@@ -1124,17 +1902,21 @@ class ImageGenerator:
             str: Đường dẫn ảnh đã resize
         """
         try:
+            from PIL import ImageOps
+            
             with Image.open(image_path) as img:
-                # Resize với aspect ratio
-                img.thumbnail(target_size, Image.Resampling.LANCZOS)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
                 
-                # Tạo ảnh mới với background trắng
-                new_img = Image.new('RGB', target_size, 'white')
-                
-                # Paste ảnh vào giữa
-                x = (target_size[0] - img.width) // 2
-                y = (target_size[1] - img.height) // 2
-                new_img.paste(img, (x, y))
+                if img.width > target_size[0] or img.height > target_size[1]:
+                    # Resize giữ aspect ratio + căn giữa trên nền trắng trong một bước
+                    new_img = ImageOps.pad(img, target_size, method=_RESAMPLE_LANCZOS, color='white')
+                else:
+                    # Ảnh nhỏ hơn khung: không phóng to, chỉ paste vào giữa nền trắng
+                    new_img = Image.new('RGB', target_size, 'white')
+                    x = (target_size[0] - img.width) // 2
+                    y = (target_size[1] - img.height) // 2
+                    new_img.paste(img, (x, y))
                 
                 # Lưu ảnh mới
                 base, ext = os.path.splitext(image_path)
@@ -1187,20 +1969,22 @@ if __name__ == "__main__":
 
 # ==================== BASE64 UTILITIES ====================
 
-def image_to_base64(image_path: str) -> str:
+def image_to_base64(image: Union[str, bytes]) -> str:
     """
     Chuyển đổi ảnh thành Base64 string
     
     Args:
-        image_path: Đường dẫn file ảnh
+        image: Đường dẫn file ảnh, hoặc bytes của ảnh đã đọc sẵn (không đọc lại file)
         
     Returns:
         str: Chuỗi Base64 của ảnh
     """
     try:
-        with open(image_path, "rb") as f:
-            encoded = base64.b64encode(f.read()).decode("utf-8")
-        logger.info(f"Image converted to Base64: {image_path}")
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return base64.b64encode(image).decode("ascii")
+        with open(image, "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        logger.info(f"Image converted to Base64: {image}")
         return encoded
     except Exception as e:
         logger.error(f"Error converting image to Base64: {e}")
@@ -1220,8 +2004,7 @@ def base64_to_image(b64_string: str, output_path: str) -> str:
     """
     try:
         data = base64.b64decode(b64_string)
-        with open(output_path, "wb") as f:
-            f.write(data)
+        _write_bytes_atomic(output_path, data)
         logger.info(f"Base64 converted to image: {output_path}")
         return output_path
     except Exception as e:
@@ -1229,31 +2012,69 @@ def base64_to_image(b64_string: str, output_path: str) -> str:
         raise
 
 
-def get_image_base64_info(image_path: str) -> Dict:
+# Color type PNG (bit depth 8) -> mode của Pillow
+_PNG_MODES = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+# Số component trong SOF của JPEG -> mode của Pillow
+_JPEG_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+
+
+def _image_header_info(data: bytes) -> Tuple[int, int, str, str]:
+    """
+    Đọc (width, height, format, mode) từ header PNG/JPEG mà không dựng đối tượng Pillow
+    
+    Định dạng khác (hoặc header không đọc được) thì fallback về Image.open.
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR' and len(data) >= 26 and data[24] == 8:
+        mode = _PNG_MODES.get(data[25])
+        if mode:
+            return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big"), "PNG", mode
+    elif data[:2] == b'\xff\xd8':
+        # Duyệt các marker tới SOF (C0-CF, trừ DHT C4, JPG C8, DAC CC)
+        pos = 2
+        while pos + 9 < len(data) and data[pos] == 0xFF:
+            marker = data[pos + 1]
+            if marker == 0xFF:  # Byte đệm
+                pos += 1
+                continue
+            segment_length = int.from_bytes(data[pos + 2:pos + 4], "big")
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                mode = _JPEG_MODES.get(data[pos + 9])
+                if mode:
+                    height = int.from_bytes(data[pos + 5:pos + 7], "big")
+                    width = int.from_bytes(data[pos + 7:pos + 9], "big")
+                    return width, height, "JPEG", mode
+                break
+            pos += 2 + segment_length
+    
+    with Image.open(io.BytesIO(data)) as img:
+        return img.width, img.height, img.format, img.mode
+
+
+def get_image_base64_info(image_path: str, include_base64: bool = False) -> Dict:
     """
     Lấy thông tin chi tiết về ảnh Base64
     
     Args:
         image_path: Đường dẫn file ảnh
+        include_base64: Trả thêm chuỗi Base64 đầy đủ ở key "base64"
         
     Returns:
         Dict: Thông tin về ảnh và Base64
     """
     try:
-        # Lấy thông tin file
-        file_size = os.path.getsize(image_path)
+        # Đọc file một lần, kích thước / header ảnh / Base64 đều lấy từ cùng buffer
+        with open(image_path, "rb") as f:
+            data = f.read()
+        file_size = len(data)
         
         # Lấy thông tin ảnh
-        with Image.open(image_path) as img:
-            width, height = img.size
-            format_name = img.format
-            mode = img.mode
+        width, height, format_name, mode = _image_header_info(data)
         
-        # Chuyển đổi Base64
-        b64_string = image_to_base64(image_path)
-        b64_size = len(b64_string)
+        # Kích thước Base64 tính trực tiếp (4 ký tự cho mỗi 3 byte), preview chỉ cần 75 byte đầu
+        b64_size = 4 * ((file_size + 2) // 3)
+        preview = base64.b64encode(data[:75]).decode("ascii")
         
-        return {
+        info = {
             "file_path": image_path,
             "file_size_bytes": file_size,
             "file_size_mb": round(file_size / (1024 * 1024), 2),
@@ -1263,8 +2084,11 @@ def get_image_base64_info(image_path: str) -> Dict:
             "image_mode": mode,
             "base64_size": b64_size,
             "base64_size_mb": round(b64_size / (1024 * 1024), 2),
-            "base64_preview": b64_string[:100] + "..." if len(b64_string) > 100 else b64_string
+            "base64_preview": preview + "..." if b64_size > 100 else preview
         }
+        if include_base64:
+            info["base64"] = image_to_base64(data)
+        return info
     except Exception as e:
         logger.error(f"Error getting image Base64 info: {e}")
         return {"error": str(e)}
@@ -1291,6 +2115,29 @@ def save_base64_to_file(b64_string: str, output_file: str) -> str:
         raise
 
 
+def encode_file_to_base64(image_path: str, output_file: str) -> str:
+    """
+    Mã hóa Base64 file ảnh thẳng ra file text theo từng khối (không giữ cả chuỗi Base64 trong RAM)
+    
+    Args:
+        image_path: Đường dẫn file ảnh
+        output_file: Đường dẫn file text
+        
+    Returns:
+        str: Đường dẫn file đã lưu
+    """
+    chunk_size = 48 * 1024  # Chia hết cho 3 nên các khối Base64 nối liền không có padding giữa chừng
+    try:
+        with open(image_path, "rb") as fi, open(output_file, "wb") as fo:
+            while chunk := fi.read(chunk_size):
+                fo.write(base64.b64encode(chunk))
+        logger.info(f"Base64 saved to file: {output_file}")
+        return output_file
+    except Exception as e:
+        logger.error(f"Error saving Base64 to file: {e}")
+        raise
+
+
 def load_base64_from_file(file_path: str) -> str:
     """
     Đọc chuỗi Base64 từ file text
@@ -1334,7 +2181,7 @@ def batch_images_to_base64(image_paths: List[str], output_dir: str = "outputs/ba
                 # Lưu Base64 vào file
                 base64_filename = f"image_{i+1:02d}_base64.txt"
                 base64_filepath = os.path.join(output_dir, base64_filename)
-                save_base64_to_file(info["base64_preview"], base64_filepath)
+                encode_file_to_base64(image_path, base64_filepath)
                 
                 info["base64_file"] = base64_filepath
                 results.append(info)
@@ -1382,7 +2229,7 @@ class EnhancedImageGenerator(ImageGenerator):
                 
                 base64_filename = os.path.splitext(os.path.basename(output_path))[0] + "_base64.txt"
                 base64_filepath = os.path.join(base64_dir, base64_filename)
-                save_base64_to_file(base64_info["base64_preview"], base64_filepath)
+                encode_file_to_base64(image_path, base64_filepath)
                 
                 base64_info["base64_file"] = base64_filepath
             
@@ -1393,7 +2240,8 @@ class EnhancedImageGenerator(ImageGenerator):
             return {"error": str(e)}
     
     def generate_batch_images_with_base64(self, prompts: List[str], output_dir: str = "outputs/images",
-                                        prefix: str = "scene", **kwargs) -> List[Dict]:
+                                        prefix: str = "scene", max_workers: int = 4,
+                                        requests_per_second: float = 1.0, **kwargs) -> List[Dict]:
         """
         Tạo nhiều ảnh với Base64 cùng lúc
         
@@ -1401,27 +2249,26 @@ class EnhancedImageGenerator(ImageGenerator):
             prompts: Danh sách prompt
             output_dir: Thư mục lưu ảnh
             prefix: Tiền tố tên file
+            max_workers: Số ảnh tạo song song tối đa
+            requests_per_second: Giới hạn số request bắt đầu mỗi giây (tránh rate limit)
             **kwargs: Các tham số khác
             
         Returns:
-            List[Dict]: Danh sách thông tin ảnh bao gồm Base64
+            List[Dict]: Danh sách thông tin ảnh bao gồm Base64 (đúng thứ tự prompts)
         """
         os.makedirs(output_dir, exist_ok=True)
-        results = []
+        limiter = _RateLimiter(requests_per_second)
         
-        for i, prompt in enumerate(prompts):
+        def generate_one(i: int, prompt: str) -> Dict:
             try:
                 output_path = os.path.join(output_dir, f"{prefix}_{i+1:02d}.png")
+                limiter.acquire()
                 result = self.generate_image_with_base64(prompt, output_path, **kwargs)
-                results.append(result)
                 logger.info(f"Generated image with Base64 {i+1}/{len(prompts)}")
-                
-                # Nghỉ giữa các request để tránh quá tải
-                if i < len(prompts) - 1:
-                    time.sleep(3)  # Tăng delay lên 3s
-                    
+                return result
             except Exception as e:
                 logger.error(f"Failed to generate image with Base64 {i+1}: {e}")
-                results.append({"error": f"Image {i+1} error: {str(e)}"})
+                return {"error": f"Image {i+1} error: {str(e)}"}
         
-        return results
+        with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="image-batch") as executor:
+            return list(executor.map(generate_one, range(len(prompts)), prompts))
@@ -4,38 +4,385 @@ Tạo chuyển động từ ảnh tĩnh sử dụng các API AI
 """
 
 import os
+import asyncio
+import contextlib
 import requests
-import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import hashlib
+import functools
+import mmap
+import shutil
+import random
+import subprocess
+import tempfile
+import threading
 import time
 import logging
-from typing import Optional, List, Dict, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Tuple, Union, Iterable
 from PIL import Image
 import io
 from .api_manager import api_manager
 
+try:
+    import pybase64 as base64  # SIMD base64, cùng API với base64 chuẩn
+except ImportError:
+    import base64
+
 logger = logging.getLogger(__name__)
 
+
+# Cạnh dài tối đa của ảnh gửi lên provider (các provider tự downscale về cỡ này)
+_UPLOAD_MAX_SIDE = 1280
+
+_RESAMPLE_LANCZOS = getattr(Image, "Resampling", Image).LANCZOS
+
+
+def _prepare_image(image_path: str, max_side: int = _UPLOAD_MAX_SIDE) -> Optional[bytes]:
+    """
+    Thu nhỏ ảnh quá lớn trước khi upload
+    
+    Args:
+        image_path: Đường dẫn ảnh
+        max_side: Cạnh dài tối đa (px)
+        
+    Returns:
+        Optional[bytes]: JPEG (quality 90) đã thu nhỏ, hoặc None nếu ảnh đã đủ nhỏ
+        (khi đó dùng nguyên file gốc)
+    """
+    with Image.open(image_path) as img:
+        # Image.open chỉ đọc header nên kiểm tra kích thước rất rẻ
+        if max(img.size) <= max_side:
+            return None
+        img.thumbnail((max_side, max_side), _RESAMPLE_LANCZOS)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=90, optimize=True)
+    return buf.getvalue()
+
+
+def _encode_image_b64(image_path: str) -> Tuple[str, str]:
+    """
+    Encode ảnh sang base64 (str) để nhúng vào payload JSON
+    
+    Ảnh lớn hơn _UPLOAD_MAX_SIDE được thu nhỏ và encode lại thành JPEG trước. Ảnh
+    nhỏ được mmap nên base64 đọc thẳng từ page cache, không tạo thêm bản sao bytes
+    của cả file trong bộ nhớ.
+    
+    Returns:
+        Tuple[str, str]: (dữ liệu base64, MIME type)
+    """
+    prepared = _prepare_image(image_path)
+    if prepared is not None:
+        return base64.b64encode(prepared).decode('ascii'), "image/jpeg"
+    
+    mime_type = _guess_image_mime(image_path)
+    with open(image_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode('ascii'), mime_type
+
+
+def _poll_delay(attempt: int, base: float = 1.0, cap: float = 8.0,
+                retry_after: Optional[str] = None) -> float:
+    """
+    Thời gian chờ trước lần poll tiếp theo: exponential backoff (x2 tới cap) có jitter ±20%
+    
+    Nếu provider trả header Retry-After (số giây) thì dùng đúng giá trị đó.
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass  # Retry-After dạng HTTP-date: dùng backoff
+    return min(cap, base * 2 ** min(attempt, 6)) * random.uniform(0.8, 1.2)
+
+
+def _retry_after_of(error: Exception) -> Optional[str]:
+    """Header Retry-After của response gắn với lỗi HTTP (nếu có)"""
+    response = getattr(error, 'response', None)
+    return response.headers.get('Retry-After') if response is not None else None
+
+
+def _guess_image_mime(image_path: str) -> str:
+    """MIME type của ảnh theo phần mở rộng (mặc định image/png)"""
+    ext = os.path.splitext(image_path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        return "image/jpeg"
+    if ext == '.webp':
+        return "image/webp"
+    return "image/png"
+
+def _ken_burns_params(duration: float, width: int, height: int, fps: int = 24):
+    """
+    Tính trước tham số Ken Burns (zoom + pan) cho mọi frame của video placeholder
+    
+    Zoom từ 1.0 đến 1.15, pan ngang ±50px / dọc ±30px theo một chu kỳ sin/cos; vùng
+    crop được giới hạn trong ảnh đã zoom. Fade in/out 0.3s khi video dài hơn 1s.
+    
+    Returns:
+        Tuple: (zoom, crop_x, crop_y, fade) - mỗi phần tử là mảng numpy, một giá trị mỗi frame
+    """
+    import numpy as np
+    
+    t = np.arange(0, duration, 1.0 / fps)
+    phase = 2 * np.pi * t / duration
+    
+    # Tính toán zoom factor
+    zoom = 1.0 + 0.15 * (t / duration)
+    
+    # Tính toán pan offset (astype(int) cắt về 0 giống int())
+    pan_x = (50 * np.sin(phase)).astype(np.int64)  # Pan ngang
+    pan_y = (30 * np.cos(phase)).astype(np.int64)  # Pan dọc
+    
+    # Kích thước ảnh sau khi zoom và crop area
+    extra_w = (width * zoom).astype(np.int64) - width
+    extra_h = (height * zoom).astype(np.int64) - height
+    crop_x = np.clip(pan_x + extra_w // 2, 0, extra_w)
+    crop_y = np.clip(pan_y + extra_h // 2, 0, extra_h)
+    
+    if duration > 1:
+        fade = np.minimum(1.0, np.minimum(t, duration - t) / 0.3)
+    else:
+        fade = np.ones_like(t)
+    return zoom, crop_x, crop_y, fade
+
+
+# Encoder H.264 phần cứng đã thử và lỗi (không có GPU/driver) - không thử lại
+_FAILED_ENCODERS = set()
+
+
+@functools.lru_cache(maxsize=1)
+def _ffmpeg_exe() -> str:
+    """Đường dẫn ffmpeg: ưu tiên bản imageio-ffmpeg đi kèm moviepy, sau đó ffmpeg trong PATH"""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+
+@functools.lru_cache(maxsize=1)
+def _h264_encoders() -> Tuple[str, ...]:
+    """Các encoder H.264 theo thứ tự ưu tiên (h264_nvenc nếu ffmpeg có hỗ trợ, rồi libx264)"""
+    try:
+        result = subprocess.run([_ffmpeg_exe(), "-hide_banner", "-encoders"],
+                                capture_output=True, text=True, timeout=10)
+        if "h264_nvenc" in result.stdout:
+            return ("h264_nvenc", "libx264")
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return ("libx264",)
+
+
+def _encode_rgb_frames(frames: Iterable, width: int, height: int, output_path: str,
+                       fps: int = 24, bitrate: str = "2000k", encoder: str = "libx264"):
+    """
+    Ghi các frame RGB (numpy uint8, HxWx3) thành MP4 qua một tiến trình ffmpeg
+    
+    Frame được đẩy thẳng vào stdin của ffmpeg dạng rawvideo (ghi qua memoryview, không copy
+    sang bytes); frame phải C-contiguous.
+    
+    Raises:
+        RuntimeError: Nếu không chạy được ffmpeg hoặc ffmpeg trả lỗi (mọi lỗi pipe/OS đều quy về
+            RuntimeError để _write_video chuyển sang encoder khác)
+    """
+    command = [
+        _ffmpeg_exe(), "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+        "-i", "-", "-an",
+        "-c:v", encoder,
+    ]
+    if encoder == "libx264":
+        command += ["-preset", "veryfast"]
+    command += [
+        "-b:v", bitrate,
+        # yuv420p cần kích thước chẵn
+        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+        "-pix_fmt", "yuv420p",
+        output_path,
+    ]
+    
+    # stderr ghi ra file tạm thay vì pipe: không cần đọc song song trong lúc ghi stdin,
+    # ffmpeg log nhiều cũng không bị chặn vì pipe stderr đầy
+    with tempfile.TemporaryFile() as stderr_file:
+        try:
+            proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=stderr_file)
+        except OSError as e:
+            raise RuntimeError(f"ffmpeg ({encoder}) could not start: {e}") from e
+        
+        pipe_error = None
+        try:
+            for frame in frames:
+                proc.stdin.write(memoryview(frame).cast("B"))
+        except OSError as e:
+            # ffmpeg đã thoát: BrokenPipeError trên POSIX, OSError(EINVAL) trên Windows
+            pipe_error = e
+        finally:
+            try:
+                proc.stdin.close()  # flush phần còn trong buffer, cũng có thể gặp pipe đã đóng
+            except OSError as e:
+                pipe_error = pipe_error or e
+            proc.wait()
+        
+        if proc.returncode != 0 or pipe_error is not None:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode("utf-8", "replace").strip()
+            raise RuntimeError(f"ffmpeg ({encoder}) failed (exit {proc.returncode}): {stderr or pipe_error or 'no error output'}")
+
+
+def _write_video(make_frames, width: int, height: int, output_path: str,
+                 fps: int = 24, bitrate: str = "2000k"):
+    """
+    Encode video bằng encoder phần cứng nếu có, lỗi thì quay về libx264
+    
+    Args:
+        make_frames: Hàm không tham số trả về iterable frame mới (gọi lại khi đổi encoder)
+    """
+    encoders = [e for e in _h264_encoders() if e not in _FAILED_ENCODERS]
+    for encoder in encoders:
+        try:
+            _encode_rgb_frames(make_frames(), width, height, output_path, fps, bitrate, encoder)
+            return
+        except RuntimeError as e:
+            if encoder == encoders[-1]:
+                raise
+            logger.warning("%s không dùng được, chuyển sang encoder khác: %s", encoder, e)
+            _FAILED_ENCODERS.add(encoder)
+
+
+class MotionResult:
+    """
+    Video provider đã tạo nhưng chưa tải về (generate_motion(..., download=False))
+    
+    Dùng khi bước sau chỉ cần URL (vd. chuyển tiếp lên storage khác): không tải video
+    về rồi upload lại. Gọi download() để tải khi thực sự cần file local.
+    
+    Attributes:
+        provider: Provider đã tạo video
+        url: URL video của provider (None nếu video chỉ có ở local, vd. placeholder)
+        task_id: ID task của provider (nếu có)
+        path: Đường dẫn file local (có sau khi download() hoặc khi là video placeholder)
+    """
+    
+    def __init__(self, provider: str, url: Optional[str] = None, task_id: Optional[str] = None,
+                 path: Optional[str] = None, downloader=None):
+        self.provider = provider
+        self.url = url
+        self.task_id = task_id
+        self.path = path
+        self._downloader = downloader
+    
+    def download(self, output_path: str) -> str:
+        """
+        Tải video về output_path (copy nếu đã có file local)
+        
+        Returns:
+            str: output_path
+        """
+        output_dir = os.path.dirname(output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        if self.path:
+            if os.path.abspath(self.path) != os.path.abspath(output_path):
+                shutil.copyfile(self.path, output_path)
+        else:
+            self._downloader(self.url, output_path, self.provider)
+        self.path = output_path
+        return output_path
+    
+    def __repr__(self) -> str:
+        return f"MotionResult(provider={self.provider!r}, url={self.url!r}, task_id={self.task_id!r}, path={self.path!r})"
+
+
 class MotionGenerator:
     """
     Tạo chuyển động từ ảnh tĩnh
     """
     
-    def __init__(self, provider: str = "google_flow", api_key: Optional[str] = None):
+    CACHE_DIR = os.path.join("outputs", "cache", "motion")
+    CACHE_MAX_BYTES = 1024 * 1024 * 1024
+    
+    # Timeout (connect, read) giây cho request API và cho tải video - tránh treo vô hạn khi server không trả lời
+    API_TIMEOUT = (5, 60)
+    DOWNLOAD_TIMEOUT = (5, 300)
+    
+    # provider -> method tạo video tương ứng
+    PROVIDER_METHODS = {
+        "google_flow": "_generate_google_flow_motion",
+        "runwayml": "_generate_runwayml_motion",
+        "pika_labs": "_generate_pika_motion",
+        "leia_pix": "_generate_leia_motion",
+        "free": "_generate_free_motion",
+    }
+    
+    # Provider gọi API từ xa: worker chủ yếu chờ mạng. Provider còn lại encode video
+    # bằng ffmpeg trên máy nên batch bị giới hạn theo số CPU
+    REMOTE_PROVIDERS = frozenset(["google_flow", "runwayml", "pika_labs", "leia_pix"])
+    
+    # Prompt / cấu hình chuyển động theo motion_type của từng provider
+    GOOGLE_FLOW_MOTION_PROMPTS = {
+        "subtle": "Create a subtle, gentle motion effect",
+        "medium": "Create a moderate motion effect with some movement",
+        "strong": "Create a strong, dynamic motion effect"
+    }
+    RUNWAYML_MOTION_CONFIG = {
+        "subtle": {"motion_intensity": 0.3, "camera_motion": "subtle"},
+        "medium": {"motion_intensity": 0.6, "camera_motion": "medium"},
+        "strong": {"motion_intensity": 0.9, "camera_motion": "strong"}
+    }
+    PIKA_MOTION_PROMPTS = {
+        "subtle": "Subtle, gentle movement with soft camera motion",
+        "medium": "Moderate movement with smooth camera transitions",
+        "strong": "Dynamic movement with dramatic camera motion"
+    }
+    
+    def __init__(self, provider: str = "google_flow", api_key: Optional[str] = None,
+                 use_cache: bool = False):
         """
         Khởi tạo Motion Generator
         
         Args:
             provider: Provider để tạo chuyển động (google_flow, runwayml, pika_labs, leia_pix)
             api_key: API key (nếu không có sẽ lấy từ api_manager)
+            use_cache: Dùng lại video đã tạo cho cùng ảnh/tham số thay vì gọi API lại.
+                Mặc định tắt để mỗi lần tạo lại cho ra video mới
         """
         self.provider = provider.lower()
+        self.use_cache = use_cache
         self.api_key = api_key or api_manager.get_api_key(self.provider)
         
         if not self.api_key and self.provider not in ["free"]:
             raise ValueError(f"{self.provider.title()} API key is required. Set API key in config or pass api_key parameter.")
+        
+        # Session dùng chung: giữ kết nối keep-alive giữa các lần gửi/poll/tải video
+        # và tự retry khi gateway lỗi tạm thời (502/503/504)
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        
+        # Method của provider được chọn (None nếu provider không hỗ trợ - báo lỗi khi gọi)
+        method_name = self.PROVIDER_METHODS.get(self.provider)
+        self._provider_method = getattr(self, method_name) if method_name else None
+        
+        # Thời gian hoàn thành trung bình (giây, EWMA) của task theo provider - dùng để
+        # hẹn lần poll đầu tiên thay vì poll ngay khi task vừa gửi
+        self._completion_ewma = {"runwayml": 20.0, "pika_labs": 30.0}
+        
+        # output_path của các video placeholder tạo ra khi provider lỗi - không đưa vào cache
+        self._placeholder_outputs = set()
+    
+    def close(self):
+        """Đóng các kết nối đang giữ trong pool"""
+        self._session.close()
     
     def generate_motion(self, image_path: str, output_path: str, 
-                       motion_type: str = "subtle", duration: float = 3.0) -> str:
+                       motion_type: str = "subtle", duration: float = 3.0,
+                       download: bool = True) -> Union[str, MotionResult]:
         """
         Tạo chuyển động từ ảnh tĩnh
         
@@ -44,46 +391,163 @@ class MotionGenerator:
             output_path: Đường dẫn video đầu ra
             motion_type: Loại chuyển động (subtle, medium, strong)
             duration: Thời lượng video (giây)
+            download: False để không tải video của provider về output_path mà trả về
+                MotionResult chứa URL (gọi .download(path) khi cần file)
             
         Returns:
-            str: Đường dẫn file video đã tạo
+            str: Đường dẫn file video đã tạo (MotionResult nếu download=False)
         """
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
-        if self.provider == "google_flow":
-            return self._generate_google_flow_motion(image_path, output_path, motion_type, duration)
-        elif self.provider == "runwayml":
-            return self._generate_runwayml_motion(image_path, output_path, motion_type, duration)
-        elif self.provider == "pika_labs":
-            return self._generate_pika_motion(image_path, output_path, motion_type, duration)
-        elif self.provider == "leia_pix":
-            return self._generate_leia_motion(image_path, output_path, motion_type, duration)
-        elif self.provider == "free":
-            return self._generate_free_motion(image_path, output_path, motion_type, duration)
-        else:
+        cache_key = self._cache_key(image_path, motion_type, duration)
+        if cache_key and self._cache_restore(cache_key, output_path):
+            return output_path if download else MotionResult(self.provider, path=output_path)
+        
+        result = self._generate_motion_uncached(image_path, output_path, motion_type, duration, download)
+        if isinstance(result, MotionResult):
+            return result
+        if cache_key:
+            self._cache_store(cache_key, result)
+        return result if download else MotionResult(self.provider, path=result)
+    
+    def _generate_motion_uncached(self, image_path: str, output_path: str,
+                                  motion_type: str, duration: float,
+                                  download: bool = True) -> Union[str, MotionResult]:
+        """Gọi provider để tạo video (không qua cache)"""
+        if self._provider_method is None:
             raise ValueError(f"Unsupported provider: {self.provider}")
+        return self._provider_method(image_path, output_path, motion_type, duration, download)
+    
+    async def agenerate_motion(self, image_path: str, output_path: str,
+                               motion_type: str = "subtle", duration: float = 3.0) -> str:
+        """
+        Phiên bản async của generate_motion
+        
+        RunwayML/Pika Labs gửi request trong thread rồi chờ kết quả bằng asyncio.sleep,
+        nên nhiều video chờ chồng lên nhau trên cùng event loop; các provider khác
+        chạy nguyên hàm sync trong thread.
+        """
+        return await self._agenerate_motion(image_path, output_path, motion_type, duration)
+    
+    async def _agenerate_motion(self, image_path: str, output_path: str, motion_type: str,
+                                duration: float, upload_slot: Optional[asyncio.Semaphore] = None) -> str:
+        """
+        agenerate_motion với upload_slot tùy chọn
+        
+        upload_slot giới hạn số request gửi ảnh chạy cùng lúc (chỉ bao bước submit),
+        để ảnh kế tiếp upload trong khi các task trước đang chờ provider xử lý.
+        """
+        if self.provider not in ("runwayml", "pika_labs"):
+            return await asyncio.to_thread(self.generate_motion, image_path, output_path, motion_type, duration)
+        
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        cache_key = await asyncio.to_thread(self._cache_key, image_path, motion_type, duration)
+        if cache_key and await asyncio.to_thread(self._cache_restore, cache_key, output_path):
+            return output_path
+        
+        if self.provider == "runwayml":
+            result_path = await self._agenerate_runwayml_motion(image_path, output_path, motion_type, duration, upload_slot)
+        else:
+            result_path = await self._agenerate_pika_motion(image_path, output_path, motion_type, duration, upload_slot)
+        
+        if cache_key:
+            await asyncio.to_thread(self._cache_store, cache_key, result_path)
+        return result_path
+    
+    def _cache_key(self, image_path: str, motion_type: str, duration: float) -> Optional[str]:
+        """
+        Tạo cache key từ nội dung ảnh và tham số motion
+        
+        Returns:
+            Optional[str]: Key (hex), hoặc None nếu tắt cache / không đọc được ảnh
+        """
+        if not self.use_cache:
+            return None
+        try:
+            with open(image_path, 'rb') as f:
+                digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16))
+        except OSError:
+            return None
+        params = "\x1f".join([self.provider, motion_type or "", f"{round(duration, 2)}"])
+        digest.update(params.encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _cache_restore(self, cache_key: str, output_path: str) -> bool:
+        """Copy video từ cache ra output_path, trả về True nếu cache hit"""
+        cache_path = os.path.join(self.CACHE_DIR, f"{cache_key}.mp4")
+        if not os.path.isfile(cache_path):
+            return False
+        try:
+            shutil.copyfile(cache_path, output_path)
+            os.utime(cache_path)  # Đánh dấu vừa dùng cho LRU
+            logger.info("♻️ Motion cache hit: %s", output_path)
+            return True
+        except OSError as e:
+            logger.warning("⚠️ Không thể dùng video trong cache: %s", e)
+            return False
+    
+    def _cache_store(self, cache_key: str, video_path: str):
+        """Lưu video vừa tạo vào cache (bỏ qua video placeholder do provider lỗi)"""
+        if video_path in self._placeholder_outputs:
+            self._placeholder_outputs.discard(video_path)
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.CACHE_DIR, exist_ok=True)
+            cache_path = os.path.join(self.CACHE_DIR, f"{cache_key}.mp4")
+            # File tạm riêng cho mỗi lần lưu: nhiều worker thread có thể lưu cùng một key
+            with tempfile.NamedTemporaryFile(dir=self.CACHE_DIR, prefix=f"{cache_key}.",
+                                             suffix=".tmp", delete=False) as tmp_file:
+                tmp_path = tmp_file.name
+                with open(video_path, 'rb') as src:
+                    shutil.copyfileobj(src, tmp_file)
+            os.replace(tmp_path, cache_path)
+            self._cache_evict()
+        except OSError as e:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+            logger.warning("⚠️ Không thể lưu video vào cache: %s", e)
+    
+    def _cache_evict(self):
+        """Xóa video ít dùng nhất (theo thời gian truy cập) khi cache vượt CACHE_MAX_BYTES"""
+        entries = []
+        total = 0
+        with os.scandir(self.CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".mp4"):
+                    stat = entry.stat()
+                    entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+                    total += stat.st_size
+        
+        if total <= self.CACHE_MAX_BYTES:
+            return
+        
+        for _, file_size, path in sorted(entries):
+            try:
+                os.remove(path)
+                total -= file_size
+            except OSError:
+                continue
+            if total <= self.CACHE_MAX_BYTES:
+                break
     
     def _generate_google_flow_motion(self, image_path: str, output_path: str, 
-                                   motion_type: str, duration: float) -> str:
+                                   motion_type: str, duration: float, download: bool = True) -> str:
         """
-        Tạo chuyển động bằng Google Flow API
+        Tạo chuyển động bằng Google Flow API (hiện luôn tạo video placeholder local)
         """
         try:
             # Google Flow API endpoint (giả định - cần cập nhật khi có API chính thức)
             api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash-exp-image-generation:generateContent"
             
             # Đọc và encode ảnh
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
+            image_data, mime_type = _encode_image_b64(image_path)
             
             # Tạo prompt cho motion
-            motion_prompts = {
-                "subtle": "Create a subtle, gentle motion effect",
-                "medium": "Create a moderate motion effect with some movement",
-                "strong": "Create a strong, dynamic motion effect"
-            }
-            
-            prompt = motion_prompts.get(motion_type, motion_prompts["subtle"])
+            prompts = self.GOOGLE_FLOW_MOTION_PROMPTS
+            prompt = prompts.get(motion_type, prompts["subtle"])
             
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -96,7 +560,7 @@ class MotionGenerator:
                         "text": f"{prompt}. Duration: {duration} seconds. Create smooth, cinematic motion from this static image."
                     }, {
                         "inline_data": {
-                            "mime_type": "image/png",
+                            "mime_type": mime_type,
                             "data": image_data
                         }
                     }]
@@ -107,7 +571,7 @@ class MotionGenerator:
                 }
             }
             
-            response = requests.post(api_url, headers=headers, json=payload)
+            response = self._session.post(api_url, headers=headers, json=payload, timeout=self.API_TIMEOUT)
             response.raise_for_status()
             
             # Xử lý response (cần cập nhật theo API thực tế)
@@ -117,249 +581,338 @@ class MotionGenerator:
             return self._create_placeholder_motion_video(image_path, output_path, duration)
             
         except Exception as e:
-            logger.error(f"Error generating Google Flow motion: {e}")
+            logger.error("Error generating Google Flow motion: %s", e)
             return self._create_placeholder_motion_video(image_path, output_path, duration)
     
     def _generate_runwayml_motion(self, image_path: str, output_path: str, 
-                                motion_type: str, duration: float) -> str:
+                                motion_type: str, duration: float,
+                                download: bool = True) -> Union[str, MotionResult]:
         """
         Tạo chuyển động bằng RunwayML Gen-3 API (VEO3 style)
         """
         try:
-            # RunwayML Gen-3 API endpoint
-            api_url = "https://api.runwayml.com/v1/image_to_video"
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Đọc ảnh
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Cấu hình motion intensity
-            motion_config = {
-                "subtle": {"motion_intensity": 0.3, "camera_motion": "subtle"},
-                "medium": {"motion_intensity": 0.6, "camera_motion": "medium"},
-                "strong": {"motion_intensity": 0.9, "camera_motion": "strong"}
-            }
-            
-            config = motion_config.get(motion_type, motion_config["medium"])
-            
-            payload = {
-                "image": image_data,
-                "model": "gen3a_turbo",
-                "motion_intensity": config["motion_intensity"],
-                "camera_motion": config["camera_motion"],
-                "duration": min(duration, 10.0),  # RunwayML giới hạn 10s
-                "seed": None,  # Random seed
-                "aspect_ratio": "16:9"
-            }
-            
-            logger.info(f"Calling RunwayML API with motion_type: {motion_type}")
-            response = requests.post(api_url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"RunwayML response: {result}")
+            result = self._runwayml_submit(image_path, motion_type, duration)
             
             # Xử lý response
             if 'id' in result:
                 # Polling để lấy kết quả
                 task_id = result['id']
-                return self._poll_runwayml_result(task_id, output_path)
+                video_url = self._poll_runwayml_result(task_id)
             elif 'video_url' in result:
-                # Tải video trực tiếp
-                video_response = requests.get(result['video_url'])
-                video_response.raise_for_status()
-                
-                with open(output_path, 'wb') as f:
-                    f.write(video_response.content)
-                
-                logger.info(f"RunwayML motion video saved to: {output_path}")
-                return output_path
+                task_id, video_url = None, result['video_url']
             else:
                 raise Exception(f"No video URL or task ID in response: {result}")
+            
+            if not download:
+                return MotionResult("runwayml", url=video_url, task_id=task_id, downloader=self._download_video)
+            return self._download_video(video_url, output_path, "RunwayML")
                 
         except Exception as e:
-            logger.error(f"Error generating RunwayML motion: {e}")
+            logger.error("Error generating RunwayML motion: %s", e)
             return self._create_placeholder_motion_video(image_path, output_path, duration)
     
-    def _poll_runwayml_result(self, task_id: str, output_path: str, max_attempts: int = 30) -> str:
+    async def _agenerate_runwayml_motion(self, image_path: str, output_path: str,
+                                         motion_type: str, duration: float,
+                                         upload_slot: Optional[asyncio.Semaphore] = None) -> str:
+        """Phiên bản async của _generate_runwayml_motion"""
+        try:
+            async with upload_slot or contextlib.nullcontext():
+                result = await asyncio.to_thread(self._runwayml_submit, image_path, motion_type, duration)
+            
+            if 'id' in result:
+                video_url = await self._apoll_runwayml_result(result['id'])
+            elif 'video_url' in result:
+                video_url = result['video_url']
+            else:
+                raise Exception(f"No video URL or task ID in response: {result}")
+            
+            return await asyncio.to_thread(self._download_video, video_url, output_path, "RunwayML")
+                
+        except Exception as e:
+            logger.error("Error generating RunwayML motion: %s", e)
+            return await asyncio.to_thread(self._create_placeholder_motion_video, image_path, output_path, duration)
+    
+    def _runwayml_submit(self, image_path: str, motion_type: str, duration: float) -> Dict:
+        """Gửi ảnh lên RunwayML Gen-3 API, trả về response JSON (task id hoặc video_url)"""
+        # RunwayML Gen-3 API endpoint
+        api_url = "https://api.runwayml.com/v1/image_to_video"
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # Base64 của ảnh đã thu nhỏ (nếu quá lớn), giữ nguyên body JSON như các provider khác
+        image_data, _ = _encode_image_b64(image_path)
+        
+        # Cấu hình motion intensity
+        config = self.RUNWAYML_MOTION_CONFIG.get(motion_type, self.RUNWAYML_MOTION_CONFIG["medium"])
+        
+        # Không gửi seed để RunwayML tự chọn seed ngẫu nhiên
+        payload = {
+            "image": image_data,
+            "model": "gen3a_turbo",
+            "motion_intensity": config["motion_intensity"],
+            "camera_motion": config["camera_motion"],
+            "duration": min(duration, 10.0),  # RunwayML giới hạn 10s
+            "aspect_ratio": "16:9"
+        }
+        
+        logger.info("Calling RunwayML API with motion_type: %s", motion_type)
+        response = self._session.post(api_url, headers=headers, json=payload, timeout=self.API_TIMEOUT)
+        response.raise_for_status()
+        
+        result = response.json()
+        logger.info("RunwayML response: %s", result)
+        return result
+    
+    def _runwayml_check(self, task_id: str, attempt: int) -> Tuple[Optional[str], Optional[str]]:
         """
-        Polling kết quả từ RunwayML API
+        Kiểm tra task RunwayML một lần
+        
+        Returns:
+            Tuple: (URL video nếu task đã xong / None nếu vẫn đang chạy,
+                    header Retry-After của response nếu có)
         """
         api_url = f"https://api.runwayml.com/v1/tasks/{task_id}"
         headers = {"Authorization": f"Bearer {self.api_key}"}
         
+        response = self._session.get(api_url, headers=headers, timeout=self.API_TIMEOUT)
+        response.raise_for_status()
+        
+        result = response.json()
+        status = result.get('status', 'unknown')
+        
+        logger.info("RunwayML task %s status: %s (attempt %d)", task_id, status, attempt + 1)
+        
+        if status == 'SUCCEEDED':
+            if 'output' in result and 'video_url' in result['output']:
+                return result['output']['video_url'], None
+            else:
+                raise Exception("No video URL in successful response")
+                
+        elif status == 'FAILED':
+            error_msg = result.get('error', 'Unknown error')
+            raise Exception(f"RunwayML task failed: {error_msg}")
+            
+        elif status not in ['PENDING', 'RUNNING']:
+            logger.warning("Unknown status: %s", status)
+        return None, response.headers.get('Retry-After')
+    
+    def _first_poll_delay(self, provider: str) -> float:
+        """Thời gian chờ trước lần poll đầu tiên: 80% thời gian hoàn thành trung bình (EWMA) của provider"""
+        return 0.8 * self._completion_ewma[provider]
+    
+    def _record_completion(self, provider: str, elapsed: float):
+        """Cập nhật thời gian hoàn thành trung bình (EWMA) sau khi một task xong"""
+        self._completion_ewma[provider] = 0.7 * self._completion_ewma[provider] + 0.3 * elapsed
+    
+    def _poll_runwayml_result(self, task_id: str, max_attempts: int = 30) -> str:
+        """
+        Polling kết quả từ RunwayML API
+        
+        Returns:
+            str: URL video khi task hoàn thành
+        """
+        started = time.monotonic()
+        # Chưa poll cho tới khi task gần xong theo thời gian hoàn thành trung bình
+        time.sleep(self._first_poll_delay("runwayml"))
         for attempt in range(max_attempts):
             try:
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()
-                
-                result = response.json()
-                status = result.get('status', 'unknown')
-                
-                logger.info(f"RunwayML task {task_id} status: {status} (attempt {attempt + 1})")
-                
-                if status == 'SUCCEEDED':
-                    if 'output' in result and 'video_url' in result['output']:
-                        video_url = result['output']['video_url']
-                        
-                        # Tải video
-                        video_response = requests.get(video_url)
-                        video_response.raise_for_status()
-                        
-                        with open(output_path, 'wb') as f:
-                            f.write(video_response.content)
-                        
-                        logger.info(f"RunwayML motion video saved to: {output_path}")
-                        return output_path
-                    else:
-                        raise Exception("No video URL in successful response")
-                        
-                elif status == 'FAILED':
-                    error_msg = result.get('error', 'Unknown error')
-                    raise Exception(f"RunwayML task failed: {error_msg}")
-                    
-                elif status in ['PENDING', 'RUNNING']:
-                    time.sleep(5)  # Chờ 5 giây
-                    continue
-                else:
-                    logger.warning(f"Unknown status: {status}")
-                    time.sleep(5)
-                    continue
-                    
+                video_url, retry_after = self._runwayml_check(task_id, attempt)
+                if video_url:
+                    self._record_completion("runwayml", time.monotonic() - started)
+                    return video_url
+            except Exception as e:
+                logger.error("Error polling RunwayML result: %s", e)
+                if attempt == max_attempts - 1:
+                    raise
+                retry_after = _retry_after_of(e)
+            time.sleep(_poll_delay(attempt, cap=8.0, retry_after=retry_after))
+        
+        raise Exception("RunwayML task timeout")
+    
+    async def _apoll_runwayml_result(self, task_id: str, max_attempts: int = 30) -> str:
+        """Phiên bản async của _poll_runwayml_result (chờ bằng asyncio.sleep)"""
+        started = time.monotonic()
+        await asyncio.sleep(self._first_poll_delay("runwayml"))
+        for attempt in range(max_attempts):
+            try:
+                video_url, retry_after = await asyncio.to_thread(self._runwayml_check, task_id, attempt)
+                if video_url:
+                    self._record_completion("runwayml", time.monotonic() - started)
+                    return video_url
             except Exception as e:
-                logger.error(f"Error polling RunwayML result: {e}")
+                logger.error("Error polling RunwayML result: %s", e)
                 if attempt == max_attempts - 1:
                     raise
-                time.sleep(5)
+                retry_after = _retry_after_of(e)
+            await asyncio.sleep(_poll_delay(attempt, cap=8.0, retry_after=retry_after))
         
         raise Exception("RunwayML task timeout")
     
     def _generate_pika_motion(self, image_path: str, output_path: str, 
-                            motion_type: str, duration: float) -> str:
+                            motion_type: str, duration: float,
+                            download: bool = True) -> Union[str, MotionResult]:
         """
         Tạo chuyển động bằng Pika Labs API (VEO3 style)
         """
         try:
-            # Pika Labs API endpoint
-            api_url = "https://api.pika.art/v1/generate"
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Đọc ảnh
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Cấu hình motion prompts
-            motion_prompts = {
-                "subtle": "Subtle, gentle movement with soft camera motion",
-                "medium": "Moderate movement with smooth camera transitions",
-                "strong": "Dynamic movement with dramatic camera motion"
-            }
-            
-            prompt = motion_prompts.get(motion_type, motion_prompts["medium"])
-            
-            payload = {
-                "image": image_data,
-                "prompt": prompt,
-                "duration": min(duration, 4.0),  # Pika Labs giới hạn 4s
-                "style": "cinematic",
-                "aspect_ratio": "16:9",
-                "motion_intensity": motion_type,
-                "seed": None
-            }
-            
-            logger.info(f"Calling Pika Labs API with motion_type: {motion_type}")
-            response = requests.post(api_url, headers=headers, json=payload)
-            response.raise_for_status()
-            
-            result = response.json()
-            logger.info(f"Pika Labs response: {result}")
+            result = self._pika_submit(image_path, motion_type, duration)
             
             # Xử lý response
             if 'task_id' in result:
                 # Polling để lấy kết quả
                 task_id = result['task_id']
-                return self._poll_pika_result(task_id, output_path)
+                video_url = self._poll_pika_result(task_id)
             elif 'video_url' in result:
-                # Tải video trực tiếp
-                video_response = requests.get(result['video_url'])
-                video_response.raise_for_status()
-                
-                with open(output_path, 'wb') as f:
-                    f.write(video_response.content)
-                
-                logger.info(f"Pika Labs motion video saved to: {output_path}")
-                return output_path
+                task_id, video_url = None, result['video_url']
             else:
                 raise Exception(f"No video URL or task ID in response: {result}")
+            
+            if not download:
+                return MotionResult("pika_labs", url=video_url, task_id=task_id, downloader=self._download_video)
+            return self._download_video(video_url, output_path, "Pika Labs")
                 
         except Exception as e:
-            logger.error(f"Error generating Pika Labs motion: {e}")
+            logger.error("Error generating Pika Labs motion: %s", e)
             return self._create_placeholder_motion_video(image_path, output_path, duration)
     
-    def _poll_pika_result(self, task_id: str, output_path: str, max_attempts: int = 20) -> str:
+    async def _agenerate_pika_motion(self, image_path: str, output_path: str,
+                                     motion_type: str, duration: float,
+                                     upload_slot: Optional[asyncio.Semaphore] = None) -> str:
+        """Phiên bản async của _generate_pika_motion"""
+        try:
+            async with upload_slot or contextlib.nullcontext():
+                result = await asyncio.to_thread(self._pika_submit, image_path, motion_type, duration)
+            
+            if 'task_id' in result:
+                video_url = await self._apoll_pika_result(result['task_id'])
+            elif 'video_url' in result:
+                video_url = result['video_url']
+            else:
+                raise Exception(f"No video URL or task ID in response: {result}")
+            
+            return await asyncio.to_thread(self._download_video, video_url, output_path, "Pika Labs")
+                
+        except Exception as e:
+            logger.error("Error generating Pika Labs motion: %s", e)
+            return await asyncio.to_thread(self._create_placeholder_motion_video, image_path, output_path, duration)
+    
+    def _pika_submit(self, image_path: str, motion_type: str, duration: float) -> Dict:
+        """Gửi ảnh lên Pika Labs API, trả về response JSON (task_id hoặc video_url)"""
+        # Pika Labs API endpoint
+        api_url = "https://api.pika.art/v1/generate"
+        
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # Đọc ảnh
+        image_data, _ = _encode_image_b64(image_path)
+        
+        # Cấu hình motion prompts
+        prompt = self.PIKA_MOTION_PROMPTS.get(motion_type, self.PIKA_MOTION_PROMPTS["medium"])
+        
+        payload = {
+            "image": image_data,
+            "prompt": prompt,
+            "duration": min(duration, 4.0),  # Pika Labs giới hạn 4s
+            "style": "cinematic",
+            "aspect_ratio": "16:9",
+            "motion_intensity": motion_type,
+            "seed": None
+        }
+        
+        logger.info("Calling Pika Labs API with motion_type: %s", motion_type)
+        response = self._session.post(api_url, headers=headers, json=payload, timeout=self.API_TIMEOUT)
+        response.raise_for_status()
+        
+        result = response.json()
+        logger.info("Pika Labs response: %s", result)
+        return result
+    
+    def _pika_check(self, task_id: str, attempt: int) -> Tuple[Optional[str], Optional[str]]:
         """
-        Polling kết quả từ Pika Labs API
+        Kiểm tra task Pika Labs một lần
+        
+        Returns:
+            Tuple: (URL video nếu task đã xong / None nếu vẫn đang chạy,
+                    header Retry-After của response nếu có)
         """
         api_url = f"https://api.pika.art/v1/tasks/{task_id}"
         headers = {"Authorization": f"Bearer {self.api_key}"}
         
+        response = self._session.get(api_url, headers=headers, timeout=self.API_TIMEOUT)
+        response.raise_for_status()
+        
+        result = response.json()
+        status = result.get('status', 'unknown')
+        
+        logger.info("Pika Labs task %s status: %s (attempt %d)", task_id, status, attempt + 1)
+        
+        if status == 'completed':
+            if 'video_url' in result:
+                return result['video_url'], None
+            else:
+                raise Exception("No video URL in completed response")
+                
+        elif status == 'failed':
+            error_msg = result.get('error', 'Unknown error')
+            raise Exception(f"Pika Labs task failed: {error_msg}")
+            
+        elif status not in ['pending', 'processing']:
+            logger.warning("Unknown status: %s", status)
+        return None, response.headers.get('Retry-After')
+    
+    def _poll_pika_result(self, task_id: str, max_attempts: int = 20) -> str:
+        """
+        Polling kết quả từ Pika Labs API
+        
+        Returns:
+            str: URL video khi task hoàn thành
+        """
+        started = time.monotonic()
+        # Chưa poll cho tới khi task gần xong theo thời gian hoàn thành trung bình
+        time.sleep(self._first_poll_delay("pika_labs"))
         for attempt in range(max_attempts):
             try:
-                response = requests.get(api_url, headers=headers)
-                response.raise_for_status()
-                
-                result = response.json()
-                status = result.get('status', 'unknown')
-                
-                logger.info(f"Pika Labs task {task_id} status: {status} (attempt {attempt + 1})")
-                
-                if status == 'completed':
-                    if 'video_url' in result:
-                        video_url = result['video_url']
-                        
-                        # Tải video
-                        video_response = requests.get(video_url)
-                        video_response.raise_for_status()
-                        
-                        with open(output_path, 'wb') as f:
-                            f.write(video_response.content)
-                        
-                        logger.info(f"Pika Labs motion video saved to: {output_path}")
-                        return output_path
-                    else:
-                        raise Exception("No video URL in completed response")
-                        
-                elif status == 'failed':
-                    error_msg = result.get('error', 'Unknown error')
-                    raise Exception(f"Pika Labs task failed: {error_msg}")
-                    
-                elif status in ['pending', 'processing']:
-                    time.sleep(3)  # Chờ 3 giây
-                    continue
-                else:
-                    logger.warning(f"Unknown status: {status}")
-                    time.sleep(3)
-                    continue
-                    
+                video_url, retry_after = self._pika_check(task_id, attempt)
+                if video_url:
+                    self._record_completion("pika_labs", time.monotonic() - started)
+                    return video_url
+            except Exception as e:
+                logger.error("Error polling Pika Labs result: %s", e)
+                if attempt == max_attempts - 1:
+                    raise
+                retry_after = _retry_after_of(e)
+            time.sleep(_poll_delay(attempt, cap=5.0, retry_after=retry_after))
+        
+        raise Exception("Pika Labs task timeout")
+    
+    async def _apoll_pika_result(self, task_id: str, max_attempts: int = 20) -> str:
+        """Phiên bản async của _poll_pika_result (chờ bằng asyncio.sleep)"""
+        started = time.monotonic()
+        await asyncio.sleep(self._first_poll_delay("pika_labs"))
+        for attempt in range(max_attempts):
+            try:
+                video_url, retry_after = await asyncio.to_thread(self._pika_check, task_id, attempt)
+                if video_url:
+                    self._record_completion("pika_labs", time.monotonic() - started)
+                    return video_url
             except Exception as e:
-                logger.error(f"Error polling Pika Labs result: {e}")
+                logger.error("Error polling Pika Labs result: %s", e)
                 if attempt == max_attempts - 1:
                     raise
-                time.sleep(3)
+                retry_after = _retry_after_of(e)
+            await asyncio.sleep(_poll_delay(attempt, cap=5.0, retry_after=retry_after))
         
         raise Exception("Pika Labs task timeout")
     
     def _generate_leia_motion(self, image_path: str, output_path: str, 
-                            motion_type: str, duration: float) -> str:
+                            motion_type: str, duration: float,
+                            download: bool = True) -> Union[str, MotionResult]:
         """
         Tạo chuyển động bằng LeiaPix API
         """
@@ -373,8 +926,7 @@ class MotionGenerator:
             }
             
             # Đọc ảnh
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
+            image_data, _ = _encode_image_b64(image_path)
             
             payload = {
                 "image": image_data,
@@ -382,30 +934,48 @@ class MotionGenerator:
                 "duration": duration
             }
             
-            response = requests.post(api_url, headers=headers, json=payload)
+            response = self._session.post(api_url, headers=headers, json=payload, timeout=self.API_TIMEOUT)
             response.raise_for_status()
             
             result = response.json()
             
             # Tải video kết quả
             if 'video_url' in result:
-                video_response = requests.get(result['video_url'])
-                video_response.raise_for_status()
-                
-                with open(output_path, 'wb') as f:
-                    f.write(video_response.content)
-                
-                logger.info(f"LeiaPix motion video saved to: {output_path}")
-                return output_path
+                if not download:
+                    return MotionResult("leia_pix", url=result['video_url'], downloader=self._download_video)
+                return self._download_video(result['video_url'], output_path, "LeiaPix")
             else:
                 raise Exception("No video URL in response")
                 
         except Exception as e:
-            logger.error(f"Error generating LeiaPix motion: {e}")
+            logger.error("Error generating LeiaPix motion: %s", e)
             return self._create_placeholder_motion_video(image_path, output_path, duration)
     
+    def _download_video(self, video_url: str, output_path: str, provider_name: str) -> str:
+        """Tải video kết quả từ provider về output_path (stream từng chunk 1 MiB ra file tạm rồi os.replace)"""
+        tmp_path = None
+        try:
+            with self._session.get(video_url, stream=True, timeout=self.DOWNLOAD_TIMEOUT) as video_response:
+                video_response.raise_for_status()
+                # File tạm riêng cho mỗi lần tải, tránh hai job cùng output_path ghi chung một file
+                with tempfile.NamedTemporaryFile(dir=os.path.dirname(output_path) or ".",
+                                                 prefix=f"{os.path.basename(output_path)}.",
+                                                 suffix=".part", delete=False) as f:
+                    tmp_path = f.name
+                    for chunk in video_response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if tmp_path is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_path)
+            raise
+        
+        logger.info("%s motion video saved to: %s", provider_name, output_path)
+        return output_path
+    
     def _generate_free_motion(self, image_path: str, output_path: str, 
-                            motion_type: str, duration: float) -> str:
+                            motion_type: str, duration: float, download: bool = True) -> str:
         """
         Tạo chuyển động miễn phí (placeholder)
         """
@@ -417,70 +987,52 @@ class MotionGenerator:
         """
         Tạo video với chuyển động thực tế cho nhân vật
         """
+        if self.provider != "free":
+            # Video thay thế khi provider lỗi: không lưu vào cache
+            self._placeholder_outputs.add(output_path)
         try:
-            from moviepy.editor import ImageClip, CompositeVideoClip
-            from moviepy.video.fx.all import resize, fadein, fadeout
             import numpy as np
+            import cv2
             
-            # Tạo clip từ ảnh
-            base_clip = ImageClip(image_path, duration=duration)
+            # Đọc ảnh một lần thành mảng RGB
+            with Image.open(image_path) as img:
+                source = np.asarray(img.convert("RGB"))
+            h, w = source.shape[:2]
             
             # Tạo chuyển động Ken Burns effect (zoom + pan)
-            def make_frame(t):
-                # Tính toán zoom factor
-                zoom_factor = 1.0 + 0.15 * (t / duration)  # Zoom từ 1.0 đến 1.15
-                
-                # Tính toán pan offset
-                pan_x = int(50 * np.sin(2 * np.pi * t / duration))  # Pan ngang
-                pan_y = int(30 * np.cos(2 * np.pi * t / duration))  # Pan dọc
-                
-                # Resize và crop để tạo hiệu ứng zoom + pan
-                resized = base_clip.resize(zoom_factor)
-                
-                # Crop để tạo pan effect
-                w, h = base_clip.size
-                new_w, new_h = resized.size
-                
-                # Tính toán crop area
-                crop_x = max(0, min(pan_x + (new_w - w) // 2, new_w - w))
-                crop_y = max(0, min(pan_y + (new_h - h) // 2, new_h - h))
-                
-                # Crop frame
-                frame = resized.get_frame(t)
-                if len(frame.shape) == 3:
-                    cropped = frame[crop_y:crop_y+h, crop_x:crop_x+w]
-                else:
-                    cropped = frame[crop_y:crop_y+h, crop_x:crop_x+w]
-                
-                return cropped
-            
-            # Tạo clip với chuyển động
-            motion_clip = base_clip.fl(lambda gf, t: make_frame(t))
-            
-            # Thêm fade in/out
-            if duration > 1:
-                motion_clip = motion_clip.fadein(0.3).fadeout(0.3)
-            
-            # Xuất video với chất lượng cao
-            motion_clip.write_videofile(
-                output_path,
-                fps=24,
-                codec='libx264',
-                audio=False,
-                verbose=False,
-                logger=None,
-                bitrate="2000k"  # Bitrate cao hơn để tránh nhiễu
-            )
-            
-            # Giải phóng memory
-            base_clip.close()
-            motion_clip.close()
-            
-            logger.info(f"Motion video created: {output_path}")
+            # Zoom + crop gộp thành một phép affine: mỗi frame chỉ một lần warpAffine
+            # trên ảnh gốc thay vì resize cả ảnh rồi mới cắt. Tham số của mọi frame
+            # được tính trước một lần bằng numpy.
+            fps = 24
+            zooms, crops_x, crops_y, fades = _ken_burns_params(duration, w, h, fps)
+            
+            # Ma trận cấp phát một lần, mỗi frame chỉ ghi lại hệ số
+            matrix = np.zeros((2, 3), dtype=np.float32)
+            # Buffer frame dùng lại cho mọi frame (frame được ghi sang ffmpeg ngay nên không bị ghi đè sớm)
+            frame_buffer = np.empty_like(source)
+            
+            def frames():
+                for zoom_factor, crop_x, crop_y, factor in zip(zooms, crops_x, crops_y, fades):
+                    # dst = zoom * src - crop
+                    matrix[0, 0] = matrix[1, 1] = zoom_factor
+                    matrix[0, 2] = -crop_x
+                    matrix[1, 2] = -crop_y
+                    frame = cv2.warpAffine(source, matrix, (w, h), dst=frame_buffer, flags=cv2.INTER_LINEAR,
+                                           borderMode=cv2.BORDER_REPLICATE)
+                    # Fade in/out (từ/về màu đen)
+                    if factor < 1.0:
+                        # Nhân hệ số tại chỗ trên uint8 (không tạo mảng float trung gian)
+                        cv2.convertScaleAbs(frame, dst=frame, alpha=float(factor))
+                    yield frame
+            
+            # Xuất video với chất lượng cao (bitrate cao hơn để tránh nhiễu)
+            _write_video(frames, w, h, output_path, fps=fps, bitrate="2000k")
+            
+            logger.info("Motion video created: %s", output_path)
             return output_path
             
         except Exception as e:
-            logger.error(f"Error creating motion video: {e}")
+            logger.error("Error creating motion video: %s", e)
             # Fallback: tạo video đơn giản
             return self._create_simple_video_from_image(image_path, output_path, duration)
     
@@ -490,27 +1042,26 @@ class MotionGenerator:
         Tạo video đơn giản từ ảnh (fallback)
         """
         try:
-            from moviepy.editor import ImageClip
-            
-            clip = ImageClip(image_path, duration=duration)
-            clip.write_videofile(
-                output_path,
-                fps=24,
-                codec='libx264',
-                audio=False,
-                verbose=False,
-                logger=None
-            )
-            
-            logger.info(f"Simple video created from image: {output_path}")
+            import numpy as np
+            
+            with Image.open(image_path) as img:
+                frame = np.ascontiguousarray(np.asarray(img.convert("RGB")))
+            h, w = frame.shape[:2]
+            fps = 24
+            frame_count = max(1, int(np.ceil(duration * fps)))
+            
+            _write_video(lambda: (frame for _ in range(frame_count)), w, h, output_path, fps=fps)
+            
+            logger.info("Simple video created from image: %s", output_path)
             return output_path
             
         except Exception as e:
-            logger.error(f"Error creating simple video: {e}")
+            logger.error("Error creating simple video: %s", e)
             raise
     
     def batch_generate_motion(self, image_paths: List[str], output_dir: str, 
-                            motion_type: str = "subtle", duration: float = 3.0) -> List[str]:
+                            motion_type: str = "subtle", duration: float = 3.0,
+                            max_workers: int = 8) -> List[str]:
         """
         Tạo chuyển động cho nhiều ảnh
         
@@ -519,29 +1070,73 @@ class MotionGenerator:
             output_dir: Thư mục chứa video đầu ra
             motion_type: Loại chuyển động
             duration: Thời lượng mỗi video
+            max_workers: Số video tạo song song tối đa (provider encode trên máy bị giới hạn
+                thêm ở os.cpu_count() // 2, mỗi ffmpeg đã tự dùng nhiều thread)
             
         Returns:
-            List[str]: Danh sách đường dẫn video đã tạo
+            List[str]: Danh sách đường dẫn video đã tạo (đúng thứ tự image_paths, None nếu lỗi)
         """
         os.makedirs(output_dir, exist_ok=True)
+        if not image_paths:
+            return []
         
-        video_paths = []
-        for i, image_path in enumerate(image_paths):
+        def generate_one(i: int, image_path: str) -> Optional[str]:
             try:
                 output_path = os.path.join(output_dir, f"motion_{i+1:02d}.mp4")
                 result = self.generate_motion(image_path, output_path, motion_type, duration)
-                video_paths.append(result)
-                logger.info(f"Generated motion video {i+1}/{len(image_paths)}: {result}")
+                logger.info("Generated motion video %d/%d: %s", i+1, len(image_paths), result)
+                return result
             except Exception as e:
-                logger.error(f"Error generating motion for image {i+1}: {e}")
-                video_paths.append(None)
+                logger.error("Error generating motion for image %d: %s", i+1, e)
+                return None
+        
+        if self.provider not in self.REMOTE_PROVIDERS:
+            max_workers = min(max_workers, (os.cpu_count() or 2) // 2)
+        workers = max(1, min(max_workers, len(image_paths)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="motion-batch") as executor:
+            return list(executor.map(generate_one, range(len(image_paths)), image_paths))
+    
+    async def abatch_generate_motion(self, image_paths: List[str], output_dir: str,
+                                     motion_type: str = "subtle", duration: float = 3.0,
+                                     max_concurrency: int = 5,
+                                     max_uploads: int = 1) -> List[Union[str, BaseException]]:
+        """
+        Tạo chuyển động cho nhiều ảnh song song (giới hạn số video đồng thời)
+        
+        Các task chạy theo cửa sổ trượt: tối đa max_concurrency task đang chờ provider,
+        còn bước upload ảnh được giới hạn riêng bởi max_uploads - ảnh kế tiếp được gửi
+        ngay khi ảnh trước upload xong và chuyển sang chờ kết quả.
+        
+        Args:
+            image_paths: Danh sách đường dẫn ảnh
+            output_dir: Thư mục chứa video đầu ra
+            motion_type: Loại chuyển động
+            duration: Thời lượng mỗi video
+            max_concurrency: Số video tạo đồng thời tối đa
+            max_uploads: Số request upload ảnh chạy cùng lúc tối đa
+            
+        Returns:
+            List: Đường dẫn video hoặc exception cho từng ảnh, theo đúng thứ tự image_paths
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        upload_slot = asyncio.Semaphore(max(1, max_uploads))
+        
+        async def generate_one(i: int, image_path: str) -> str:
+            async with semaphore:
+                output_path = os.path.join(output_dir, f"motion_{i+1:02d}.mp4")
+                return await self._agenerate_motion(image_path, output_path, motion_type, duration, upload_slot)
         
-        return video_paths
+        return await asyncio.gather(
+            *(generate_one(i, image_path) for i, image_path in enumerate(image_paths)),
+            return_exceptions=True
+        )
 
 # Utility function
 def generate_motion(image_path: str, output_path: str, 
                    provider: str = "google_flow", api_key: Optional[str] = None,
-                   motion_type: str = "subtle", duration: float = 3.0) -> str:
+                   motion_type: str = "subtle", duration: float = 3.0,
+                   use_cache: bool = False) -> str:
     """
     Utility function để tạo chuyển động từ ảnh
     
@@ -552,9 +1147,41 @@ def generate_motion(image_path: str, output_path: str,
         api_key: API key
         motion_type: Loại chuyển động
         duration: Thời lượng video
+        use_cache: Dùng lại video đã tạo cho cùng ảnh/tham số
         
     Returns:
         str: Đường dẫn video đã tạo
     """
-    generator = MotionGenerator(provider, api_key)
+    provider = provider.lower()
+    generator = _get_generator(provider, api_key or api_manager.get_api_key(provider), use_cache)
     return generator.generate_motion(image_path, output_path, motion_type, duration)
+
+
+# Generator theo từng thread: MotionGenerator giữ requests.Session, vốn không đảm bảo
+# thread-safe, nên không chia sẻ instance giữa các thread
+_thread_generators = threading.local()
+_GENERATORS_PER_THREAD = 8
+
+
+def _get_generator(provider: str, api_key: Optional[str], use_cache: bool = False) -> MotionGenerator:
+    """
+    MotionGenerator dùng lại theo (provider, api_key, use_cache) trong thread hiện tại để giữ connection pool
+    
+    Mỗi thread giữ tối đa _GENERATORS_PER_THREAD generator (LRU); generator bị loại được
+    close() ngay. Khi thread kết thúc, generator của nó chỉ được giải phóng qua GC.
+    """
+    generators = getattr(_thread_generators, "generators", None)
+    if generators is None:
+        generators = _thread_generators.generators = OrderedDict()
+    
+    key = (provider, api_key, use_cache)
+    generator = generators.get(key)
+    if generator is not None:
+        generators.move_to_end(key)
+        return generator
+    
+    generator = generators[key] = MotionGenerator(provider, api_key, use_cache)
+    if len(generators) > _GENERATORS_PER_THREAD:
+        _, evicted = generators.popitem(last=False)
+        evicted.close()
+    return generator
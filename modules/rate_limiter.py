@@ -0,0 +1,161 @@
+"""
+Rate Limiter Module
+Giới hạn request/phút, token/phút và số request đồng thời trước khi gọi API
+"""
+
+import time
+import asyncio
+import contextlib
+import collections
+import logging
+import threading
+from typing import AsyncIterator, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def approx_tokens(text: str) -> int:
+    """Ước lượng số token của text (~4 ký tự mỗi token)"""
+    return len(text) // 4
+
+
+class _TokenBucket:
+    """Token bucket đầy lại tuyến tính theo thời gian, dung lượng = hạn mức mỗi phút"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Số giây cần chờ để đủ amount (0 nếu đã đủ)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+def _grant(future: asyncio.Future):
+    """Giao slot cho waiter (chạy trong event loop của waiter)"""
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """
+    Rate limiter chủ động cho các request async
+
+    Request chỉ được gửi khi còn đủ hạn mức RPM/TPM, thay vì gửi rồi nhận 429 và
+    backoff. Hạn mức là của cả API key nên dùng chung một instance cho mỗi provider
+    (get_rate_limiter); instance an toàn khi dùng từ nhiều thread/event loop.
+    """
+
+    def __init__(self, rpm: int, tpm: int, max_concurrent: int = 10):
+        """
+        Khởi tạo RateLimiter
+
+        Args:
+            rpm: Số request tối đa mỗi phút
+            tpm: Số token (prompt + completion) tối đa mỗi phút
+            max_concurrent: Số request chạy đồng thời tối đa
+        """
+        self._requests = _TokenBucket(rpm)
+        self._tokens = _TokenBucket(tpm)
+        self._max_concurrent = max_concurrent
+        self._active = 0
+        # (loop, future) của các request đang chờ slot, được cấp theo thứ tự đến
+        self._waiters = collections.deque()
+        # threading.Lock thay vì asyncio.Lock/Semaphore: không gắn với một event loop
+        self._lock = threading.Lock()
+
+    async def _acquire_slot(self):
+        """Chờ một slot đồng thời"""
+        with self._lock:
+            if self._active < self._max_concurrent and not self._waiters:
+                self._active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # Slot đã được giao cho waiter này đúng lúc bị cancel: trả lại
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        """Trả slot: giao thẳng cho waiter kế tiếp nếu có"""
+        with self._lock:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_grant, future)
+                    return
+            self._active -= 1
+
+    async def _wait_quota(self, est_tokens: int):
+        """Chờ tới khi đủ hạn mức RPM/TPM rồi trừ hạn mức cho request"""
+        while True:
+            with self._lock:
+                wait = max(self._requests.wait_time(1), self._tokens.wait_time(est_tokens))
+                if wait <= 0:
+                    self._requests.consume(1)
+                    self._tokens.consume(est_tokens)
+                    return
+            logger.debug("Rate limit: waiting %.2fs for %d tokens", wait, est_tokens)
+            await asyncio.sleep(wait)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, est_tokens: int = 0) -> AsyncIterator[None]:
+        """
+        Chờ tới khi đủ hạn mức cho một request rồi giữ một slot đồng thời
+
+        Slot được trả khi thoát khỏi context, nên chỉ bọc phần gửi request/đọc response.
+
+        Args:
+            est_tokens: Số token ước lượng của request (prompt + max_tokens)
+        """
+        await self._acquire_slot()
+        try:
+            await self._wait_quota(est_tokens)
+            yield
+        finally:
+            self._release_slot()
+
+
+# Một limiter cho mỗi provider trong cả process
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, rpm: int, tpm: int, max_concurrent: int = 10) -> RateLimiter:
+    """
+    RateLimiter dùng chung của provider (mọi instance, thread và event loop)
+
+    Args:
+        provider: Tên provider
+        rpm: Số request tối đa mỗi phút (chỉ dùng ở lần tạo đầu tiên)
+        tpm: Số token tối đa mỗi phút (chỉ dùng ở lần tạo đầu tiên)
+        max_concurrent: Số request chạy đồng thời tối đa (chỉ dùng ở lần tạo đầu tiên)
+
+    Returns:
+        RateLimiter: Limiter của provider
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = _limiters[provider] = RateLimiter(rpm, tpm, max_concurrent)
+        return limiter
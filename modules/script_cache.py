@@ -0,0 +1,182 @@
+"""
+Script Cache Module
+Cache kịch bản trên đĩa (SQLite) theo độ gần nhau của prompt
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import closing
+from typing import List, Dict, Optional, Tuple, FrozenSet
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Số từ liên tiếp trong một shingle: giữ thứ tự từ ("dog chases cat" khác "cat chases dog")
+_SHINGLE_SIZE = 3
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Chuẩn hóa prompt: chữ thường, bỏ dấu câu/khoảng trắng thừa"""
+    return " ".join(_WORD_RE.findall(prompt.lower()))
+
+
+def _shingles(words: List[str]) -> FrozenSet[Tuple[str, ...]]:
+    """Tập các cụm _SHINGLE_SIZE từ liên tiếp (prompt ngắn hơn thì cả prompt là một shingle)"""
+    if len(words) <= _SHINGLE_SIZE:
+        return frozenset([tuple(words)])
+    return frozenset(tuple(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1))
+
+
+def _similarity(a: FrozenSet[Tuple[str, ...]], b: FrozenSet[Tuple[str, ...]]) -> float:
+    """
+    Độ giống nhau Jaccard giữa hai tập shingle
+    
+    Thêm/bớt/đổi một từ làm mất tới _SHINGLE_SIZE shingle nên chỉ những prompt gần như
+    trùng khớp (khác dấu câu, hoa/thường, khoảng trắng...) mới vượt ngưỡng cao.
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class SemanticCache:
+    """
+    Cache kịch bản theo prompt gần giống nhau
+
+    Mỗi entry thuộc một bucket xác định bởi các tham số request (provider, model,
+    num_scenes, style, ...); chỉ so prompt trong cùng bucket. Prompt trùng sau khi
+    chuẩn hóa được tra trực tiếp theo khóa, còn lại so các cụm từ liên tiếp (giữ thứ tự
+    từ) với ngưỡng threshold.
+    """
+
+    def __init__(self, db_path: str = os.path.join("outputs", "cache", "scripts.sqlite3"),
+                 threshold: float = 0.9, max_entries: int = 5000):
+        """
+        Khởi tạo SemanticCache
+
+        Args:
+            db_path: Đường dẫn file SQLite
+            threshold: Độ giống nhau tối thiểu (0-1) để coi là cache hit
+            max_entries: Số kịch bản tối đa, vượt quá thì xóa entry ít dùng nhất
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scripts ("
+                "key TEXT PRIMARY KEY, bucket TEXT NOT NULL, prompt TEXT NOT NULL, "
+                "scenes TEXT NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS scripts_bucket ON scripts (bucket)")
+
+    def _connect(self) -> closing:
+        return closing(sqlite3.connect(self.db_path, timeout=10))
+
+    @staticmethod
+    def _bucket(params: Tuple) -> str:
+        raw_key = "\x1f".join(str(p) for p in params)
+        return hashlib.blake2b(raw_key.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _key(bucket: str, normalized: str) -> str:
+        return hashlib.blake2b(f"{bucket}\x1f{normalized}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def lookup(self, prompt: str, params: Tuple) -> Optional[List[Dict]]:
+        """
+        Tìm kịch bản đã lưu cho prompt
+
+        Args:
+            prompt: ý tưởng video
+            params: Tham số request còn lại (phải khớp chính xác)
+
+        Returns:
+            Optional[List[Dict]]: Danh sách cảnh nếu cache hit, ngược lại None
+        """
+        bucket = self._bucket(params)
+        normalized = _normalize_prompt(prompt)
+        key = self._key(bucket, normalized)
+
+        try:
+            with self._lock, self._connect() as conn:
+                row = conn.execute("SELECT scenes FROM scripts WHERE key = ?", (key,)).fetchone()
+                score = 1.0
+                if row is None:
+                    hit_key = self._closest_key(conn, bucket, normalized)
+                    if hit_key is None:
+                        return None
+                    key, score = hit_key
+                    row = conn.execute("SELECT scenes FROM scripts WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        return None
+
+                with conn:
+                    conn.execute("UPDATE scripts SET used_at = ? WHERE key = ?", (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Không thể đọc script cache: {e}")
+            return None
+
+        logger.info(f"♻️ Script cache hit (similarity {score:.2f}) for prompt: {prompt[:80]}")
+        return json.loads(row[0])
+
+    def _closest_key(self, conn: sqlite3.Connection, bucket: str, normalized: str) -> Optional[Tuple[str, float]]:
+        """(key, độ giống) của prompt gần nhất trong bucket đạt threshold, chỉ đọc cột key/prompt"""
+        words = normalized.split()
+        shingles = _shingles(words)
+        # Jaccard >= threshold cần tỷ lệ số shingle (~ số từ) của hai prompt >= threshold
+        min_words = len(words) * self.threshold
+        max_words = len(words) / self.threshold if self.threshold > 0 else float("inf")
+
+        best = None
+        for cand_key, cand_prompt in conn.execute("SELECT key, prompt FROM scripts WHERE bucket = ?", (bucket,)):
+            cand_words = cand_prompt.split()
+            if not min_words - _SHINGLE_SIZE <= len(cand_words) <= max_words + _SHINGLE_SIZE:
+                continue
+            score = _similarity(shingles, _shingles(cand_words))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (cand_key, score)
+        return best
+
+    def store(self, prompt: str, params: Tuple, scenes: List[Dict]):
+        """
+        Lưu kịch bản vào cache và dọn bớt khi vượt max_entries
+
+        Args:
+            prompt: ý tưởng video
+            params: Tham số request còn lại
+            scenes: Danh sách cảnh đã tạo
+        """
+        bucket = self._bucket(params)
+        normalized = _normalize_prompt(prompt)
+        key = self._key(bucket, normalized)
+
+        try:
+            with self._lock, self._connect() as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO scripts (key, bucket, prompt, scenes, used_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, bucket, normalized, json.dumps(scenes, ensure_ascii=False), time.time())
+                )
+                conn.execute(
+                    "DELETE FROM scripts WHERE key IN ("
+                    "SELECT key FROM scripts ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Không thể lưu script cache: {e}")
+
+    def clear(self):
+        """Xóa toàn bộ kịch bản trong cache"""
+        with self._lock, self._connect() as conn, conn:
+            conn.execute("DELETE FROM scripts")
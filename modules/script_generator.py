@@ -4,24 +4,226 @@ Tạo kịch bản và prompt cho từng cảnh bằng GPT
 """
 
 import openai
+import asyncio
+import copy
+import datetime
 import json
+import io
 import os
-from typing import List, Dict, Optional
+import re
+from typing import List, Dict, Optional, Union, Any, AsyncIterator
 import logging
+import threading
+from collections import Counter, OrderedDict
 from .api_manager import api_manager
+from .script_cache import SemanticCache
+from .rate_limiter import get_rate_limiter, approx_tokens
+
+try:
+    import orjson  # Parse/serialize JSON nhanh hơn json chuẩn, lỗi parse vẫn là json.JSONDecodeError
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec  # Parse + validate scenes trong một lượt bằng C
+except ImportError:
+    msgspec = None
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Thư mục lưu kịch bản mặc định
+_SCRIPTS_DIR = "outputs/scripts"
+
+
+def _json_loads(data: Union[str, bytes]) -> Any:
+    """json.loads qua orjson nếu có"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize ra UTF-8 bytes (giữ nguyên ký tự Unicode), qua orjson nếu có"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+
+if msgspec is not None:
+    class _ScriptResponse(msgspec.Struct):
+        """Response kịch bản; scene giữ dạng dict (kể cả key lạ) giống nhánh json/orjson"""
+        scenes: List[Dict[str, Any]] = msgspec.field(default_factory=list)
+    
+    _script_decoder = msgspec.json.Decoder(_ScriptResponse)
+else:
+    _script_decoder = None
+
+
+# Bóc JSON khỏi markdown code block (```json ... ```) nếu model vẫn trả về dạng đó
+_JSON_FENCE_RE = re.compile(r"^\s*(?:```(?:json)?\s*)?(.*?)\s*(?:```)?\s*$", re.DOTALL)
+
+
+# Mức chi tiết của description theo độ dài kịch bản
+_LENGTH_INSTRUCTIONS = {
+    "short": "Keep descriptions brief and concise (1 sentence each).",
+    "medium": "Provide moderate detail in descriptions (1-2 sentences each).",
+    "long": "Include detailed descriptions (2-3 sentences each) with rich imagery.",
+    "very_long": "Create very detailed, immersive descriptions (3-4 sentences each) with extensive visual details.",
+    "ultra_long": "Create extremely detailed, immersive descriptions (4-6 sentences each) with extensive visual details, character development, and storytelling elements. Each scene should be rich enough for 2 minutes of content."
+}
+
+
+def _build_user_template(head: str, include_dialogue: bool, script_length: str) -> str:
+    """
+    User message template cho một tổ hợp (include_dialogue, script_length)
+    
+    Luật chỉ áp dụng cho tổ hợp (độ chi tiết description, duration, lời thoại) nằm ở đây,
+    sau SYSTEM_PROMPT_V1 chung; chỉ còn chỗ trống cho phần theo request.
+    """
+    ultra_long = script_length == "ultra_long"
+    rules = [
+        f"description: {_LENGTH_INSTRUCTIONS[script_length]}",
+        f"duration: {'120 seconds (2 minutes)' if ultra_long else '2-5 seconds'}",
+    ]
+    if ultra_long:
+        rules.append("Each scene should be detailed enough to support 2 minutes of content"
+                     " with rich storytelling, character development, and visual elements.")
+    if include_dialogue:
+        rules.append("Include dialogue and dialogue_type in every scene. Include character dialogue when"
+                     " appropriate, with clear character names and emotional context.")
+    else:
+        rules.append("Leave out dialogue and dialogue_type.")
+    rules_text = "".join(f"\n- {rule}" for rule in rules).replace("{", "{{").replace("}", "}}")
+    return f"{head}\nnum_scenes={{num_scenes}}\nstyle={{style}}\nrules:{rules_text}"
+
+
+# Template dựng sẵn một lần lúc import cho mọi tổ hợp (include_dialogue, script_length)
+_USER_TEMPLATES = {
+    (dialogue, length): _build_user_template("prompt={prompt}", dialogue, length)
+    for dialogue in (True, False) for length in _LENGTH_INSTRUCTIONS
+}
+_BULK_USER_TEMPLATES = {
+    (dialogue, length): _build_user_template("ideas:\n{ideas}", dialogue, length)
+    for dialogue in (True, False) for length in _LENGTH_INSTRUCTIONS
+}
+
+
+class _SceneStreamParser:
+    """
+    Tách từng scene object khỏi JSON {"scenes": [{...}, ...]} đang được stream về
+    
+    Đếm độ sâu {}/[] (bỏ qua ký tự trong chuỗi JSON): object mở ở độ sâu 3 là một
+    scene, đóng về độ sâu 2 thì scene đã đủ và được parse ngay.
+    """
+    
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._parts: List[str] = []  # Phần scene đang dở từ các chunk trước
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """Nạp thêm một đoạn text, trả về các scene vừa hoàn chỉnh"""
+        scenes = []
+        start = 0 if self._parts else None
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{' or ch == '[':
+                self._depth += 1
+                if ch == '{' and self._depth == 3:
+                    start = i
+            elif ch == '}' or ch == ']':
+                self._depth -= 1
+                if ch == '}' and self._depth == 2 and start is not None:
+                    self._parts.append(chunk[start:i + 1])
+                    text = "".join(self._parts)
+                    self._parts = []
+                    start = None
+                    try:
+                        scenes.append(_json_loads(text))
+                    except ValueError as e:
+                        logger.warning(f"Skipping malformed streamed scene: {e}")
+        if start is not None:
+            self._parts.append(chunk[start:])
+        return scenes
+
+
+class _FallbackScenes(list):
+    """Scenes dự phòng (API lỗi/free provider) - không được lưu vào cache"""
+
+
 class ScriptGenerator:
-    def __init__(self, provider: str = "openai", api_key: Optional[str] = None):
+    # Giới hạn max_tokens cho một request gộp nhiều prompt
+    BULK_MAX_TOKENS = 16000
+    
+    # Cache L1 trong bộ nhớ, dùng chung mọi instance: khớp chính xác (tham số request, prompt) -> JSON scenes.
+    # Lưu chuỗi JSON để mỗi lần hit trả về list mới, caller sửa scenes không làm hỏng cache
+    MEMORY_CACHE_SIZE = 1024
+    _memory_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+    _memory_cache_lock = threading.Lock()
+    
+    # System prompt cố định từng byte giữa các request (mọi tổ hợp dùng chung);
+    # phần thay đổi theo request/tổ hợp nằm hết trong user message. Lưu ý: OpenAI chỉ
+    # cache prompt từ 1024 token trở lên, prompt này (~450 token) chưa đạt ngưỡng đó -
+    # số token được cache thực tế xem trong log usage (_log_usage)
+    SYSTEM_PROMPT_V1 = """You are a professional movie script writer and storyboard artist.
+Your task is to create engaging, cinematic scenes that tell a compelling story.
+Always respond with valid JSON format only, no additional text.
+
+The user message gives the request as key=value lines: prompt is the video idea, num_scenes is
+how many scenes to create and style is the visual style of the video. It ends with rules for this
+request (description detail, scene duration, dialogue); follow them exactly.
+
+For each scene, provide:
+- title: A brief, engaging title for the scene
+- description: What happens in the scene, with the level of detail given in the rules
+- image_prompt: A detailed prompt for generating a realistic, cinematic image that captures the scene's mood and key elements
+- duration: Suggested duration in seconds, as given in the rules
+- transition: Type of transition to next scene (fade, cut, zoom, pan)
+- dialogue: If there are characters speaking, include dialogue with character names and their lines. If it's narration, include narrator text.
+- dialogue_type: Type of dialogue ("character" for character dialogue, "narration" for storytelling, "none" for no dialogue)
+
+Make the scenes flow naturally and tell a cohesive story.
+Focus on visual storytelling with strong imagery.
+
+Output JSON format:
+{
+    "scenes": [
+        {
+            "title": "Scene Title",
+            "description": "What happens in this scene",
+            "image_prompt": "Detailed prompt for image generation",
+            "duration": 3,
+            "transition": "fade",
+            "dialogue": "Character dialogue or narration text",
+            "dialogue_type": "character|narration|none"
+        }
+    ]
+}
+
+When the user message lists several numbered ideas instead of a single prompt, write a separate script
+for each idea and return {"packs": [{"idx": <idea number>, "scenes": [...]}, ...]} with exactly one pack per idea.
+"""
+    
+    def __init__(self, provider: str = "openai", api_key: Optional[str] = None, use_cache: bool = False):
         """
         Khởi tạo ScriptGenerator
         
         Args:
             provider: Provider để tạo script (openai, anthropic, google)
             api_key: API key. Nếu None, sẽ lấy từ api_manager
+            use_cache: Dùng lại kịch bản đã tạo cho prompt giống/gần giống. Mặc định tắt
+                để mỗi lần tạo lại cho ra kịch bản mới
         """
         self.provider = provider.lower()
         self.api_key = api_key or api_manager.get_api_key(self.provider)
@@ -29,9 +231,17 @@ class ScriptGenerator:
         if not self.api_key and self.provider != "free":
             raise ValueError(f"{self.provider.title()} API key is required. Set API key in config or pass api_key parameter.")
         
-        if self.provider == "openai":
-            # OpenAI API key sẽ được sử dụng trong client initialization
-            pass
+        # Client provider tạo lazy và dùng lại giữa các lần gọi để giữ kết nối keep-alive
+        self._openai_client = None
+        self._gemini_model = None
+        # AsyncOpenAI tạo lazy, gắn với event loop đã tạo ra nó
+        self._aclient = None
+        self._aclient_loop = None
+        # Rate limiter dùng chung cho provider trong cả process (hạn mức là của API key)
+        self._rate_limiter = None
+        
+        self.use_cache = use_cache and self.provider != "free"
+        self._semantic_cache = SemanticCache() if self.use_cache else None
     
     def generate_script(self, prompt: str, num_scenes: int = 3, style: str = "cinematic", 
                        include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
@@ -48,6 +258,18 @@ class ScriptGenerator:
         Returns:
             List[Dict]: Danh sách các cảnh với title, description, image_prompt, dialogue
         """
+        cache_params = self._cache_params(num_scenes, style, include_dialogue, script_length)
+        cached = self._cache_lookup(prompt, cache_params)
+        if cached is not None:
+            return cached
+        
+        scenes = self._generate_script_uncached(prompt, num_scenes, style, include_dialogue, script_length)
+        self._cache_store(prompt, cache_params, scenes)
+        return scenes
+    
+    def _generate_script_uncached(self, prompt: str, num_scenes: int, style: str,
+                                  include_dialogue: bool, script_length: str) -> List[Dict]:
+        """Gọi provider tạo kịch bản (không qua cache)"""
         if self.provider == "openai":
             return self._generate_openai_script(prompt, num_scenes, style, include_dialogue, script_length)
         elif self.provider == "anthropic":
@@ -59,68 +281,225 @@ class ScriptGenerator:
         else:
             raise ValueError(f"Unsupported provider: {self.provider}")
     
-    def _generate_openai_script(self, prompt: str, num_scenes: int, style: str, include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
-        """Tạo script bằng OpenAI"""
+    def _cache_params(self, num_scenes: int, style: str, include_dialogue: bool, script_length: str) -> tuple:
+        """Tham số request phải khớp chính xác để dùng lại kịch bản trong cache"""
+        model = api_manager.get_provider_config(self.provider).get("model", "")
+        return (self.provider, model, num_scenes, style, include_dialogue, script_length)
+    
+    def _cache_lookup(self, prompt: str, cache_params: tuple) -> Optional[List[Dict]]:
+        """Kịch bản trong cache cho prompt (L1 khớp chính xác, rồi L2 giống/gần giống), None nếu miss"""
+        if not self.use_cache:
+            return None
+        
+        memory_key = cache_params + (prompt,)
+        with self._memory_cache_lock:
+            cached = self._memory_cache.get(memory_key)
+            if cached is not None:
+                self._memory_cache.move_to_end(memory_key)
+        if cached is not None:
+            return _json_loads(cached)
+        
+        scenes = self._semantic_cache.lookup(prompt, cache_params)
+        if scenes is not None:
+            self._memory_cache_put(memory_key, scenes)
+        return scenes
+    
+    def _cache_store(self, prompt: str, cache_params: tuple, scenes: List[Dict]):
+        """Lưu kịch bản vào cache (bỏ qua scenes dự phòng)"""
+        if not self.use_cache or isinstance(scenes, _FallbackScenes):
+            return
+        self._memory_cache_put(cache_params + (prompt,), scenes)
+        self._semantic_cache.store(prompt, cache_params, scenes)
+    
+    @classmethod
+    def _memory_cache_put(cls, memory_key: tuple, scenes: List[Dict]):
+        """Thêm vào cache L1, bỏ entry ít dùng nhất khi vượt MEMORY_CACHE_SIZE"""
+        serialized = _json_dumps(scenes)
+        with cls._memory_cache_lock:
+            cls._memory_cache[memory_key] = serialized
+            cls._memory_cache.move_to_end(memory_key)
+            while len(cls._memory_cache) > cls.MEMORY_CACHE_SIZE:
+                cls._memory_cache.popitem(last=False)
+    
+    @classmethod
+    def clear_cache(cls):
+        """Xóa cache L1 trong bộ nhớ (cache SQLite trên đĩa giữ nguyên)"""
+        with cls._memory_cache_lock:
+            cls._memory_cache.clear()
+    
+    @staticmethod
+    def _template_key(include_dialogue: bool, script_length: str) -> tuple:
+        """Key của _USER_TEMPLATES; độ dài không hỗ trợ dùng medium"""
+        return (bool(include_dialogue), script_length if script_length in _LENGTH_INSTRUCTIONS else "medium")
+    
+    def _user_message(self, prompt: str, num_scenes: int, style: str, include_dialogue: bool, script_length: str) -> str:
+        """Phần thay đổi theo request, gửi sau SYSTEM_PROMPT_V1"""
+        template = _USER_TEMPLATES[self._template_key(include_dialogue, script_length)]
+        return template.format(prompt=prompt, num_scenes=num_scenes, style=style)
+    
+    def _openai_request(self, user_message: str) -> Dict[str, Any]:
+        """Tham số chat.completions.create dùng chung cho bản sync, async và bulk"""
         # Lấy cấu hình từ api_manager
         config = api_manager.get_provider_config("openai")
-        model = config.get("model", "gpt-4o-mini")
-        temperature = config.get("temperature", 0.8)
-        max_tokens = config.get("max_tokens", 2000)
-        
-        system_prompt = """You are a professional movie script writer and storyboard artist. 
-        Your task is to create engaging, cinematic scenes that tell a compelling story.
-        Always respond with valid JSON format only, no additional text."""
-        
-        dialogue_instruction = ""
-        if include_dialogue:
-            dialogue_instruction = """
-        - dialogue: If there are characters speaking, include dialogue with character names and their lines. If it's narration, include narrator text.
-        - dialogue_type: Type of dialogue ("character" for character dialogue, "narration" for storytelling, "none" for no dialogue)
+        
+        return {
+            "model": config.get("model", "gpt-4o-mini"),
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT_V1},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": config.get("temperature", 0.8),
+            "max_tokens": config.get("max_tokens", 2000)
+        }
+    
+    @staticmethod
+    def _log_usage(usage):
+        """Log token usage của một response OpenAI, gồm số prompt token được provider cache"""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        logger.info(f"OpenAI usage: {usage.prompt_tokens} prompt tokens ({cached_tokens} cached), "
+                    f"{usage.completion_tokens} completion tokens")
+    
+    def _generate_openai_script(self, prompt: str, num_scenes: int, style: str, include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
+        """Tạo script bằng OpenAI"""
+        request = self._openai_request(self._user_message(prompt, num_scenes, style, include_dialogue, script_length))
+        
+        try:
+            response = self.openai_client.chat.completions.create(**request)
+            self._log_usage(response.usage)
+            
+            content = response.choices[0].message.content.strip()
+            logger.info(f"Generated script content: {content[:200]}...")
+            
+            return self._parse_script_response(content, prompt, num_scenes)
+                
+        except Exception as e:
+            logger.error(f"Error generating OpenAI script: {e}")
+            return self._create_fallback_scenes(prompt, num_scenes)
+    
+    def generate_scripts_bulk(self, prompts: List[str], num_scenes: int = 3, style: str = "cinematic",
+                              include_dialogue: bool = True, script_length: str = "medium") -> List[List[Dict]]:
         """
+        Tạo kịch bản cho nhiều prompt, gộp tối đa batch_size prompt vào một request OpenAI
         
-        user_prompt = f"""
-        Create {num_scenes} short cinematic scenes from this idea: "{prompt}".
-        
-        Style: {style}
-        
-        For each scene, provide:
-        - title: A brief, engaging title for the scene
-        - description: 1-2 sentences describing what happens in the scene
-        - image_prompt: A detailed prompt for generating a realistic, cinematic image that captures the scene's mood and key elements
-        - duration: Suggested duration in seconds (2-5 seconds)
-        - transition: Type of transition to next scene (fade, cut, zoom, pan){dialogue_instruction}
-        
-        Make the scenes flow naturally and tell a cohesive story.
-        Focus on visual storytelling with strong imagery.
-        {f"Include character dialogue when appropriate, with clear character names and emotional context." if include_dialogue else ""}
-        
-        Output JSON format:
-        {{
-            "scenes": [
-                {{
-                    "title": "Scene Title",
-                    "description": "What happens in this scene",
-                    "image_prompt": "Detailed prompt for image generation",
-                    "duration": 3,
-                    "transition": "fade"{f',\n                    "dialogue": "Character dialogue or narration text",\n                    "dialogue_type": "character|narration|none"' if include_dialogue else ""}
-                }}
-            ]
-        }}
+        Model trả về {"packs": [{"idx": i, "scenes": [...]}, ...]}; mỗi pack được
+        tách ra theo idx. Prompt thiếu pack hoặc batch lỗi sẽ nhận scenes dự phòng.
+        Prompt trùng nhau chỉ được gửi một lần. Provider khác OpenAI tạo lần lượt từng prompt.
+        
+        Args:
+            prompts: Danh sách ý tưởng video
+            num_scenes: số lượng cảnh mỗi kịch bản
+            style: phong cách video
+            include_dialogue: có bao gồm lời thoại nhân vật không
+            script_length: độ dài kịch bản
+            
+        Returns:
+            List[List[Dict]]: Danh sách cảnh cho từng prompt, theo đúng thứ tự prompts
         """
+        if self.provider != "openai":
+            return [self.generate_script(prompt, num_scenes, style, include_dialogue, script_length)
+                    for prompt in prompts]
+        
+        cache_params = self._cache_params(num_scenes, style, include_dialogue, script_length)
+        unique_results = {prompt: self._cache_lookup(prompt, cache_params) for prompt in prompts}
+        pending = [prompt for prompt, scenes in unique_results.items() if scenes is None]
+        
+        batch_size = max(1, int(api_manager.get_provider_config("openai").get("batch_size", 10)))
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            batch_results = self._generate_openai_bulk(batch, num_scenes, style, include_dialogue, script_length)
+            for prompt, scenes in zip(batch, batch_results):
+                self._cache_store(prompt, cache_params, scenes)
+                unique_results[prompt] = scenes
+        return self._scatter_results(prompts, unique_results)
+    
+    def _generate_openai_bulk(self, prompts: List[str], num_scenes: int, style: str,
+                              include_dialogue: bool = True, script_length: str = "medium") -> List[List[Dict]]:
+        """Một request OpenAI cho cả batch prompts"""
+        if len(prompts) == 1:
+            return [self._generate_openai_script(prompts[0], num_scenes, style, include_dialogue, script_length)]
+        
+        # Cùng system prompt với request đơn, user message liệt kê các ý tưởng đánh số thay cho prompt=
+        ideas = "\n".join(f'{idx}. "{prompt}"' for idx, prompt in enumerate(prompts))
+        template = _BULK_USER_TEMPLATES[self._template_key(include_dialogue, script_length)]
+        request = self._openai_request(template.format(ideas=ideas, num_scenes=num_scenes, style=style))
+        # Output của cả batch dài gấp nhiều lần một kịch bản
+        request["max_tokens"] = min(request["max_tokens"] * len(prompts), self.BULK_MAX_TOKENS)
+        request["response_format"] = {"type": "json_object"}
         
+        packs = {}
         try:
+            response = self.openai_client.chat.completions.create(**request)
+            self._log_usage(response.usage)
+            content = response.choices[0].message.content.strip()
+            logger.info(f"Generated bulk script content for {len(prompts)} prompts: {content[:200]}...")
+            
+            for pack in _json_loads(content).get("packs", []):
+                idx = pack.get("idx")
+                if isinstance(idx, int) and 0 <= idx < len(prompts) and isinstance(pack.get("scenes"), list):
+                    packs[idx] = self._validate_scenes(pack["scenes"])
+                    
+        except Exception as e:
+            logger.error(f"Error generating OpenAI bulk script: {e}")
+        
+        missing = len(prompts) - len(packs)
+        if missing:
+            logger.warning(f"Bulk response missing {missing}/{len(prompts)} packs, using fallback scenes")
+        return [packs[idx] if idx in packs else self._create_fallback_scenes(prompt, num_scenes)
+                for idx, prompt in enumerate(prompts)]
+    
+    @property
+    def openai_client(self):
+        """OpenAI client dùng chung cho mọi request sync (connection pool httpx của SDK giữ kết nối TLS)"""
+        if self._openai_client is None:
             from openai import OpenAI
-            client = OpenAI(api_key=self.api_key)
-            
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_tokens=max_tokens
+            self._openai_client = OpenAI(api_key=self.api_key)
+        return self._openai_client
+    
+    def _get_gemini_model(self):
+        """GenerativeModel Gemini tạo một lần cho instance"""
+        if self._gemini_model is None:
+            import google.generativeai as genai
+            
+            # Cấu hình Gemini
+            genai.configure(api_key=self.api_key)
+            # JSON mode: Gemini trả về JSON thuần, không bọc markdown
+            self._gemini_model = genai.GenerativeModel(
+                'gemini-2.5-flash',
+                system_instruction=self.SYSTEM_PROMPT_V1,
+                generation_config={"response_mime_type": "application/json"}
+            )
+        return self._gemini_model
+    
+    def _get_async_openai_client(self):
+        """AsyncOpenAI dùng chung trong cùng event loop (connection pool httpx gắn với loop)"""
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            from openai import AsyncOpenAI
+            config = api_manager.get_provider_config("openai")
+            self._aclient = AsyncOpenAI(api_key=self.api_key)
+            self._rate_limiter = get_rate_limiter(
+                "openai",
+                rpm=config.get("rpm", 500),
+                tpm=config.get("tpm", 200000),
+                max_concurrent=config.get("max_concurrent", 10)
             )
+            self._aclient_loop = loop
+        return self._aclient
+    
+    async def _agenerate_openai_script(self, prompt: str, num_scenes: int, style: str, include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
+        """Tạo script bằng OpenAI (async, không chiếm thread trong lúc chờ API)"""
+        request = self._openai_request(self._user_message(prompt, num_scenes, style, include_dialogue, script_length))
+        est_tokens = sum(approx_tokens(m["content"]) for m in request["messages"]) + request["max_tokens"]
+        
+        try:
+            client = self._get_async_openai_client()
+            # Chờ đủ hạn mức RPM/TPM trước khi gửi thay vì ăn 429 rồi backoff
+            async with self._rate_limiter.acquire(est_tokens):
+                response = await client.chat.completions.create(**request)
+            self._log_usage(response.usage)
             
             content = response.choices[0].message.content.strip()
             logger.info(f"Generated script content: {content[:200]}...")
@@ -131,6 +510,170 @@ class ScriptGenerator:
             logger.error(f"Error generating OpenAI script: {e}")
             return self._create_fallback_scenes(prompt, num_scenes)
     
+    async def agenerate_script(self, prompt: str, num_scenes: int = 3, style: str = "cinematic",
+                               include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
+        """
+        Tạo kịch bản từ prompt tổng (async)
+        
+        OpenAI dùng AsyncOpenAI; các provider khác chạy bản sync trong thread pool
+        để nhiều kịch bản có thể chờ API cùng lúc.
+        
+        Args:
+            prompt: ý tưởng video tổng
+            num_scenes: số lượng cảnh muốn tạo
+            style: phong cách video
+            include_dialogue: có bao gồm lời thoại nhân vật không
+            script_length: độ dài kịch bản
+            
+        Returns:
+            List[Dict]: Danh sách các cảnh
+        """
+        if self.provider != "openai":
+            return await asyncio.to_thread(self.generate_script, prompt, num_scenes, style, include_dialogue, script_length)
+        
+        cache_params = self._cache_params(num_scenes, style, include_dialogue, script_length)
+        cached = await asyncio.to_thread(self._cache_lookup, prompt, cache_params)
+        if cached is not None:
+            return cached
+        
+        scenes = await self._agenerate_openai_script(prompt, num_scenes, style, include_dialogue, script_length)
+        await asyncio.to_thread(self._cache_store, prompt, cache_params, scenes)
+        return scenes
+    
+    async def stream_scenes(self, prompt: str, num_scenes: int = 3, style: str = "cinematic",
+                            include_dialogue: bool = True, script_length: str = "medium") -> AsyncIterator[Dict]:
+        """
+        Tạo kịch bản và trả về từng cảnh ngay khi model viết xong cảnh đó
+        
+        Với OpenAI, response được stream và parse dần nên pipeline ảnh có thể bắt đầu
+        từ cảnh đầu tiên trong lúc các cảnh sau vẫn đang được tạo. Provider khác trả
+        về các cảnh sau khi có toàn bộ kịch bản.
+        
+        Args:
+            prompt: ý tưởng video tổng
+            num_scenes: số lượng cảnh muốn tạo
+            style: phong cách video
+            include_dialogue: có bao gồm lời thoại nhân vật không
+            script_length: độ dài kịch bản
+            
+        Yields:
+            Dict: Từng cảnh theo thứ tự
+        """
+        if self.provider != "openai":
+            for scene in await self.agenerate_script(prompt, num_scenes, style, include_dialogue, script_length):
+                yield scene
+            return
+        
+        cache_params = self._cache_params(num_scenes, style, include_dialogue, script_length)
+        cached = await asyncio.to_thread(self._cache_lookup, prompt, cache_params)
+        if cached is not None:
+            for scene in cached:
+                yield scene
+            return
+        
+        request = self._openai_request(self._user_message(prompt, num_scenes, style, include_dialogue, script_length))
+        est_tokens = sum(approx_tokens(m["content"]) for m in request["messages"]) + request["max_tokens"]
+        request["response_format"] = {"type": "json_object"}
+        request["stream"] = True
+        # Chunk cuối (choices rỗng) mang usage của cả request
+        request["stream_options"] = {"include_usage": True}
+        
+        parser = _SceneStreamParser()
+        # None đánh dấu stream đã kết thúc
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def read_stream():
+            # Đọc stream trong task riêng: slot rate limit được trả ngay khi stream xong,
+            # không bị giữ trong lúc consumer xử lý từng cảnh
+            try:
+                client = self._get_async_openai_client()
+                async with self._rate_limiter.acquire(est_tokens):
+                    stream = await client.chat.completions.create(**request)
+                    async for chunk in stream:
+                        if chunk.usage is not None:
+                            self._log_usage(chunk.usage)
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        for scene in self._validate_scenes(parser.feed(delta)):
+                            queue.put_nowait(scene)
+            finally:
+                queue.put_nowait(None)
+        
+        reader = asyncio.create_task(read_stream())
+        scenes = []
+        completed = False
+        try:
+            while True:
+                scene = await queue.get()
+                if scene is None:
+                    break
+                scenes.append(scene)
+                yield scene
+            await reader
+            completed = True
+        except Exception as e:
+            logger.error(f"Error streaming OpenAI script: {e}")
+        finally:
+            # Consumer dừng sớm: đóng stream và trả slot
+            reader.cancel()
+        
+        if scenes:
+            # Stream đứt giữa chừng: giữ các cảnh đã trả về nhưng không cache kịch bản thiếu
+            if completed:
+                logger.info(f"Successfully streamed {len(scenes)} scenes")
+                await asyncio.to_thread(self._cache_store, prompt, cache_params, scenes)
+            return
+        
+        for scene in self._create_fallback_scenes(prompt, num_scenes):
+            yield scene
+    
+    async def agenerate_many(self, prompts: List[str], num_scenes: int = 3, style: str = "cinematic",
+                             include_dialogue: bool = True, script_length: str = "medium",
+                             max_concurrency: int = 5) -> List[Union[List[Dict], BaseException]]:
+        """
+        Tạo kịch bản cho nhiều prompt song song (giới hạn số request đồng thời)
+        
+        Prompt trùng nhau chỉ gọi API một lần; mỗi vị trí trùng nhận một bản sao kết quả.
+        
+        Args:
+            prompts: Danh sách ý tưởng video
+            num_scenes: số lượng cảnh mỗi kịch bản
+            style: phong cách video
+            include_dialogue: có bao gồm lời thoại nhân vật không
+            script_length: độ dài kịch bản
+            max_concurrency: Số request tạo kịch bản đồng thời tối đa
+            
+        Returns:
+            List: Danh sách cảnh hoặc exception cho từng prompt, theo đúng thứ tự prompts
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def generate_one(prompt: str) -> List[Dict]:
+            async with semaphore:
+                return await self.agenerate_script(prompt, num_scenes, style, include_dialogue, script_length)
+        
+        # Các tham số khác dùng chung cho cả batch nên prompt chính là key của request
+        unique_prompts = list(dict.fromkeys(prompts))
+        unique_results = dict(zip(unique_prompts, await asyncio.gather(
+            *(generate_one(prompt) for prompt in unique_prompts),
+            return_exceptions=True
+        )))
+        return self._scatter_results(prompts, unique_results)
+    
+    @staticmethod
+    def _scatter_results(prompts: List[str], unique_results: Dict[str, Any]) -> List[Any]:
+        """Trả kết quả theo thứ tự prompts; lần trùng sau nhận bản sao để caller sửa scenes độc lập"""
+        results = []
+        seen = set()
+        for prompt in prompts:
+            result = unique_results[prompt]
+            if prompt in seen and isinstance(result, list):
+                result = copy.deepcopy(result)
+            seen.add(prompt)
+            results.append(result)
+        return results
+    
     def _generate_anthropic_script(self, prompt: str, num_scenes: int, style: str, include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
         """Tạo script bằng Anthropic Claude (tương lai)"""
         logger.warning("Anthropic provider not implemented yet, using fallback")
@@ -139,79 +682,15 @@ class ScriptGenerator:
     def _generate_google_script(self, prompt: str, num_scenes: int, style: str, include_dialogue: bool = True, script_length: str = "medium") -> List[Dict]:
         """Tạo script bằng Google Gemini"""
         try:
-            import google.generativeai as genai
+            model = self._get_gemini_model()
             
-            # Cấu hình Gemini
-            genai.configure(api_key=self.api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            
-            system_prompt = """You are a professional movie script writer and storyboard artist. 
-            Your task is to create engaging, cinematic scenes that tell a compelling story.
-            Always respond with valid JSON format only, no additional text."""
-            
-            dialogue_instruction = ""
-            if include_dialogue:
-                dialogue_instruction = """
-            - dialogue: If there are characters speaking, include dialogue with character names and their lines. If it's narration, include narrator text.
-            - dialogue_type: Type of dialogue ("character" for character dialogue, "narration" for storytelling, "none" for no dialogue)
-            """
-            
-            # Tạo prompt dựa trên độ dài kịch bản
-            length_instructions = {
-                "short": "Keep descriptions brief and concise (1 sentence each).",
-                "medium": "Provide moderate detail in descriptions (1-2 sentences each).",
-                "long": "Include detailed descriptions (2-3 sentences each) with rich imagery.",
-                "very_long": "Create very detailed, immersive descriptions (3-4 sentences each) with extensive visual details.",
-                "ultra_long": "Create extremely detailed, immersive descriptions (4-6 sentences each) with extensive visual details, character development, and storytelling elements. Each scene should be rich enough for 2 minutes of content."
-            }
-            
-            length_instruction = length_instructions.get(script_length, length_instructions["medium"])
-            
-            user_prompt = f"""
-            Create {num_scenes} cinematic scenes from this idea: "{prompt}".
-            
-            Style: {style}
-            Script Length: {script_length} - {length_instruction}
-            
-            For each scene, provide:
-            - title: A brief, engaging title for the scene
-            - description: {length_instruction}
-            - image_prompt: A detailed prompt for generating a realistic, cinematic image that captures the scene's mood and key elements
-            - duration: Suggested duration in seconds ({'120 seconds (2 minutes)' if script_length == 'ultra_long' else '2-5 seconds'})
-            - transition: Type of transition to next scene (fade, cut, zoom, pan){dialogue_instruction}
-            
-            Make the scenes flow naturally and tell a cohesive story.
-            Focus on visual storytelling with strong imagery.
-            {f"Include character dialogue when appropriate, with clear character names and emotional context." if include_dialogue else ""}
-            {f"Each scene should be detailed enough to support 2 minutes of content with rich storytelling, character development, and visual elements." if script_length == 'ultra_long' else ""}
-            
-            Output JSON format:
-            {{
-                "scenes": [
-                    {{
-                        "title": "Scene Title",
-                        "description": "What happens in this scene",
-                        "image_prompt": "Detailed prompt for image generation",
-                        "duration": 3,
-                        "transition": "fade"{f',\n                        "dialogue": "Character dialogue or narration text",\n                        "dialogue_type": "character|narration|none"' if include_dialogue else ""}
-                    }}
-                ]
-            }}
-            """
+            user_prompt = self._user_message(prompt, num_scenes, style, include_dialogue, script_length)
             
             # Tạo response
             response = model.generate_content(user_prompt)
-            content = response.text.strip()
-            
-            # Xử lý markdown code block nếu có
-            if content.startswith('```json'):
-                content = content[7:]  # Remove ```json
-            if content.startswith('```'):
-                content = content[3:]   # Remove ```
-            if content.endswith('```'):
-                content = content[:-3]  # Remove trailing ```
             
-            content = content.strip()
+            # Phòng khi model/SDK cũ bỏ qua JSON mode và vẫn bọc markdown code block
+            content = _JSON_FENCE_RE.match(response.text).group(1)
             
             logger.info(f"Generated Gemini script content: {content[:200]}...")
             
@@ -228,23 +707,19 @@ class ScriptGenerator:
     
     def _parse_script_response(self, content: str, prompt: str, num_scenes: int) -> List[Dict]:
         """Parse response từ API"""
+        if _script_decoder is not None:
+            try:
+                # Bổ sung field/default giống hệt nhánh json bên dưới: kết quả không phụ thuộc msgspec
+                scenes = self._validate_scenes(_script_decoder.decode(content).scenes)
+                logger.info(f"Successfully generated {len(scenes)} scenes")
+                return scenes
+            except msgspec.DecodeError:
+                # JSON lỗi/sai cấu trúc: xử lý lại bằng nhánh json bên dưới
+                pass
+        
         try:
-            data = json.loads(content)
-            scenes = data.get("scenes", [])
-            
-            # Validate scenes
-            for i, scene in enumerate(scenes):
-                required_fields = ["title", "description", "image_prompt"]
-                for field in required_fields:
-                    if field not in scene:
-                        logger.warning(f"Scene {i} missing required field: {field}")
-                        scene[field] = f"Missing {field}"
-                
-                # Set defaults
-                scene.setdefault("duration", 3)
-                scene.setdefault("transition", "fade")
-                scene.setdefault("dialogue", "")
-                scene.setdefault("dialogue_type", "none")
+            data = _json_loads(content)
+            scenes = self._validate_scenes(data.get("scenes", []))
             
             logger.info(f"Successfully generated {len(scenes)} scenes")
             return scenes
@@ -254,24 +729,43 @@ class ScriptGenerator:
             logger.error(f"Raw response: {content}")
             return self._create_fallback_scenes(prompt, num_scenes)
     
+    @staticmethod
+    def _validate_scenes(scenes: List[Dict]) -> List[Dict]:
+        """Bổ sung field bắt buộc và giá trị mặc định cho từng scene"""
+        for i, scene in enumerate(scenes):
+            required_fields = ["title", "description", "image_prompt"]
+            for field in required_fields:
+                if field not in scene:
+                    logger.warning(f"Scene {i} missing required field: {field}")
+                    scene[field] = f"Missing {field}"
+            
+            # Set defaults
+            scene.setdefault("duration", 3)
+            scene.setdefault("transition", "fade")
+            scene.setdefault("dialogue", "")
+            scene.setdefault("dialogue_type", "none")
+        
+        return scenes
+    
     def _create_fallback_scenes(self, prompt: str, num_scenes: int) -> List[Dict]:
         """
         Tạo scenes dự phòng khi API thất bại
         """
         logger.info("Creating fallback scenes")
-        scenes = []
+        # description/image_prompt giống nhau ở mọi cảnh nên chỉ format một lần
+        description = f"A scene related to: {prompt}"
+        image_prompt = f"Cinematic scene related to {prompt}, professional photography, high quality"
         
-        for i in range(num_scenes):
-            scene = {
+        return _FallbackScenes(
+            {
                 "title": f"Scene {i+1}",
-                "description": f"A scene related to: {prompt}",
-                "image_prompt": f"Cinematic scene related to {prompt}, professional photography, high quality",
+                "description": description,
+                "image_prompt": image_prompt,
                 "duration": 3,
                 "transition": "fade"
             }
-            scenes.append(scene)
-        
-        return scenes
+            for i in range(num_scenes)
+        )
     
     def save_script(self, scenes: List[Dict], filename: str = None, save_directory: str = None) -> str:
         """
@@ -285,28 +779,25 @@ class ScriptGenerator:
         Returns:
             str: Đường dẫn file đã lưu
         """
+        # Một mốc thời gian cho cả tên file và metadata
+        now = datetime.datetime.now()
         if not filename:
-            import datetime
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"script_{timestamp}.json"
+            filename = f"script_{now.strftime('%Y%m%d_%H%M%S')}.json"
         
         # Xác định thư mục lưu
-        if save_directory:
-            os.makedirs(save_directory, exist_ok=True)
-            filepath = os.path.join(save_directory, filename)
-        else:
-            # Đảm bảo thư mục outputs/scripts tồn tại
-            os.makedirs("outputs/scripts", exist_ok=True)
-            filepath = os.path.join("outputs/scripts", filename)
+        save_directory = save_directory or _SCRIPTS_DIR
+        # Tạo lại mỗi lần lưu: thư mục có thể đã bị xóa trong lúc app đang chạy
+        os.makedirs(save_directory, exist_ok=True)
+        filepath = os.path.join(save_directory, filename)
         
         script_data = {
-            "generated_at": datetime.datetime.now().isoformat(),
+            "generated_at": now.isoformat(),
             "total_scenes": len(scenes),
             "scenes": scenes
         }
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(script_data, f, indent=2, ensure_ascii=False)
+        with open(filepath, 'wb') as f:
+            f.write(_json_dumps(script_data, indent=True))
         
         logger.info(f"Script saved to: {filepath}")
         return filepath
@@ -327,44 +818,34 @@ class ScriptGenerator:
         Returns:
             str: Đường dẫn file đã lưu
         """
+        # Một mốc thời gian cho cả tên file và metadata
+        now = datetime.datetime.now()
         if not filename:
-            import datetime
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"script_{timestamp}.txt"
+            filename = f"script_{now.strftime('%Y%m%d_%H%M%S')}.txt"
         
         # Xác định thư mục lưu
-        if save_directory:
-            os.makedirs(save_directory, exist_ok=True)
-            filepath = os.path.join(save_directory, filename)
-        else:
-            # Đảm bảo thư mục outputs/scripts tồn tại
-            os.makedirs("outputs/scripts", exist_ok=True)
-            filepath = os.path.join("outputs/scripts", filename)
-        
-        # Tạo nội dung text
-        content_lines = []
-        
-        if include_metadata:
-            content_lines.extend([
-                "=" * 60,
-                "KỊCH BẢN VIDEO AI",
-                "=" * 60,
-                f"Ngày tạo: {datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
-                f"Tổng số cảnh: {len(scenes)}",
-                f"Tổng thời lượng: {sum(scene.get('duration', 3) for scene in scenes)} giây",
-                "",
-                ""
-            ])
-        
-        # Thêm từng cảnh
+        save_directory = save_directory or _SCRIPTS_DIR
+        # Tạo lại mỗi lần lưu: thư mục có thể đã bị xóa trong lúc app đang chạy
+        os.makedirs(save_directory, exist_ok=True)
+        filepath = os.path.join(save_directory, filename)
+        
+        # Một vòng qua scenes: ghi nội dung từng cảnh vào buffer và cộng dồn thống kê cho metadata
+        body = io.StringIO()
+        w = body.write
+        total_duration = 0
+        transitions = Counter()
+        
         for i, scene in enumerate(scenes, 1):
-            content_lines.extend([
-                f"🎬 CẢNH {i}: {scene.get('title', f'Scene {i}')}",
-                "-" * 50,
-                f"📝 Mô tả: {scene.get('description', 'Không có mô tả')}",
-                f"⏱️  Thời lượng: {scene.get('duration', 3)} giây",
-                f"🔄 Chuyển cảnh: {scene.get('transition', 'fade')}",
-            ])
+            duration = scene.get('duration', 3)
+            transition = scene.get('transition', 'fade')
+            total_duration += duration
+            transitions[transition] += 1
+            
+            w(f"🎬 CẢNH {i}: {scene.get('title', f'Scene {i}')}\n"
+              f"{'-' * 50}\n"
+              f"📝 Mô tả: {scene.get('description', 'Không có mô tả')}\n"
+              f"⏱️  Thời lượng: {duration} giây\n"
+              f"🔄 Chuyển cảnh: {transition}\n")
             
             # Thêm dialogue nếu có
             dialogue = scene.get('dialogue', '')
@@ -372,59 +853,54 @@ class ScriptGenerator:
             
             if dialogue and dialogue_type != 'none':
                 if dialogue_type == 'character':
-                    content_lines.extend([
-                        f"💬 Lời thoại nhân vật:",
-                        f"   {dialogue}",
-                    ])
+                    w(f"💬 Lời thoại nhân vật:\n   {dialogue}\n")
                 elif dialogue_type == 'narration':
-                    content_lines.extend([
-                        f"📖 Lời kể chuyện:",
-                        f"   {dialogue}",
-                    ])
+                    w(f"📖 Lời kể chuyện:\n   {dialogue}\n")
             
             if include_prompts:
-                content_lines.extend([
-                    f"🎨 Prompt ảnh:",
-                    f"   {scene.get('image_prompt', 'Không có prompt')}",
-                ])
-            
-            content_lines.extend(["", ""])
-        
-        # Thêm thông tin tổng kết
-        if include_metadata:
-            content_lines.extend([
-                "=" * 60,
-                "THÔNG TIN TỔNG KẾT",
-                "=" * 60,
-                f"📊 Tổng số cảnh: {len(scenes)}",
-                f"⏱️  Tổng thời lượng: {sum(scene.get('duration', 3) for scene in scenes)} giây",
-                f"📈 Thời lượng trung bình: {sum(scene.get('duration', 3) for scene in scenes) / len(scenes):.1f} giây/cảnh",
-                "",
-                "🎯 Các loại chuyển cảnh sử dụng:",
-            ])
-            
-            # Thống kê transitions
-            transitions = {}
-            for scene in scenes:
-                transition = scene.get('transition', 'fade')
-                transitions[transition] = transitions.get(transition, 0) + 1
-            
-            for transition, count in transitions.items():
-                content_lines.append(f"   - {transition}: {count} cảnh")
-            
-            content_lines.extend([
-                "",
-                "📝 Ghi chú:",
-                "- Kịch bản này được tạo tự động bởi AI Video Generator",
-                "- Có thể chỉnh sửa thời lượng và chuyển cảnh theo ý muốn",
-                "- Image prompts có thể được sử dụng để tạo ảnh cho từng cảnh",
-                "",
-                "=" * 60
-            ])
-        
-        # Ghi file
+                w(f"🎨 Prompt ảnh:\n   {scene.get('image_prompt', 'Không có prompt')}\n")
+            
+            w("\n\n")
+        
+        # Ghi file: header/tổng kết (nếu có) quanh nội dung các cảnh, không ghép thêm chuỗi trung gian
         with open(filepath, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(content_lines))
+            if include_metadata:
+                f.write(
+                    f"{'=' * 60}\n"
+                    "KỊCH BẢN VIDEO AI\n"
+                    f"{'=' * 60}\n"
+                    f"Ngày tạo: {now.strftime('%d/%m/%Y %H:%M:%S')}\n"
+                    f"Tổng số cảnh: {len(scenes)}\n"
+                    f"Tổng thời lượng: {total_duration} giây\n"
+                    "\n\n"
+                )
+            
+            f.write(body.getvalue())
+            
+            # Thêm thông tin tổng kết
+            if include_metadata:
+                average_duration = total_duration / len(scenes) if scenes else 0
+                f.write(
+                    f"{'=' * 60}\n"
+                    "THÔNG TIN TỔNG KẾT\n"
+                    f"{'=' * 60}\n"
+                    f"📊 Tổng số cảnh: {len(scenes)}\n"
+                    f"⏱️  Tổng thời lượng: {total_duration} giây\n"
+                    f"📈 Thời lượng trung bình: {average_duration:.1f} giây/cảnh\n"
+                    "\n"
+                    "🎯 Các loại chuyển cảnh sử dụng:\n"
+                )
+                # Dùng nhiều nhất trước, cùng số lần thì theo thứ tự xuất hiện
+                f.write("".join(f"   - {transition}: {count} cảnh\n" for transition, count in transitions.most_common()))
+                f.write(
+                    "\n"
+                    "📝 Ghi chú:\n"
+                    "- Kịch bản này được tạo tự động bởi AI Video Generator\n"
+                    "- Có thể chỉnh sửa thời lượng và chuyển cảnh theo ý muốn\n"
+                    "- Image prompts có thể được sử dụng để tạo ảnh cho từng cảnh\n"
+                    "\n"
+                    f"{'=' * 60}\n"
+                )
         
         logger.info(f"Script saved as text to: {filepath}")
         return filepath
@@ -440,8 +916,8 @@ class ScriptGenerator:
             List[Dict]: Danh sách các cảnh
         """
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(filepath, 'rb') as f:
+                data = _json_loads(f.read())
             
             scenes = data.get("scenes", [])
             logger.info(f"Loaded {len(scenes)} scenes from {filepath}")
@@ -450,6 +926,21 @@ class ScriptGenerator:
         except Exception as e:
             logger.error(f"Error loading script: {e}")
             return []
+    
+    async def asave_script(self, scenes: List[Dict], filename: str = None, save_directory: str = None) -> str:
+        """save_script chạy trong thread pool để không chặn event loop khi pipeline async đang chờ API"""
+        return await asyncio.to_thread(self.save_script, scenes, filename, save_directory)
+    
+    async def asave_script_as_text(self, scenes: List[Dict], filename: str = None,
+                                   include_prompts: bool = True, include_metadata: bool = True,
+                                   save_directory: str = None) -> str:
+        """save_script_as_text chạy trong thread pool"""
+        return await asyncio.to_thread(self.save_script_as_text, scenes, filename,
+                                       include_prompts, include_metadata, save_directory)
+    
+    async def aload_script(self, filepath: str) -> List[Dict]:
+        """load_script chạy trong thread pool"""
+        return await asyncio.to_thread(self.load_script, filepath)
 
 
 # Hàm tiện ích để sử dụng trực tiếp
@@ -472,6 +963,15 @@ def generate_script(prompt: str, num_scenes: int = 3, style: str = "cinematic",
     return generator.generate_script(prompt, num_scenes, style)
 
 
+# Lời dẫn theo phong cách; style khác dùng "<title>. <description>"
+_NARRATOR_TMPL = {
+    "cinematic": "Trong cảnh này, {d}",
+    "documentary": "Chúng ta thấy {d}",
+    "educational": "Hãy quan sát {d}",
+    "storytelling": "Và rồi, {d}",
+}
+
+
 def add_narrator_to_scenes(scenes: List[Dict], narrator_style: str = "cinematic") -> List[Dict]:
     """
     Thêm lời dẫn chuyện vào các scene
@@ -486,21 +986,17 @@ def add_narrator_to_scenes(scenes: List[Dict], narrator_style: str = "cinematic"
     try:
         logger.info(f"Adding narrator to {len(scenes)} scenes with style: {narrator_style}")
         
+        # Chọn template một lần cho cả danh sách thay vì duyệt chuỗi if/elif ở mỗi scene
+        template = _NARRATOR_TMPL.get(narrator_style)
+        
         for i, scene in enumerate(scenes):
-            title = scene.get('title', f'Scene {i+1}')
             description = scene.get('description', '')
             
             # Tạo narrator text dựa trên style
-            if narrator_style == "cinematic":
-                narrator_text = f"Trong cảnh này, {description.lower()}"
-            elif narrator_style == "documentary":
-                narrator_text = f"Chúng ta thấy {description.lower()}"
-            elif narrator_style == "educational":
-                narrator_text = f"Hãy quan sát {description.lower()}"
-            elif narrator_style == "storytelling":
-                narrator_text = f"Và rồi, {description.lower()}"
+            if template:
+                narrator_text = template.format(d=description.lower())
             else:
-                narrator_text = f"{title}. {description}"
+                narrator_text = f"{scene.get('title', f'Scene {i+1}')}. {description}"
             
             # Thêm narrator vào scene
             scene['narrator'] = narrator_text